@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+
+METRIC_COLUMNS = [
+    'total_return', 'cagr', 'annual_return', 'volatility', 'sharpe_ratio', 'sortino_ratio',
+    'calmar_ratio', 'max_drawdown', 'max_drawdown_duration', 'turnover', 'win_rate', 'alpha', 'beta'
+]
+
+_EPS = 1e-12  # 小于该值的波动、回撤视为浮点误差
+
+def _as_2d(values):
+    """
+    统一输入为 (时间, 曲线) 的float64矩阵
+    :return: (矩阵, 时间索引或None, 曲线名称列表)
+    """
+    if isinstance(values, pd.DataFrame):
+        return values.to_numpy(dtype=np.float64), values.index, list(values.columns)
+    if isinstance(values, pd.Series):
+        return values.to_numpy(dtype=np.float64)[:, None], values.index, [values.name if values.name is not None else 0]
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values, None, list(range(values.shape[1]))
+
+def _align_benchmark(benchmark, index, length):
+    """
+    基准对齐到净值曲线的时间轴（按日期对齐并前向填充），返回一维数组
+    :param benchmark: 基准价格（Series、DataFrame的close列或数组）
+    """
+    if isinstance(benchmark, pd.DataFrame):
+        benchmark = benchmark['close']
+    if isinstance(benchmark, pd.Series) and index is not None:
+        benchmark = benchmark.sort_index().reindex(index, method='ffill').bfill()
+    benchmark = np.asarray(benchmark, dtype=np.float64).ravel()
+    if len(benchmark) != length:
+        raise ValueError(f"基准长度 {len(benchmark)} 与净值曲线长度 {length} 不一致")
+    return benchmark
+
+def _simple_returns(values):
+    """
+    逐期收益率，第一期为NaN，形状与输入相同
+    """
+    returns = np.full(values.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = values[1:] / values[:-1] - 1
+    return returns
+
+def drawdown_stats(equity):
+    """
+    最大回撤和最长回撤持续期（向量化，按列计算）
+    :param equity: (时间, 曲线) 净值矩阵
+    :return: (drawdown, max_drawdown, max_duration)，drawdown为每期回撤矩阵（非正数），
+             max_duration为从前高到收复前高（或至今）的最长期数
+    """
+    peak = np.maximum.accumulate(equity, axis=0)
+    drawdown = equity / peak - 1
+    index = np.arange(equity.shape[0])[:, None]
+    last_peak = np.maximum.accumulate(np.where(drawdown >= -_EPS, index, 0), axis=0)
+    return drawdown, drawdown.min(axis=0), (index - last_peak).max(axis=0)
+
+def compute_metrics(equity, benchmark=None, weights=None, periods_per_year=252, risk_free_rate=0.0):
+    """
+    一次计算一条或多条净值曲线的表现指标（所有曲线同时向量化计算）
+    :param equity: 净值曲线，(时间, 曲线) 矩阵 / DataFrame（每列一条曲线）/ Series
+                   参数扫描结果可先整理为二维，如 VectorBacktester 的 total 用 total.transpose(1, 0, 2).reshape(T, -1)
+    :param benchmark: 基准价格（如 get_index_data 返回的DataFrame或其close列），None表示不计算alpha、beta
+    :param weights: 持仓权重（持仓市值/总资产），形状与equity相同，None表示不计算换手率
+    :param periods_per_year: 每年的期数
+    :param risk_free_rate: 年化无风险利率
+    :return: DataFrame 每行一条曲线，列见 METRIC_COLUMNS
+        - cagr：复合年化收益率；annual_return：平均收益率×期数
+        - max_drawdown：最大回撤（负数）；max_drawdown_duration：最长回撤期数
+        - turnover：年化换手率（权重变化绝对值之和）
+        - win_rate：收益为正的期数占有涨跌期数的比例
+        - alpha：年化超额收益（CAPM）
+    """
+    values, index, columns = _as_2d(equity)
+    n_periods = values.shape[0]
+    rf = risk_free_rate / periods_per_year
+
+    returns = _simple_returns(values)[1:]
+    excess = returns - rf
+    mean = returns.mean(axis=0)
+    excess_mean = excess.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = returns.std(axis=0, ddof=1)
+        downside = np.sqrt((np.minimum(excess, 0.0) ** 2).mean(axis=0))
+        growth = values[-1] / values[0]
+        years = (n_periods - 1) / periods_per_year
+        cagr = np.sign(growth) * np.abs(growth) ** (1 / years) - 1 if years > 0 else np.full(len(columns), np.nan)
+        _, max_drawdown, duration = drawdown_stats(values)
+
+        metrics = {
+            'total_return': growth - 1,
+            'cagr': cagr,
+            'annual_return': mean * periods_per_year,
+            'volatility': std * np.sqrt(periods_per_year),
+            'sharpe_ratio': np.where(std > _EPS, excess_mean / std * np.sqrt(periods_per_year), np.nan),
+            'sortino_ratio': np.where(downside > _EPS, excess_mean / downside * np.sqrt(periods_per_year), np.nan),
+            'calmar_ratio': np.where(max_drawdown < -_EPS, cagr / np.abs(max_drawdown), np.nan),
+            'max_drawdown': max_drawdown,
+            'max_drawdown_duration': duration,
+            'turnover': np.full(len(columns), np.nan),
+            'win_rate': (returns > _EPS).sum(axis=0) / np.maximum((np.abs(returns) > _EPS).sum(axis=0), 1),
+            'alpha': np.full(len(columns), np.nan),
+            'beta': np.full(len(columns), np.nan)
+        }
+
+        if weights is not None:
+            weight_values = _as_2d(weights)[0]
+            metrics['turnover'] = np.abs(np.diff(weight_values, axis=0)).mean(axis=0) * periods_per_year
+
+        if benchmark is not None:
+            bench_excess = _simple_returns(_align_benchmark(benchmark, index, n_periods)[:, None])[1:] - rf
+            bench_centered = bench_excess - bench_excess.mean(axis=0)
+            beta = (bench_centered * (excess - excess_mean)).sum(axis=0) / (bench_centered ** 2).sum(axis=0)
+            metrics['beta'] = beta
+            metrics['alpha'] = (excess_mean - beta * bench_excess.mean(axis=0)) * periods_per_year
+
+    return pd.DataFrame(metrics, index=columns)[METRIC_COLUMNS]
+
+def _window_sum(values, window):
+    """
+    沿时间轴的滚动求和（累加和相减），前 window-1 行为NaN
+    """
+    csum = np.cumsum(values, axis=0)
+    out = np.full(values.shape, np.nan)
+    out[window - 1] = csum[window - 1]
+    out[window:] = csum[window:] - csum[:-window]
+    return out
+
+def _rolling_drawdown(values, window, max_elements=4_000_000):
+    """
+    每个窗口内的最大回撤和最长回撤期数（分块处理滑动窗口，限制内存占用）
+    :return: (max_drawdown, max_duration)，形状与values相同，前 window-1 行为NaN
+    """
+    n_periods, n_curves = values.shape
+    max_drawdown = np.full(values.shape, np.nan)
+    max_duration = np.full(values.shape, np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)  # (T-w+1, N, w)
+    step = max(1, max_elements // max(1, n_curves * window))
+    position = np.arange(window)
+    for start in range(0, len(windows), step):
+        block = windows[start:start + step]
+        drawdown = block / np.maximum.accumulate(block, axis=-1) - 1
+        last_peak = np.maximum.accumulate(np.where(drawdown >= -_EPS, position, 0), axis=-1)
+        rows = slice(start + window - 1, start + window - 1 + len(block))
+        max_drawdown[rows] = drawdown.min(axis=-1)
+        max_duration[rows] = (position - last_peak).max(axis=-1)
+    return max_drawdown, max_duration
+
+def rolling_metrics(equity, window=63, benchmark=None, weights=None, periods_per_year=252, risk_free_rate=0.0):
+    """
+    滚动窗口指标（每个时点使用最近 window 期的收益率），所有曲线同时计算
+    参数含义与 compute_metrics 相同
+    :param window: 窗口期数
+    :return: dict {指标名: 与equity同形状的DataFrame}，窗口不足的行为NaN
+    """
+    values, index, columns = _as_2d(equity)
+    n_periods = values.shape[0]
+    if window < 2 or window >= n_periods:
+        raise ValueError(f"窗口期数必须在 2 到 {n_periods - 1} 之间")
+    rf = risk_free_rate / periods_per_year
+
+    returns = _simple_returns(values)
+    returns[0] = 0.0
+    excess = returns - rf
+    # 窗口 t 使用第 t-window+1 ~ t 期的收益率，即第 t-window ~ t 期的净值
+    sum_r = _window_sum(returns, window)
+    sum_r2 = _window_sum(returns ** 2, window)
+    sum_down2 = _window_sum(np.minimum(excess, 0.0) ** 2, window)
+    ups = _window_sum((returns > _EPS).astype(np.float64), window)
+    moves = _window_sum((np.abs(returns) > _EPS).astype(np.float64), window)
+    for rolled in (sum_r, sum_r2, sum_down2, ups, moves):
+        rolled[window - 1] = np.nan
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = sum_r / window
+        std = np.sqrt(np.maximum(sum_r2 - window * mean ** 2, 0.0) / (window - 1))
+        excess_mean = mean - rf
+        downside = np.sqrt(sum_down2 / window)
+        growth = np.full(values.shape, np.nan)
+        growth[window:] = values[window:] / values[:-window]
+        cagr = np.sign(growth) * np.abs(growth) ** (periods_per_year / window) - 1
+        max_drawdown, duration = _rolling_drawdown(values, window + 1)
+
+        metrics = {
+            'total_return': growth - 1,
+            'cagr': cagr,
+            'annual_return': mean * periods_per_year,
+            'volatility': std * np.sqrt(periods_per_year),
+            'sharpe_ratio': np.where(std > _EPS, excess_mean / std * np.sqrt(periods_per_year), np.nan),
+            'sortino_ratio': np.where(downside > _EPS, excess_mean / downside * np.sqrt(periods_per_year), np.nan),
+            'calmar_ratio': np.where(max_drawdown < -_EPS, cagr / np.abs(max_drawdown), np.nan),
+            'max_drawdown': max_drawdown,
+            'max_drawdown_duration': duration,
+            'win_rate': ups / np.maximum(moves, 1)
+        }
+
+        if weights is not None:
+            weight_values = _as_2d(weights)[0]
+            changes = np.zeros(weight_values.shape)
+            changes[1:] = np.abs(np.diff(weight_values, axis=0))
+            turnover = _window_sum(changes, window) / window * periods_per_year
+            turnover[window - 1] = np.nan
+            metrics['turnover'] = turnover
+
+        if benchmark is not None:
+            bench = _simple_returns(_align_benchmark(benchmark, index, n_periods)[:, None])
+            bench[0] = 0.0
+            sum_b = _window_sum(bench, window)
+            sum_b2 = _window_sum(bench ** 2, window)
+            sum_rb = _window_sum(returns * bench, window)
+            cov = sum_rb - sum_r * sum_b / window
+            var = sum_b2 - sum_b ** 2 / window
+            beta = np.where(var > 0, cov / var, np.nan)
+            beta[:window] = np.nan
+            metrics['beta'] = beta
+            metrics['alpha'] = (excess_mean - beta * (sum_b / window - rf)) * periods_per_year
+
+    return {name: pd.DataFrame(data, index=index, columns=columns) for name, data in metrics.items()}
@@ -0,0 +1,359 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from strategy import Strategy
+from indicators import StreamingMA, StreamingMACD, SignalBook
+from realtime_data import RealtimeDataFetcher
+from risk_manager import RiskManager
+from money_manager import MoneyManager
+from analytics import compute_metrics, rolling_metrics
+
+DEFAULT_OUTPUT = 'benchmark_results.json'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+def make_ohlcv(n_days, seed=0, start_price=10.0):
+    """
+    生成模拟日线数据（几何随机游走），列与 DataFetcher.get_stock_data 一致
+    :param n_days: K线数量
+    :param seed: 随机种子，相同种子得到相同数据
+    :return: DataFrame，以日期为索引
+    """
+    rng = np.random.default_rng(seed)
+    close = start_price * np.exp(np.cumsum(rng.normal(0.0003, 0.02, n_days)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n_days))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n_days))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n_days))
+    volume = rng.integers(1_000, 100_000, n_days) * 100.0
+    data = pd.DataFrame({
+        'open': open_.round(2),
+        'close': close.round(2),
+        'high': high.round(2),
+        'low': low.round(2),
+        'volume': volume,
+        'amount': volume * close
+    }, index=pd.bdate_range('2000-01-03', periods=n_days, name='date'))
+    return data
+
+def make_codes(n_stocks):
+    """
+    生成股票代码（沪深主板、创业板、科创板混合）
+    """
+    prefixes = ['600', '000', '300', '688', '601', '002']
+    return [f"{prefixes[i % len(prefixes)]}{i // len(prefixes):03d}" for i in range(n_stocks)]
+
+def make_spot_snapshots(n_stocks, n_snapshots, seed=0, change_ratio=0.3, suspended_ratio=0.01):
+    """
+    生成连续的全市场行情快照，列名与 ak.stock_zh_a_spot_em() 一致
+    每个快照中约 change_ratio 的股票行情发生变化，停牌股票最新价为空
+    :return: list[DataFrame]
+    """
+    rng = np.random.default_rng(seed)
+    codes = make_codes(n_stocks)
+    prev_close = rng.uniform(3.0, 200.0, n_stocks).round(2)
+    price = prev_close.copy()
+    volume = np.zeros(n_stocks)
+    amount = np.zeros(n_stocks)
+    suspended = rng.random(n_stocks) < suspended_ratio
+    snapshots = []
+    for _ in range(n_snapshots):
+        changed = rng.random(n_stocks) < change_ratio
+        moved = np.round(price * np.exp(rng.normal(0, 0.002, n_stocks)), 2)
+        price = np.where(changed, np.clip(moved, np.round(prev_close * 0.9, 2), np.round(prev_close * 1.1, 2)), price)
+        traded = np.where(changed, rng.integers(1, 100, n_stocks) * 100.0, 0.0)
+        volume = volume + traded
+        amount = amount + traded * price
+        last = np.where(suspended, np.nan, price)
+        snapshots.append(pd.DataFrame({
+            '代码': codes,
+            '名称': codes,
+            '最新价': last,
+            '成交量': volume,
+            '成交额': amount,
+            '买一价': last - 0.01,
+            '卖一价': last + 0.01,
+            '买一量': rng.integers(1, 500, n_stocks).astype(np.float64),  # 单位：手
+            '卖一量': rng.integers(1, 500, n_stocks).astype(np.float64),
+            '昨收': prev_close
+        }))
+    return snapshots
+
+def make_portfolio_values(n, seed=0, initial=1_000_000.0):
+    """
+    生成投资组合价值序列
+    """
+    rng = np.random.default_rng(seed)
+    return (initial * np.exp(np.cumsum(rng.normal(0.0002, 0.01, n)))).tolist()
+
+def make_trades(n, n_stocks=50, seed=0):
+    """
+    生成成交序列：每只股票先买后卖，卖出数量不超过持仓
+    :return: list[(stock_code, direction, price, volume, fee, timestamp)]
+    """
+    rng = np.random.default_rng(seed)
+    codes = make_codes(n_stocks)
+    held = dict.fromkeys(codes, 0)
+    start = datetime(2020, 1, 2, 9, 30)
+    trades = []
+    for i in range(n):
+        code = codes[rng.integers(n_stocks)]
+        price = round(float(rng.uniform(5, 50)), 2)
+        if held[code] >= 100 and rng.random() < 0.5:
+            direction, volume = 'sell', int(rng.integers(1, held[code] // 100 + 1)) * 100
+            held[code] -= volume
+        else:
+            direction, volume = 'buy', int(rng.integers(1, 10)) * 100
+            held[code] += volume
+        trades.append((code, direction, price, volume, 5.0, start + timedelta(minutes=i)))
+    return trades
+
+def backtest_cases(sizes):
+    strategy = Strategy()
+    for n in sizes:
+        data = make_ohlcv(n)
+        for strategy_type in ('ma_cross', 'macd'):
+            yield ('backtest', strategy_type, {'rows': n},
+                   lambda data=data, st=strategy_type: (lambda: strategy.backtest(data, st)))
+
+def indicator_cases(sizes):
+    strategy = Strategy()
+    for n in sizes:
+        data = make_ohlcv(n)
+        yield ('indicators', 'calculate_ma', {'rows': n, 'window': 20},
+               lambda data=data: (lambda: strategy.calculate_ma(data, 20)))
+        yield ('indicators', 'calculate_macd', {'rows': n},
+               lambda data=data: (lambda: strategy.calculate_macd(data)))
+        yield ('indicators', 'ma_cross_strategy', {'rows': n},
+               lambda data=data: (lambda: strategy.ma_cross_strategy(data)))
+        yield ('indicators', 'macd_strategy', {'rows': n},
+               lambda data=data: (lambda: strategy.macd_strategy(data)))
+
+        prices = data['close'].tolist()
+
+        def streaming(indicator_class, *args, prices=prices):
+            def make():
+                indicator = indicator_class(*args)
+                return lambda: [indicator.update(p) for p in prices]
+            return make
+        yield ('indicators', 'StreamingMA.update', {'updates': n, 'window': 20}, streaming(StreamingMA, 20))
+        yield ('indicators', 'StreamingMACD.update', {'updates': n}, streaming(StreamingMACD))
+
+    # 实时信号：一批行情逐只股票更新
+    codes = make_codes(300)
+    prices = np.random.default_rng(0).uniform(5, 50, (50, len(codes))).round(2).tolist()
+
+    def signal_book():
+        book = SignalBook('ma_cross')
+        return lambda: [book.update(code, p) for row in prices for code, p in zip(codes, row)]
+    yield ('indicators', 'SignalBook.update', {'stocks': len(codes), 'batches': len(prices)}, signal_book)
+
+def snapshot_cases(sizes, n_snapshots=20):
+    for n_stocks in sizes:
+        snapshots = make_spot_snapshots(n_stocks, n_snapshots)
+        subscribed = make_codes(n_stocks)[::max(1, n_stocks // 300)][:300]
+
+        def make(snapshots=snapshots, subscribed=subscribed):
+            fetcher = RealtimeDataFetcher()
+            fetcher.stock_list = subscribed
+            timestamp = datetime(2024, 1, 2, 10, 0)
+
+            def run():
+                for snapshot in snapshots:
+                    fetcher.process_snapshot(snapshot, timestamp)
+                    fetcher.get_latest_batch()
+            return run
+        yield ('snapshot', 'process_snapshot', {'market': n_stocks, 'subscribed': len(subscribed), 'snapshots': n_snapshots}, make)
+
+def risk_cases(sizes):
+    for n in sizes:
+        values = make_portfolio_values(n)
+
+        def filled(values=values):
+            risk_manager = RiskManager()
+            for value in values:
+                risk_manager.update_portfolio_value(value)
+            return risk_manager.get_risk_metrics
+
+        def updates(values=values):
+            risk_manager = RiskManager()
+            return lambda: [risk_manager.update_portfolio_value(value) for value in values]
+        yield ('risk', 'get_risk_metrics', {'history': n}, filled)
+        yield ('risk', 'update_portfolio_value', {'updates': n}, updates)
+
+def money_cases(sizes):
+    for n in sizes:
+        trades = make_trades(n)
+
+        def filled(trades=trades):
+            money_manager = MoneyManager(initial_capital=1e9)
+            for trade in trades:
+                money_manager.update_position(*trade[:5], timestamp=trade[5])
+            return money_manager
+
+        def updates(trades=trades):
+            money_manager = MoneyManager(initial_capital=1e9)
+            return lambda: [money_manager.update_position(*trade[:5], timestamp=trade[5]) for trade in trades]
+        yield ('money', 'update_position', {'trades': n}, updates)
+        yield ('money', 'get_trade_statistics', {'trades': n}, lambda filled=filled: filled().get_trade_statistics)
+        yield ('money', 'get_performance_metrics', {'trades': n}, lambda filled=filled: filled().get_performance_metrics)
+        yield ('money', 'trade_frame', {'trades': n}, lambda filled=filled: (lambda mm=filled(): mm.trade_frame()))
+
+def analytics_cases(sizes, n_periods=2_500):
+    for n_curves in sizes:
+        rng = np.random.default_rng(0)
+        equity = 1e5 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, (n_periods, n_curves)), axis=0))
+        benchmark = 3000 * np.exp(np.cumsum(rng.normal(0.0002, 0.01, n_periods)))
+        yield ('analytics', 'compute_metrics', {'periods': n_periods, 'curves': n_curves},
+               lambda equity=equity, benchmark=benchmark: (lambda: compute_metrics(equity, benchmark)))
+        yield ('analytics', 'rolling_metrics', {'periods': n_periods, 'curves': n_curves, 'window': 63},
+               lambda equity=equity, benchmark=benchmark: (lambda: rolling_metrics(equity, 63, benchmark)))
+
+SUITES = {
+    'backtest': (backtest_cases, [250, 2_500, 25_000], [250, 2_500]),
+    'indicators': (indicator_cases, [2_500, 25_000], [2_500]),
+    'snapshot': (snapshot_cases, [1_000, 5_500], [1_000]),
+    'risk': (risk_cases, [1_000, 10_000, 100_000], [1_000, 10_000]),
+    'money': (money_cases, [1_000, 10_000], [1_000]),
+    'analytics': (analytics_cases, [10, 200], [10])
+}
+
+def case_key(group, name, params):
+    """
+    结果的唯一键，如 backtest.ma_cross[rows=2500]
+    """
+    return f"{group}.{name}[" + ','.join(f"{k}={v}" for k, v in params.items()) + "]"
+
+def measure(make, repeat=5, number=1):
+    """
+    计时：每轮先调用 make() 准备（不计时），再执行返回的函数 number 次
+    :return: list 每轮的单次耗时（秒）
+    """
+    times = []
+    for _ in range(repeat):
+        run = make()
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+def run_benchmarks(suites=None, quick=False, repeat=5, verbose=True):
+    """
+    运行基准测试
+    :param suites: 要运行的测试组，None表示全部
+    :param quick: 只使用较小的数据规模
+    :param repeat: 每项测试的重复轮数
+    :return: dict 结果 {'meta': ..., 'results': {键: 统计}}
+    """
+    results = {}
+    for suite in suites or SUITES:
+        cases, sizes, quick_sizes = SUITES[suite]
+        for group, name, params, make in cases(quick_sizes if quick else sizes):
+            make()()  # 预热（首次调用的导入、缓存等开销不计入）
+            times = np.array(measure(make, repeat)) * 1e3
+            key = case_key(group, name, params)
+            results[key] = {
+                'group': group,
+                'name': name,
+                'params': params,
+                'repeat': repeat,
+                'min_ms': float(times.min()),
+                'median_ms': float(np.median(times)),
+                'mean_ms': float(times.mean()),
+                'max_ms': float(times.max())
+            }
+            if verbose:
+                print(f"{key:<70} 中位数 {results[key]['median_ms']:10.3f} ms  最小 {results[key]['min_ms']:10.3f} ms")
+    return {'meta': environment_info(quick, repeat), 'results': results}
+
+def environment_info(quick=False, repeat=5):
+    """
+    运行环境信息（比较结果时参考）
+    """
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'quick': quick,
+        'repeat': repeat
+    }
+
+def compare(current, baseline, threshold=0.2):
+    """
+    与基线比较中位数耗时
+    :param current: 本次结果
+    :param baseline: 基线结果
+    :param threshold: 允许的变慢比例，超过视为性能回退
+    :return: list 回退的测试 [(键, 基线ms, 本次ms, 比例)]
+    """
+    regressions = []
+    base_results = baseline.get('results', {})
+    base_meta = baseline.get('meta', {})
+    print(f"\n与基线比较（{base_meta.get('timestamp', '未知时间')}，阈值 +{threshold:.0%}）：")
+    for field in ('platform', 'python', 'numpy', 'pandas'):
+        if base_meta.get(field) != current['meta'].get(field):
+            print(f"注意：运行环境的 {field} 与基线不同（{base_meta.get(field)} / {current['meta'].get(field)}），结果可能不可比")
+    for key, result in current['results'].items():
+        base = base_results.get(key)
+        if base is None:
+            print(f"{key:<70} 基线中没有该项")
+            continue
+        ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] > 0 else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append((key, base['median_ms'], result['median_ms'], ratio))
+            flag = '  <-- 变慢'
+        print(f"{key:<70} {base['median_ms']:10.3f} -> {result['median_ms']:10.3f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线基准测试：回测、指标、行情快照处理、风险和资金统计、绩效分析")
+    parser.add_argument('--suite', action='append', choices=list(SUITES), help="只运行指定的测试组（可重复）")
+    parser.add_argument('--quick', action='store_true', help="只使用较小的数据规模")
+    parser.add_argument('--repeat', type=int, default=5, help="每项测试的重复轮数")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="结果文件（JSON）")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基线文件（JSON）")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--threshold', type=float, default=0.2, help="中位数变慢超过该比例视为回退")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.suite, args.quick, args.repeat)
+    save_results(results, args.output)
+    print(f"\n结果已保存到 {args.output}")
+
+    if args.save_baseline:
+        save_results(results, args.baseline)
+        print(f"基线已保存到 {args.baseline}")
+        return 0
+    try:
+        baseline = load_results(args.baseline)
+    except FileNotFoundError:
+        print(f"没有找到基线文件 {args.baseline}，使用 --save-baseline 生成")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} 项测试性能回退")
+        return 1
+    print("\n没有性能回退")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,58 @@
 import akshare as ak
 import pandas as pd
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import random
+import threading
+import time
+from data_store import BarStore, AdjustFactorStore, apply_adjustment
+
+class RateLimiter:
+    def __init__(self, rate, burst=1):
+        """
+        令牌桶限速器（线程安全）
+        :param rate: 每秒产生的令牌数
+        :param burst: 令牌桶容量
+        """
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.last_time = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """
+        获取一个令牌，令牌不足时阻塞等待
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+                self.last_time = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 class DataFetcher:
-    def __init__(self):
-        self.cache = {}
+    def __init__(self, cache_dir='data_cache', use_cache=True):
+        """
+        初始化数据获取器
+        :param cache_dir: 本地K线缓存目录
+        :param use_cache: 是否启用本地缓存
+        """
+        self.cache = BarStore(cache_dir) if use_cache else None
+        self.factors = AdjustFactorStore(cache_dir) if use_cache else None
     
-    def get_stock_data(self, stock_code, start_date, end_date):
+    def get_stock_data(self, stock_code, start_date, end_date, adjust="qfq"):
         """
-        获取股票历史数据
+        获取股票历史数据（优先读取本地缓存，只从网络补齐缺失的日期区间）
+        缓存只保存不复权数据，复权价格由本地复权因子计算
         :param stock_code: 股票代码（如：000001）
         :param start_date: 开始日期（如：20230101）
         :param end_date: 结束日期（如：20240101）
+        :param adjust: 复权方式（"qfq"、"hfq" 或 "" 不复权）
         :return: DataFrame包含OHLCV数据
         """
         try:
@@ -19,62 +60,12 @@ class DataFetcher:
             print(f"开始日期: {start_date}")
             print(f"结束日期: {end_date}")
             
-            # 获取日线数据
-            df = ak.stock_zh_a_hist(symbol=stock_code, 
-                                  start_date=start_date, 
-                                  end_date=end_date, 
-                                  adjust="qfq")
+            df = self._load_stock_data(stock_code, start_date, end_date, adjust)
             
             if df is None or df.empty:
                 print("获取数据失败：返回数据为空")
                 return None
             
-            # 打印原始列名，用于调试
-            print("原始数据列名:", df.columns.tolist())
-            
-            # 检查数据是否包含必要的列
-            required_columns = ['日期', '开盘', '收盘', '最高', '最低', '成交量']
-            if not all(col in df.columns for col in required_columns):
-                print("警告：数据缺少必要的列")
-                print("可用的列:", df.columns.tolist())
-                return None
-            
-            # 重命名为标准格式
-            column_mapping = {
-                '日期': 'date',
-                '开盘': 'open',
-                '收盘': 'close',
-                '最高': 'high',
-                '最低': 'low',
-                '成交量': 'volume',
-                '成交额': 'amount',
-                '振幅': 'amplitude',
-                '涨跌幅': 'pct_change',
-                '涨跌额': 'change',
-                '换手率': 'turnover_rate'
-            }
-            
-            # 只重命名存在的列
-            existing_columns = {k: v for k, v in column_mapping.items() if k in df.columns}
-            df = df.rename(columns=existing_columns)
-            
-            # 确保数值列为数值类型
-            numeric_columns = ['open', 'close', 'high', 'low', 'volume', 'amount']
-            for col in numeric_columns:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-            # 设置日期为索引
-            df['date'] = pd.to_datetime(df['date'])
-            df.set_index('date', inplace=True)
-            
-            # 删除包含NaN的行
-            df = df.dropna(subset=['open', 'close', 'high', 'low', 'volume'])
-            
-            if df.empty:
-                print("警告：清理后的数据为空")
-                return None
-            
             print(f"成功获取数据，形状: {df.shape}")
             print("数据预览:")
             print(df.head())
@@ -88,28 +79,176 @@ class DataFetcher:
             print(traceback.format_exc())
             return None
     
+    def get_multi_stock_data(self, stock_codes, start_date, end_date, adjust="qfq",
+                             max_workers=8, max_retries=3, backoff=1.0, rate_limit=10.0,
+                             as_panel=False):
+        """
+        并发获取多只股票的历史数据
+        :param stock_codes: 股票代码列表
+        :param start_date: 开始日期（如：20230101）
+        :param end_date: 结束日期（如：20240101）
+        :param adjust: 复权方式
+        :param max_workers: 最大并发线程数
+        :param max_retries: 单只股票失败后的最大重试次数
+        :param backoff: 重试等待的基础秒数（指数退避）
+        :param rate_limit: 每秒最多发起的网络请求数，None表示不限速
+        :param as_panel: 为True时返回以(date, code)为索引的长表，否则返回 {code: DataFrame}
+        :return: dict 或 DataFrame
+        """
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+        results = {}
+        failed = []
+        
+        print(f"开始并发获取 {len(stock_codes)} 只股票的历史数据（并发数: {max_workers}）...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._load_with_retry, code, start_date, end_date, adjust,
+                                max_retries, backoff, limiter): code
+                for code in stock_codes
+            }
+            for future in as_completed(futures):
+                code = futures[future]
+                try:
+                    df = future.result()
+                    if df is not None and not df.empty:
+                        results[code] = df
+                except Exception as e:
+                    print(f"获取股票 {code} 数据失败: {e}")
+                    failed.append(code)
+        
+        print(f"获取完成：成功 {len(results)} 只，失败 {len(failed)} 只")
+        
+        if as_panel:
+            if not results:
+                return pd.DataFrame()
+            panel = pd.concat(results, names=['code', 'date'])
+            return panel.swaplevel('code', 'date').sort_index()
+        return results
+    
+    def _load_with_retry(self, stock_code, start_date, end_date, adjust, max_retries, backoff, limiter):
+        """
+        带重试和指数退避的单只股票数据获取
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return self._load_stock_data(stock_code, start_date, end_date, adjust, limiter)
+            except Exception:
+                if attempt >= max_retries:
+                    raise
+                time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+    
+    def _load_stock_data(self, stock_code, start_date, end_date, adjust, limiter=None):
+        """
+        读取缓存并补齐缺失区间，出错时直接抛出异常
+        缓存中的不复权K线不会因为分红送转而失效，复权只依赖因子表
+        :return: DataFrame（以日期为索引）
+        """
+        if self.cache is None:
+            return self._fetch_stock_hist(stock_code, start_date, end_date, adjust, limiter)
+        
+        for fetch_start, fetch_end in self.cache.missing_ranges(stock_code, "", start_date, end_date):
+            fetched = self._fetch_stock_hist(stock_code, fetch_start, fetch_end, "", limiter)
+            self.cache.write(stock_code, "", fetched, fetch_start, fetch_end)
+        raw = self.cache.read(stock_code, "", start_date, end_date)
+        if not adjust:
+            return raw
+        return apply_adjustment(raw, self._load_factors(stock_code, limiter), adjust)
+    
+    def _load_factors(self, stock_code, limiter=None):
+        """
+        读取复权因子，本地因子表过期时重新获取（一次请求，数据量只有除权除息日的条数），
+        获取失败时使用本地因子表
+        :return: Series（以日期为索引的后复权因子）
+        """
+        if self.factors.is_stale(stock_code):
+            try:
+                factors = self._fetch_adjust_factors(stock_code, limiter)
+            except Exception as e:
+                # 网络出错时继续使用本地因子表（只是可能缺少最新的除权除息）
+                cached = self.factors.read(stock_code)
+                if cached is None:
+                    raise
+                print(f"更新股票 {stock_code} 复权因子失败，使用本地因子表: {e}")
+                return cached
+            had_factors = self.factors.read(stock_code) is not None
+            if self.factors.write(stock_code, factors) and had_factors:
+                print(f"股票 {stock_code} 有新的除权除息，复权因子已更新")
+            return factors
+        return self.factors.read(stock_code)
+    
+    def _fetch_adjust_factors(self, stock_code, limiter=None):
+        """
+        从akshare获取后复权因子
+        :return: Series（以日期为索引，升序）
+        """
+        if limiter is not None:
+            limiter.acquire()
+        
+        df = ak.stock_zh_a_daily(symbol=_exchange_symbol(stock_code), adjust="hfq-factor")
+        if df is None or df.empty:
+            return pd.Series([], index=pd.DatetimeIndex([], name='date'), dtype='float64', name='hfq_factor')
+        factors = pd.Series(
+            pd.to_numeric(df['hfq_factor'], errors='coerce').to_numpy(),
+            index=pd.DatetimeIndex(pd.to_datetime(df['date']), name='date'),
+            name='hfq_factor'
+        )
+        return factors.dropna().sort_index()
+    
+    def _fetch_stock_hist(self, stock_code, start_date, end_date, adjust, limiter=None):
+        """
+        从akshare获取日线数据并转换为标准格式
+        :return: DataFrame（以日期为索引），区间内无数据时返回空DataFrame
+        """
+        if limiter is not None:
+            limiter.acquire()
+        
+        df = ak.stock_zh_a_hist(symbol=stock_code, 
+                              start_date=start_date, 
+                              end_date=end_date, 
+                              adjust=adjust)
+        
+        return _standardize_hist(df)
+    
     def get_index_data(self, index_code, start_date, end_date):
         """
-        获取指数数据
-        :param index_code: 指数代码（如：000001）
-        :param start_date: 开始日期
-        :param end_date: 结束日期
-        :return: DataFrame包含指数数据
+        获取指数数据（优先读取本地缓存，只从网络补齐缺失的日期区间）
+        :param index_code: 指数代码（如：000001、000300，可带sh/sz前缀）
+        :param start_date: 开始日期（如：20230101）
+        :param end_date: 结束日期（如：20240101）
+        :return: DataFrame包含指数数据（以日期为索引）
         """
         try:
-            df = ak.stock_zh_index_daily(symbol=index_code)
+            df = self._load_index_data(index_code, start_date, end_date)
             if df is None or df.empty:
                 print("获取指数数据失败：返回数据为空")
                 return None
-                
-            df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-            df['date'] = pd.to_datetime(df['date'])
-            df.set_index('date', inplace=True)
             return df
         except Exception as e:
             print(f"获取指数数据时出错: {e}")
             return None
     
+    def _load_index_data(self, index_code, start_date, end_date):
+        """
+        读取指数缓存并补齐缺失区间（与个股共用K线缓存，键为 index_代码）
+        :return: DataFrame（以日期为索引）
+        """
+        index_code = index_code[-6:]
+        if self.cache is None:
+            return self._fetch_index_hist(index_code, start_date, end_date)
+        
+        key = f"index_{index_code}"
+        for fetch_start, fetch_end in self.cache.missing_ranges(key, "", start_date, end_date):
+            fetched = self._fetch_index_hist(index_code, fetch_start, fetch_end)
+            self.cache.write(key, "", fetched, fetch_start, fetch_end)
+        return self.cache.read(key, "", start_date, end_date)
+    
+    def _fetch_index_hist(self, index_code, start_date, end_date):
+        """
+        从akshare按日期区间获取指数日线（不再下载全部历史）
+        """
+        df = ak.index_zh_a_hist(symbol=index_code, period="daily", start_date=start_date, end_date=end_date)
+        return _standardize_hist(df)
+    
     def get_stock_list(self):
         """
         获取A股股票列表
@@ -123,4 +262,59 @@ class DataFetcher:
             return stock_list
         except Exception as e:
             print(f"获取股票列表时出错: {e}")
-            return None 
\ No newline at end of file
+            return None
+
+def _exchange_symbol(stock_code):
+    """
+    股票代码加交易所前缀（如：000001 -> sz000001）
+    """
+    if stock_code.startswith(('92', '4', '8')):
+        return 'bj' + stock_code
+    if stock_code.startswith(('6', '9')):
+        return 'sh' + stock_code
+    return 'sz' + stock_code
+
+def _standardize_hist(df):
+    """
+    将akshare日线数据（中文列名）转换为标准格式
+    :return: DataFrame（以日期为索引），无数据时返回空DataFrame
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
+
+    # 检查数据是否包含必要的列
+    required_columns = ['日期', '开盘', '收盘', '最高', '最低', '成交量']
+    if not all(col in df.columns for col in required_columns):
+        raise ValueError(f"数据缺少必要的列，可用的列: {df.columns.tolist()}")
+    
+    # 重命名为标准格式
+    column_mapping = {
+        '日期': 'date',
+        '开盘': 'open',
+        '收盘': 'close',
+        '最高': 'high',
+        '最低': 'low',
+        '成交量': 'volume',
+        '成交额': 'amount',
+        '振幅': 'amplitude',
+        '涨跌幅': 'pct_change',
+        '涨跌额': 'change',
+        '换手率': 'turnover_rate'
+    }
+    
+    # 只重命名存在的列
+    existing_columns = {k: v for k, v in column_mapping.items() if k in df.columns}
+    df = df.rename(columns=existing_columns)
+    
+    # 确保数值列为数值类型
+    numeric_columns = ['open', 'close', 'high', 'low', 'volume', 'amount']
+    for col in numeric_columns:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    
+    # 设置日期为索引
+    df['date'] = pd.to_datetime(df['date'])
+    df.set_index('date', inplace=True)
+    
+    # 删除包含NaN的行
+    return df.dropna(subset=['open', 'close', 'high', 'low', 'volume'])
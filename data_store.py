@@ -0,0 +1,330 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+# 缓存格式版本：2 起只缓存不复权K线，复权价格由复权因子计算
+CACHE_VERSION = 2
+
+class BarStore:
+    def __init__(self, root_dir='data_cache', memory_items=64):
+        """
+        本地K线数据存储（每个股票、每种复权方式一个parquet列式文件）
+        :param root_dir: 存储目录
+        :param memory_items: 内存中保留的最近读取的文件数（如回测反复使用的基准指数）
+        """
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        self._meta_path = os.path.join(root_dir, '_meta.json')
+        self._lock = threading.Lock()
+        self._meta = self._load_meta()
+        self.memory_items = memory_items
+        self._memory = OrderedDict()  # 键 -> 按日期排序的DataFrame（LRU）
+        self._versions = {}  # 键 -> 文件被改写的次数，读取期间文件被改写时不放入内存
+        self._memory_lock = threading.Lock()
+        if self._meta.get('_version', 1) < CACHE_VERSION:
+            self._migrate()
+
+    def _load_meta(self):
+        """
+        读取覆盖区间索引
+        """
+        if not os.path.exists(self._meta_path):
+            return {}
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取缓存索引时出错，将重建索引: {e}")
+            return {}
+
+    def _save_meta(self):
+        """
+        原子写入覆盖区间索引
+        """
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._meta_path)
+
+    def _key(self, stock_code, adjust):
+        return f"{stock_code}_{adjust or 'none'}"
+
+    def _path(self, stock_code, adjust):
+        return os.path.join(self.root_dir, f"{self._key(stock_code, adjust)}.parquet")
+
+    def get_coverage(self, stock_code, adjust):
+        """
+        获取已缓存的日期区间
+        :return: (start_date, end_date) 或 None，日期格式YYYYMMDD
+        """
+        coverage = self._meta.get(self._key(stock_code, adjust))
+        return tuple(coverage) if coverage else None
+
+    def missing_ranges(self, stock_code, adjust, start_date, end_date):
+        """
+        计算需要从网络补齐的日期区间
+        :param start_date: 开始日期（如：20230101）
+        :param end_date: 结束日期（如：20240101）
+        :return: list [(start_date, end_date), ...]
+        """
+        coverage = self.get_coverage(stock_code, adjust)
+        if coverage is None:
+            return [(start_date, end_date)]
+
+        cached_start, cached_end = coverage
+        ranges = []
+        # 请求区间与缓存不相交时一并补齐中间的空档，保证缓存区间连续
+        if start_date < cached_start:
+            ranges.append((start_date, _shift_date(cached_start, -1)))
+        if end_date > cached_end:
+            ranges.append((_shift_date(cached_end, 1), end_date))
+        return ranges
+
+    def read(self, stock_code, adjust, start_date=None, end_date=None):
+        """
+        读取缓存数据（日期索引有序，按二分查找截取区间）
+        :return: DataFrame（以日期为索引）或 None
+        """
+        df = self._load(stock_code, adjust)
+        if df is None:
+            return None
+
+        start = 0 if start_date is None else df.index.searchsorted(pd.to_datetime(start_date), side='left')
+        end = len(df) if end_date is None else df.index.searchsorted(pd.to_datetime(end_date), side='right')
+        return df.iloc[start:end].copy()  # 返回副本，调用方修改不会影响内存缓存
+
+    def _load(self, stock_code, adjust):
+        """
+        读取整个文件，最近使用的保留在内存中
+        """
+        key = self._key(stock_code, adjust)
+        with self._memory_lock:
+            df = self._memory.get(key)
+            if df is not None:
+                self._memory.move_to_end(key)
+                return df
+            version = self._versions.get(key, 0)
+
+        path = self._path(stock_code, adjust)
+        if not os.path.exists(path):
+            return None
+        df = pd.read_parquet(path)
+        if not df.index.is_monotonic_increasing:
+            df = df.sort_index()
+        if self.memory_items:
+            with self._memory_lock:
+                if self._versions.get(key, 0) == version:
+                    self._memory[key] = df
+                    if len(self._memory) > self.memory_items:
+                        self._memory.popitem(last=False)
+        return df
+
+    def _invalidate(self, key):
+        """
+        文件被改写后移出内存，并使正在读取旧文件的线程不再把旧数据放入内存
+        """
+        with self._memory_lock:
+            self._memory.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def write(self, stock_code, adjust, df, start_date, end_date):
+        """
+        将新获取的数据合并写入缓存，并扩展覆盖区间
+        :param df: 新数据（以日期为索引），可以为空
+        :param start_date: 本次获取的开始日期
+        :param end_date: 本次获取的结束日期
+        """
+        with self._lock:
+            existing = self.read(stock_code, adjust)
+            if existing is not None and not existing.empty:
+                if df is not None and not df.empty:
+                    merged = pd.concat([existing, df])
+                    merged = merged[~merged.index.duplicated(keep='last')]
+                else:
+                    merged = existing
+            else:
+                merged = df
+
+            if merged is not None and not merged.empty:
+                merged = merged.sort_index()
+                tmp_path = self._path(stock_code, adjust) + '.tmp'
+                merged.to_parquet(tmp_path)
+                os.replace(tmp_path, self._path(stock_code, adjust))
+                self._invalidate(self._key(stock_code, adjust))
+
+            # 当天数据可能尚未收盘，不计入已覆盖区间，下次请求时重新获取
+            yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
+            end_date = min(end_date, yesterday)
+            if start_date > end_date:
+                return
+
+            coverage = self.get_coverage(stock_code, adjust)
+            if coverage is not None:
+                start_date = min(start_date, coverage[0])
+                end_date = max(end_date, coverage[1])
+            self._meta[self._key(stock_code, adjust)] = [start_date, end_date]
+            self._save_meta()
+
+    def clear(self, stock_code, adjust):
+        """
+        删除某个股票的缓存
+        """
+        with self._lock:
+            path = self._path(stock_code, adjust)
+            if os.path.exists(path):
+                os.remove(path)
+            self._invalidate(self._key(stock_code, adjust))
+            self._meta.pop(self._key(stock_code, adjust), None)
+            self._save_meta()
+
+    def _migrate(self):
+        """
+        旧版本缓存升级（只执行一次，完成后在索引中记录版本号）
+        版本1缓存的前复权/后复权K线不再使用，删除文件及其覆盖区间
+        """
+        removed = self._drop_adjusted()
+        if removed:
+            print(f"已删除 {removed} 个旧的复权K线缓存文件")
+        with self._lock:
+            self._meta['_version'] = CACHE_VERSION
+            self._save_meta()
+
+    def _drop_adjusted(self):
+        """
+        删除前复权/后复权K线缓存及其覆盖区间
+        :return: int 删除的文件数
+        """
+        removed = 0
+        with self._lock:
+            for name in os.listdir(self.root_dir):
+                if name.endswith(('_qfq.parquet', '_hfq.parquet')):
+                    os.remove(os.path.join(self.root_dir, name))
+                    self._invalidate(name[:-len('.parquet')])
+                    removed += 1
+            keys = [key for key in self._meta if key.endswith(('_qfq', '_hfq'))]
+            for key in keys:
+                del self._meta[key]
+            if keys:
+                self._save_meta()
+        return removed
+
+class AdjustFactorStore:
+    def __init__(self, root_dir='data_cache', max_age_days=1):
+        """
+        本地复权因子存储（每个股票一个parquet文件，只记录除权除息日及其后复权因子）
+        K线缓存只保存不复权数据，前复权/后复权价格由因子按需计算；
+        发生分红送转时只需更新因子表，不需要重新下载K线
+        :param root_dir: 存储目录（可与 BarStore 共用）
+        :param max_age_days: 因子表超过该天数未更新时重新获取
+        """
+        self.root_dir = root_dir
+        self.max_age_days = max_age_days
+        os.makedirs(root_dir, exist_ok=True)
+        self._meta_path = os.path.join(root_dir, '_factor_meta.json')
+        self._lock = threading.Lock()
+        self._meta = self._load_meta()
+        self._memory = {}  # 股票代码 -> 因子表，避免每次读取都访问磁盘
+
+    def _load_meta(self):
+        """
+        读取因子表的更新日期索引
+        """
+        if not os.path.exists(self._meta_path):
+            return {}
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"读取复权因子索引时出错，将重建索引: {e}")
+            return {}
+
+    def _save_meta(self):
+        tmp_path = self._meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._meta_path)
+
+    def _path(self, stock_code):
+        return os.path.join(self.root_dir, f"{stock_code}_factor.parquet")
+
+    def is_stale(self, stock_code):
+        """
+        因子表是否需要重新获取（从未获取或超过 max_age_days 天未更新）
+        """
+        fetched = self._meta.get(stock_code)
+        if fetched is None:
+            return True
+        age = datetime.now() - datetime.strptime(fetched, '%Y%m%d')
+        return age.days >= self.max_age_days
+
+    def read(self, stock_code):
+        """
+        读取因子表
+        :return: Series（以除权除息日为索引的后复权因子，升序）或 None
+        """
+        factors = self._memory.get(stock_code)
+        if factors is not None:
+            return factors
+        path = self._path(stock_code)
+        if not os.path.exists(path):
+            return None
+        factors = pd.read_parquet(path)['hfq_factor']
+        self._memory[stock_code] = factors
+        return factors
+
+    def write(self, stock_code, factors):
+        """
+        保存因子表并记录更新日期
+        :param factors: Series（以日期为索引的后复权因子）
+        :return: bool 因子是否与已保存的不同（即发生了新的除权除息）
+        """
+        factors = factors.sort_index()
+        with self._lock:
+            previous = self.read(stock_code)
+            changed = previous is None or not previous.equals(factors)
+            if changed:
+                tmp_path = self._path(stock_code) + '.tmp'
+                factors.to_frame('hfq_factor').to_parquet(tmp_path)
+                os.replace(tmp_path, self._path(stock_code))
+                self._memory[stock_code] = factors
+            self._meta[stock_code] = datetime.now().strftime('%Y%m%d')
+            self._save_meta()
+        return changed
+
+def apply_adjustment(df, factors, adjust):
+    """
+    由不复权K线和后复权因子计算复权价格（向量化乘法）
+    后复权价 = 不复权价 × 当日因子；前复权价 = 不复权价 × 当日因子 / 最新因子，结果保留两位小数
+    :param df: 不复权K线（以日期为索引）
+    :param factors: Series（以除权除息日为索引的后复权因子，升序），None或空表示没有除权除息
+    :param adjust: 复权方式（"qfq"、"hfq" 或 "" 不复权）
+    :return: DataFrame（成交量、成交额、涨跌幅等不受影响的列保持不变）
+    """
+    if not adjust or df is None or df.empty or factors is None or factors.empty:
+        return df
+    if adjust not in ('qfq', 'hfq'):
+        raise ValueError(f"不支持的复权方式: {adjust}")
+
+    # 每根K线对应其日期之前最近一次除权除息日的因子，首个除权日之前为1
+    factor_values = factors.to_numpy(dtype=np.float64)
+    positions = np.searchsorted(factors.index.to_numpy(), df.index.to_numpy(), side='right') - 1
+    scale = np.where(positions >= 0, factor_values[np.maximum(positions, 0)], 1.0)
+    if adjust == 'qfq':
+        scale = scale / factor_values[-1]
+
+    df = df.copy()
+    for column in ('open', 'close', 'high', 'low', 'change'):
+        if column in df.columns:
+            # 与akshare返回的复权价格一致，保留两位小数
+            df[column] = np.round(df[column].to_numpy(dtype=np.float64) * scale, 2)
+    return df
+
+def _shift_date(date_str, days):
+    """
+    YYYYMMDD格式日期加减天数
+    """
+    return (datetime.strptime(date_str, '%Y%m%d') + timedelta(days=days)).strftime('%Y%m%d')
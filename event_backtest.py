@@ -0,0 +1,179 @@
+import numpy as np
+import pandas as pd
+from risk_manager import RiskManager
+from money_manager import MoneyManager
+from vector_backtest import VectorBacktester
+
+class EventBacktester:
+    def __init__(self, strategy_type='ma_cross', params=None, initial_capital=1000000.0,
+                 risk_manager=None, money_manager=None, simulator=None):
+        """
+        事件驱动逐K线回测引擎
+        按实盘相同的流程处理每个信号：信号 → 仓位计算 → 风险检查 → 成交
+        :param strategy_type: 'ma_cross' 或 'macd'
+        :param params: 策略参数，ma_cross默认(5, 20)，macd默认(12, 26, 9)
+        :param initial_capital: 初始资金
+        :param risk_manager: 风险管理器，None则新建默认参数的RiskManager（与资金管理器共用持仓台账）
+        :param money_manager: 资金管理器，None则按初始资金新建MoneyManager
+        :param simulator: 模拟撮合（MatchingSimulator），用于计算滑点、交易费用和涨跌停；
+                          None则按收盘价无成本成交
+        """
+        if params is None:
+            params = (5, 20) if strategy_type == 'ma_cross' else (12, 26, 9)
+        self.strategy_type = strategy_type
+        self.params = tuple(params)
+        self.initial_capital = initial_capital
+        self.money_manager = money_manager or MoneyManager(initial_capital=initial_capital)
+        self.risk_manager = risk_manager or RiskManager(ledger=self.money_manager.ledger)
+        self.simulator = simulator
+
+    def run(self, prices):
+        """
+        回放历史K线
+        :param prices: 收盘价矩阵（DataFrame，日期×股票），或 {stock_code: DataFrame}
+        :return: (portfolio, trades) 两个DataFrame
+        """
+        if isinstance(prices, dict):
+            prices = VectorBacktester.build_price_matrix(prices)
+
+        codes = [str(c) for c in prices.columns]
+        values = prices.to_numpy(dtype=np.float64)
+        n_bars, n_symbols = values.shape
+
+        # 预先计算所有股票的信号变化，回放时只处理有事件的K线
+        signal = VectorBacktester().signals(values, self.strategy_type, [self.params])[0]
+        change = np.diff(signal, axis=0, prepend=0.0)
+        event_bars, event_symbols = np.nonzero(change)
+        event_dirs = change[event_bars, event_symbols]
+
+        # 预分配状态数组
+        shares = np.zeros(n_symbols, dtype=np.int64)
+        mark_prices = prices.ffill().fillna(0.0).to_numpy(dtype=np.float64)
+        bar_times = prices.index.to_pydatetime() if isinstance(prices.index, pd.DatetimeIndex) else [None] * n_bars
+        cash = self.initial_capital
+        equity = np.empty(n_bars)
+        cash_curve = np.empty(n_bars)
+        max_trades = len(event_bars)
+        trade_bar = np.empty(max_trades, dtype=np.int64)
+        trade_symbol = np.empty(max_trades, dtype=np.int64)
+        trade_dir = np.empty(max_trades, dtype=np.int8)
+        trade_price = np.empty(max_trades)
+        trade_volume = np.empty(max_trades, dtype=np.int64)
+        trade_fee = np.zeros(max_trades)
+        n_trades = 0
+        n_rejected = 0
+
+        risk_manager = self.risk_manager
+        money_manager = self.money_manager
+        separate_ledger = risk_manager.ledger is not money_manager.ledger
+        simulator = self.simulator
+        if simulator is not None:
+            # 一次算出所有K线的涨跌停状态
+            up_locked, down_locked = simulator.limit_locks(values, codes)
+        retry_sells = []  # 跌停卖不出的股票，下一根K线继续卖出
+        event = 0
+        for t in range(n_bars):
+            price_row = mark_prices[t]
+            total_assets = cash + float(shares @ price_row)
+
+            bar_events = [(s, 'sell') for s in retry_sells]
+            retry_sells = []
+            while event < max_trades and event_bars[event] == t:
+                s = event_symbols[event]
+                if event_dirs[event] > 0:
+                    # 信号重新变为持有，不再补卖
+                    bar_events = [e for e in bar_events if e[0] != s]
+                bar_events.append((s, 'buy' if event_dirs[event] > 0 else 'sell'))
+                event += 1
+
+            for s, direction in bar_events:
+                price = values[t, s]
+                if not price > 0:
+                    if direction == 'sell' and shares[s] > 0:
+                        retry_sells.append(s)  # 停牌
+                    continue
+
+                if direction == 'buy':
+                    volume = money_manager.calculate_position_size(codes[s], price)
+                else:
+                    volume = int(shares[s])
+                if volume <= 0:
+                    continue
+
+                order = {
+                    'stock_code': codes[s],
+                    'direction': direction,
+                    'price': price,
+                    'volume': volume
+                }
+                account_info = {
+                    'cash': cash,
+                    'total_assets': total_assets
+                }
+                allowed, _ = risk_manager.check_order(order, account_info)
+                if not allowed:
+                    n_rejected += 1
+                    continue
+
+                fee = 0.0
+                if simulator is not None:
+                    # 涨停买不进；跌停卖不出，留到下一根K线
+                    if direction == 'buy' and up_locked[t, s]:
+                        n_rejected += 1
+                        continue
+                    if direction == 'sell' and down_locked[t, s]:
+                        retry_sells.append(s)
+                        continue
+                    price = simulator.execution_price(direction, price)
+                    fee = simulator.fee(direction, price, volume)
+
+                # 与 TradeInterface 相同的资金和持仓检查
+                value = price * volume
+                if direction == 'buy':
+                    if value + fee > cash:
+                        n_rejected += 1
+                        continue
+                    cash -= value + fee
+                    shares[s] += volume
+                else:
+                    if shares[s] < volume:
+                        n_rejected += 1
+                        continue
+                    cash += value - fee
+                    shares[s] -= volume
+
+                # 成交记入持仓台账（风险管理器据此计算持仓成本和止损）
+                money_manager.update_position(codes[s], direction, price, volume, fee=fee, timestamp=bar_times[t])
+                if separate_ledger:
+                    risk_manager.ledger.apply_fill(codes[s], direction, price, volume, fee, bar_times[t])
+
+                trade_bar[n_trades] = t
+                trade_symbol[n_trades] = s
+                trade_dir[n_trades] = 1 if direction == 'buy' else -1
+                trade_price[n_trades] = price
+                trade_volume[n_trades] = volume
+                trade_fee[n_trades] = fee
+                n_trades += 1
+
+            equity[t] = cash + float(shares @ price_row)
+            cash_curve[t] = cash
+            risk_manager.update_portfolio_value(equity[t])
+
+        portfolio = pd.DataFrame({
+            'cash': cash_curve,
+            'position_value': equity - cash_curve,
+            'total': equity
+        }, index=prices.index)
+        portfolio['returns'] = portfolio['total'].pct_change().fillna(0)
+
+        trades = pd.DataFrame({
+            'date': prices.index[trade_bar[:n_trades]],
+            'stock_code': np.asarray(codes, dtype=object)[trade_symbol[:n_trades]],
+            'direction': np.where(trade_dir[:n_trades] > 0, 'buy', 'sell'),
+            'price': trade_price[:n_trades],
+            'volume': trade_volume[:n_trades],
+            'fee': trade_fee[:n_trades]
+        })
+
+        print(f"回测完成：成交 {n_trades} 笔，被拒绝 {n_rejected} 笔")
+        return portfolio, trades
@@ -0,0 +1,181 @@
+import math
+import numpy as np
+from datetime import datetime, timedelta
+
+class StreamingMA:
+    def __init__(self, window):
+        """
+        增量移动平均（环形缓冲区 + 滚动求和），每次更新O(1)
+        :param window: 窗口长度
+        """
+        self.window = window
+        self.buffer = np.zeros(window)
+        self.index = 0  # 下一个写入位置
+        self.count = 0
+        self.total = 0.0
+        self.value = math.nan
+
+    def update(self, price, replace_last=False):
+        """
+        加入一个新值
+        :param price: 最新价格
+        :param replace_last: 为True时替换最近一个值（同一根K线内的盘中更新）
+        :return: 当前均值，数据不足一个窗口时为NaN
+        """
+        if replace_last and self.count > 0:
+            last = (self.index - 1) % self.window
+            self.total += price - self.buffer[last]
+            self.buffer[last] = price
+        else:
+            if self.count == self.window:
+                self.total -= self.buffer[self.index]
+            else:
+                self.count += 1
+            self.buffer[self.index] = price
+            self.total += price
+            self.index = (self.index + 1) % self.window
+            # 每绕一圈重新求和一次，消除浮点累计误差（均摊仍为O(1)）
+            if self.index == 0:
+                self.total = float(self.buffer.sum())
+
+        self.value = self.total / self.window if self.count == self.window else math.nan
+        return self.value
+
+class StreamingEMA:
+    def __init__(self, span):
+        """
+        增量指数移动平均（等价于 pandas ewm(span, adjust=False)）
+        :param span: 周期
+        """
+        self.alpha = 2.0 / (span + 1.0)
+        self.prev = math.nan  # 最近一根K线之前的EMA
+        self.value = math.nan
+
+    def update(self, price, replace_last=False):
+        """
+        加入一个新值
+        :param price: 最新价格
+        :param replace_last: 为True时替换最近一个值
+        :return: 当前EMA
+        """
+        if not replace_last:
+            self.prev = self.value
+        if math.isnan(self.prev):
+            self.value = price
+        else:
+            self.value = self.alpha * price + (1 - self.alpha) * self.prev
+        return self.value
+
+class StreamingMACD:
+    def __init__(self, fast=12, slow=26, signal=9):
+        """
+        增量MACD（与 Strategy.calculate_macd 计算方式一致）
+        """
+        self.fast = StreamingEMA(fast)
+        self.slow = StreamingEMA(slow)
+        self.signal = StreamingEMA(signal)
+        self.macd = math.nan
+        self.signal_line = math.nan
+        self.histogram = math.nan
+
+    def update(self, price, replace_last=False):
+        """
+        加入一个新值
+        :return: (macd, signal_line, histogram)
+        """
+        self.macd = self.fast.update(price, replace_last) - self.slow.update(price, replace_last)
+        self.signal_line = self.signal.update(self.macd, replace_last)
+        self.histogram = self.macd - self.signal_line
+        return self.macd, self.signal_line, self.histogram
+
+class MACrossSignal:
+    def __init__(self, short_window=5, long_window=20):
+        """
+        增量均线交叉信号（与 Strategy.ma_cross_strategy 规则一致）
+        """
+        self.short_ma = StreamingMA(short_window)
+        self.long_ma = StreamingMA(long_window)
+        self.signal = 0.0
+
+    def update(self, price, replace_last=False):
+        """
+        :return: 仓位变化信号（1买入，-1卖出，0不变）
+        """
+        short_ma = self.short_ma.update(price, replace_last)
+        long_ma = self.long_ma.update(price, replace_last)
+        signal = 1.0 if short_ma > long_ma else 0.0
+        change = signal - self.signal
+        self.signal = signal
+        return change
+
+class MACDSignal:
+    def __init__(self, fast=12, slow=26, signal=9):
+        """
+        增量MACD信号（与 Strategy.macd_strategy 规则一致）
+        """
+        self.macd = StreamingMACD(fast, slow, signal)
+        self.signal = 0.0
+
+    def update(self, price, replace_last=False):
+        """
+        :return: 仓位变化信号（1买入，-1卖出，0不变）
+        """
+        macd, signal_line, _ = self.macd.update(price, replace_last)
+        signal = 1.0 if macd > signal_line else 0.0
+        change = signal - self.signal
+        self.signal = signal
+        return change
+
+class SignalBook:
+    def __init__(self, strategy_type='ma_cross', params=None):
+        """
+        按股票维护增量信号状态
+        每个交易日的第一笔行情开启一根新K线，之后的行情只更新当日K线
+        :param strategy_type: 'ma_cross' 或 'macd'
+        :param params: 策略参数
+        """
+        if strategy_type == 'ma_cross':
+            self._factory = lambda: MACrossSignal(*(params or (5, 20)))
+        elif strategy_type == 'macd':
+            self._factory = lambda: MACDSignal(*(params or (12, 26, 9)))
+        else:
+            raise ValueError("不支持的策略类型")
+        self.signals = {}
+        self.last_bar_date = {}
+
+    def warm_up(self, data_fetcher, stock_codes, days=120):
+        """
+        用历史日线数据预热指标（截至昨日）
+        :param data_fetcher: DataFetcher实例
+        :param stock_codes: 股票代码列表
+        :param days: 回看的自然日天数
+        """
+        end_date = (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
+        start_date = (datetime.now() - timedelta(days=days)).strftime('%Y%m%d')
+        history = data_fetcher.get_multi_stock_data(stock_codes, start_date, end_date)
+        for code in stock_codes:
+            indicator = self.signals.setdefault(code, self._factory())
+            df = history.get(code)
+            if df is None:
+                print(f"警告：股票 {code} 没有历史数据，指标需要实时数据积累")
+                continue
+            for price in df['close'].to_numpy(dtype=np.float64):
+                indicator.update(price)
+            self.last_bar_date[code] = df.index[-1].date()
+
+    def update(self, stock_code, price, timestamp=None):
+        """
+        处理一笔实时行情
+        :param stock_code: 股票代码
+        :param price: 最新价
+        :param timestamp: 行情时间，None表示当前时间
+        :return: 仓位变化信号（1买入，-1卖出，0不变）
+        """
+        indicator = self.signals.get(stock_code)
+        if indicator is None:
+            indicator = self.signals[stock_code] = self._factory()
+
+        bar_date = (timestamp or datetime.now()).date()
+        replace_last = self.last_bar_date.get(stock_code) == bar_date
+        self.last_bar_date[stock_code] = bar_date
+        return indicator.update(price, replace_last)
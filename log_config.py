@@ -0,0 +1,93 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志输出为一行JSON：时间、级别、模块、消息，以及通过 extra 传入的字段
+    """
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='microseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    只把日志记录放入队列，消息格式化留给后台线程
+    （标准 QueueHandler 会在调用线程中先格式化消息；参数应使用不会再被修改的值）
+    """
+    def prepare(self, record):
+        return record
+
+def setup_logging(log_file='trading.log', level='INFO', module_levels=None, console=True,
+                  console_level='INFO', max_bytes=50 * 1024 * 1024, backup_count=5):
+    """
+    配置异步日志：调用方只把记录放入队列，由后台线程格式化并写入文件和控制台
+    文件为JSON Lines格式，按大小轮转；重复调用时只调整级别
+    :param log_file: 日志文件路径，None表示不写文件
+    :param level: 根日志级别
+    :param module_levels: 各模块的日志级别，如 {'realtime_data': 'WARNING', 'trade_interface': 'DEBUG'}
+    :param console: 是否同时输出到控制台
+    :param console_level: 控制台输出级别
+    :param max_bytes: 单个日志文件的最大字节数
+    :param backup_count: 保留的轮转文件数
+    :return: QueueListener
+    """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+    if _listener is not None:
+        return _listener
+
+    handlers = []
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(console_level)
+        console_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(LazyQueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+def shutdown_logging():
+    """
+    写完队列中剩余的日志并停止后台线程
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
@@ -4,24 +4,34 @@ from realtime_data import RealtimeDataFetcher
 from trade_interface import TradeInterface
 from risk_manager import RiskManager
 from money_manager import MoneyManager
-import matplotlib.pyplot as plt
+from vector_backtest import VectorBacktester
+from optimizer import ParameterOptimizer
+from indicators import SignalBook
+from position_ledger import PositionLedger
+from order_manager import SimulatedBroker
+from matching import QuoteBookMatcher
+from log_config import setup_logging
+from metrics import Metrics, MetricsExporter, NULL_METRICS
+from analytics import compute_metrics
+from report import render_report
+import logging
+import os
 import pandas as pd
 from datetime import datetime, timedelta
 import time
-import numpy as np
 
-def plot_portfolio(portfolio, title):
+def plot_portfolio(portfolio, title, benchmark=None, output_dir='reports'):
     """
-    绘制投资组合表现
+    绘制投资组合表现并保存为图片（Agg后端，不弹出窗口，可在无界面的服务器上运行）
+    :param portfolio: Strategy.backtest 的结果（含 total 列）
+    :param title: 图表标题（同时作为文件名）
+    :param benchmark: 基准指数数据，None表示不画基准
+    :param output_dir: 图片保存目录
+    :return: 图片路径
     """
-    plt.figure(figsize=(12, 6))
-    plt.plot(portfolio.index, portfolio['total'], label='投资组合价值')
-    plt.title(title)
-    plt.xlabel('日期')
-    plt.ylabel('价值')
-    plt.legend()
-    plt.grid(True)
-    plt.show()
+    path = render_report(os.path.join(output_dir, f"{title}.png"), portfolio, title, benchmark=benchmark)
+    print(f"图表已保存到: {path}")
+    return path
 
 def run_backtest():
     """
@@ -77,30 +87,32 @@ def run_backtest():
         print("\nMACD策略回测结果预览:")
         print(portfolio_macd.head())
         
-        # 计算策略表现
+        # 计算策略表现（两条净值曲线一次向量化计算，基准为沪深300）
+        benchmark = data_fetcher.get_index_data("000300", start_date, end_date)
         try:
-            # 计算年化收益率
-            ma_returns = portfolio_ma['total'].pct_change().mean() * 252
-            macd_returns = portfolio_macd['total'].pct_change().mean() * 252
-            
-            # 计算最大回撤
-            ma_drawdown = (portfolio_ma['total'] / portfolio_ma['total'].cummax() - 1).min()
-            macd_drawdown = (portfolio_macd['total'] / portfolio_macd['total'].cummax() - 1).min()
-            
-            # 计算夏普比率
-            ma_sharpe = portfolio_ma['total'].pct_change().mean() / portfolio_ma['total'].pct_change().std() * np.sqrt(252)
-            macd_sharpe = portfolio_macd['total'].pct_change().mean() / portfolio_macd['total'].pct_change().std() * np.sqrt(252)
+            equity = pd.DataFrame({
+                '均线交叉策略': portfolio_ma['total'],
+                'MACD策略': portfolio_macd['total']
+            })
+            weights = pd.DataFrame({
+                '均线交叉策略': portfolio_ma['positions'] * stock_data['close'] / portfolio_ma['total'],
+                'MACD策略': portfolio_macd['positions'] * stock_data['close'] / portfolio_macd['total']
+            })
+            report = compute_metrics(equity, benchmark=benchmark, weights=weights, risk_free_rate=0.03)
             
             print("\n策略表现总结：")
-            print(f"均线交叉策略:")
-            print(f"  年化收益率: {ma_returns:.2%}")
-            print(f"  最大回撤: {ma_drawdown:.2%}")
-            print(f"  夏普比率: {ma_sharpe:.2f}")
-            
-            print(f"\nMACD策略:")
-            print(f"  年化收益率: {macd_returns:.2%}")
-            print(f"  最大回撤: {macd_drawdown:.2%}")
-            print(f"  夏普比率: {macd_sharpe:.2f}")
+            for name, row in report.iterrows():
+                print(f"\n{name}:")
+                print(f"  年化收益率: {row['cagr']:.2%}")
+                print(f"  年化波动率: {row['volatility']:.2%}")
+                print(f"  最大回撤: {row['max_drawdown']:.2%}（最长 {row['max_drawdown_duration']:.0f} 个交易日）")
+                print(f"  夏普比率: {row['sharpe_ratio']:.2f}")
+                print(f"  索提诺比率: {row['sortino_ratio']:.2f}")
+                print(f"  卡玛比率: {row['calmar_ratio']:.2f}")
+                print(f"  年化换手率: {row['turnover']:.2f}")
+                print(f"  胜率: {row['win_rate']:.2%}")
+                if benchmark is not None:
+                    print(f"  Alpha: {row['alpha']:.2%}  Beta: {row['beta']:.2f}")
             
         except Exception as e:
             print(f"计算策略表现时出错: {e}")
@@ -110,8 +122,8 @@ def run_backtest():
         
         # 绘制投资组合表现
         try:
-            plot_portfolio(portfolio_ma, "均线交叉策略投资组合表现")
-            plot_portfolio(portfolio_macd, "MACD策略投资组合表现")
+            plot_portfolio(portfolio_ma, "均线交叉策略投资组合表现", benchmark)
+            plot_portfolio(portfolio_macd, "MACD策略投资组合表现", benchmark)
         except Exception as e:
             print(f"绘制图表时出错: {e}")
         
@@ -121,52 +133,155 @@ def run_backtest():
         print("错误详情:")
         print(traceback.format_exc())
 
-def run_live_trading():
+def run_optimization():
+    """
+    运行参数优化
+    """
+    try:
+        data_fetcher = DataFetcher()
+        
+        # 设置优化参数
+        stock_codes = ["000001", "600519", "000858", "601318"]
+        end_date = datetime.now().strftime('%Y%m%d')
+        start_date = (datetime.now() - timedelta(days=365 * 3)).strftime('%Y%m%d')
+        
+        print(f"优化参数:")
+        print(f"股票代码: {stock_codes}")
+        print(f"开始日期: {start_date}")
+        print(f"结束日期: {end_date}")
+        
+        stock_data = data_fetcher.get_multi_stock_data(stock_codes, start_date, end_date)
+        if not stock_data:
+            print("获取数据失败，请检查股票代码和日期是否正确")
+            return
+        
+        prices = VectorBacktester.build_price_matrix(stock_data)
+        optimizer = ParameterOptimizer()
+        
+        print("\n正在优化均线交叉策略参数...")
+        ma_results = optimizer.grid_search(prices, 'ma_cross', [range(3, 21), range(10, 121, 5)])
+        print("\n均线交叉策略最优参数（按夏普比率排序）:")
+        print(ma_results.head(10))
+        
+        print("\n正在优化MACD策略参数...")
+        macd_results = optimizer.grid_search(prices, 'macd', [range(6, 19, 2), range(20, 41, 4), range(5, 13, 2)])
+        print("\nMACD策略最优参数（按夏普比率排序）:")
+        print(macd_results.head(10))
+        
+        print(f"\n完整结果已保存到: {optimizer.results_path}")
+        
+    except Exception as e:
+        print(f"参数优化过程中出现错误: {e}")
+        import traceback
+        print("错误详情:")
+        print(traceback.format_exc())
+
+def run_live_trading(enable_metrics=True, metrics_path='live_metrics.json', metrics_port=None):
     """
     运行实盘交易
+    :param enable_metrics: 是否统计交易循环各阶段的延迟（关闭时几乎没有开销）
+    :param metrics_path: 指标快照文件，None表示不写文件
+    :param metrics_port: 本地HTTP指标端口（GET /metrics），None表示不启动
     """
+    # 异步日志：交易循环中只把记录放入队列，由后台线程写文件和控制台
+    setup_logging('trading.log', module_levels={'trade_interface': 'INFO', 'realtime_data': 'WARNING'})
+    logger = logging.getLogger('live_trading')
+    
+    # 性能指标：行情→信号→仓位→风控→下单各阶段延迟、计数和行情队列深度
+    metrics = Metrics() if enable_metrics else NULL_METRICS
+    exporter = None
+    if enable_metrics and (metrics_path or metrics_port is not None):
+        exporter = MetricsExporter(metrics, path=metrics_path, port=metrics_port).start()
+    
     # 初始化各个模块
+    initial_capital = 1000000.0
+    ledger = PositionLedger()  # 交易接口、风险管理、资金管理共用一个持仓台账
     realtime_data = RealtimeDataFetcher()
-    trade_interface = TradeInterface(account_id="test_account")
-    risk_manager = RiskManager()
-    money_manager = MoneyManager(initial_capital=1000000.0)
-    strategy = Strategy()
+    matcher = QuoteBookMatcher()  # 按实时盘口模拟撮合（滑点、费用、涨跌停、部分成交）
+    broker = SimulatedBroker(matcher)
+    trade_interface = TradeInterface(account_id="test_account", ledger=ledger, cash=initial_capital, broker=broker,
+                                     fee_model=matcher.simulator)
+    risk_manager = RiskManager(ledger=ledger)
+    money_manager = MoneyManager(initial_capital=initial_capital, ledger=ledger)
+    signal_book = SignalBook(strategy_type='ma_cross')
+    
+    # 成交回报到达时更新资金管理（成交已由交易接口记入持仓台账）
+    def on_fill(order, fill):
+        money_manager.update_position(
+            order['stock_code'],
+            order['direction'],
+            fill['price'],
+            fill['volume'],
+            fee=fill['fee'],
+            timestamp=fill['timestamp'],
+            record_fill=False
+        )
+        metrics.inc('fills')
+        logger.info("成交: %s %s %s股 @ %.2f", order['stock_code'], order['direction'], fill['volume'], fill['price'])
+    trade_interface.add_fill_listener(on_fill)
     
     # 设置交易参数
     stock_codes = ["000001"]  # 平安银行
     update_interval = 3  # 更新间隔（秒）
     
     try:
+        # 用历史数据预热指标
+        print("正在用历史数据预热指标...")
+        signal_book.warm_up(DataFetcher(), stock_codes)
+        
         # 开始获取实时数据
         print("开始获取实时数据...")
         realtime_data.start_fetching(stock_codes)
         
         while True:
-            # 获取最新数据
-            latest_data = realtime_data.get_latest_data()
-            if latest_data:
+            loop_start = metrics.now()
+            
+            # 处理券商回报（成交、撤单），不阻塞
+            trade_interface.process_events()
+            
+            # 获取自上次读取以来每只股票的最新行情
+            metrics.set('queue_depth', realtime_data.data_queue.qsize())
+            batch = realtime_data.get_latest_batch()
+            t = metrics.observe('fetch', loop_start)
+            if batch is not None:
+                metrics.inc('batches')
+                metrics.inc('ticks', len(batch))
+                # 行情生成时刻（墙上时钟），用于统计行情到下单的延迟
+                tick_time_ns = int(batch.timestamp.timestamp() * 1e9)
+                
+                # 最新价直接写入持仓台账的价格向量
+                trade_interface.update_prices(batch.codes, batch.price)
+                matcher.update(batch)
+                broker.rematch()
+                
                 # 获取账户信息
                 account_info = trade_interface.get_account_info()
                 
                 # 更新投资组合价值
-                current_prices = {latest_data['code']: latest_data['price']}
-                portfolio_value = money_manager.get_portfolio_value(current_prices)
+                portfolio_value = money_manager.get_portfolio_value()
                 risk_manager.update_portfolio_value(portfolio_value)
+                t = metrics.observe('mark', t)
                 
-                # 获取策略信号
-                # 这里需要将实时数据转换为策略可用的格式
-                data_df = pd.DataFrame([latest_data])
-                signals = strategy.ma_cross_strategy(data_df)
-                
-                # 检查是否有交易信号
-                if not signals.empty and signals['position'].iloc[-1] != 0:
-                    direction = 'buy' if signals['position'].iloc[-1] > 0 else 'sell'
+                for latest_data in batch.iter_quotes():
+                    # 获取策略信号（增量更新指标，每笔行情O(1)）
+                    position_change = signal_book.update(
+                        latest_data['code'], latest_data['price'], latest_data['timestamp']
+                    )
+                    t = metrics.observe('signal', t)
+                    
+                    # 检查是否有交易信号
+                    if position_change == 0:
+                        continue
+                    metrics.inc('signals')
+                    
+                    direction = 'buy' if position_change > 0 else 'sell'
                     price = latest_data['price']
                     
                     # 计算交易数量
                     volume = money_manager.calculate_position_size(
                         latest_data['code'], price
                     )
+                    t = metrics.observe('size', t)
                     
                     if volume > 0:
                         # 创建订单
@@ -179,8 +294,11 @@ def run_live_trading():
                         
                         # 风险检查
                         allowed, reason = risk_manager.check_order(order, account_info)
-                        if allowed:
-                            # 执行交易
+                        t = metrics.observe('risk', t)
+                        if not allowed:
+                            metrics.inc('risk_rejects')
+                        else:
+                            # 执行交易（异步提交，成交通过回调处理）
                             order_id = trade_interface.place_order(
                                 order['stock_code'],
                                 order['direction'],
@@ -188,26 +306,32 @@ def run_live_trading():
                                 order['volume']
                             )
                             
+                            t = metrics.observe('order', t)
                             if order_id:
-                                # 更新资金管理
-                                money_manager.update_position(
-                                    order['stock_code'],
-                                    order['direction'],
-                                    order['price'],
-                                    order['volume']
-                                )
-                                
-                                print(f"执行交易: {order}")
+                                metrics.inc('orders')
+                                if metrics.enabled:
+                                    metrics.record('tick_to_order', time.time_ns() - tick_time_ns)
+                                logger.debug("提交订单: %s", order_id)
+                            else:
+                                metrics.inc('order_errors')
                 
                 # 打印当前状态
-                performance = money_manager.get_performance_metrics(current_prices)
+                performance = money_manager.get_performance_metrics()
                 risk_metrics = risk_manager.get_risk_metrics()
+                feed_stats = realtime_data.get_stats()
+                metrics.set('feed_lag', feed_stats['last_lag'])
+                metrics.set('feed_dropped', feed_stats['dropped'])
+                metrics.set('open_orders', len(trade_interface.oms.get_open_orders()))
                 
-                print("\n当前状态:")
-                print(f"投资组合价值: {portfolio_value:,.2f}")
-                print(f"总收益率: {performance['total_return']:.2%}")
-                print(f"波动率: {risk_metrics.get('volatility', 0):.2%}")
-                print(f"夏普比率: {risk_metrics.get('sharpe_ratio', 0):.2f}")
+                logger.info(
+                    "当前状态: 投资组合价值 %.2f，总收益率 %.2f%%，波动率 %.2f%%，夏普比率 %.2f，行情延迟 %.2f秒，合并丢弃 %d条",
+                    portfolio_value, performance['total_return'] * 100, risk_metrics.get('volatility', 0) * 100,
+                    risk_metrics.get('sharpe_ratio', 0), feed_stats['last_lag'], feed_stats['dropped'],
+                    extra={'event': 'status', 'portfolio_value': portfolio_value,
+                           'total_return': performance['total_return'], 'feed_lag': feed_stats['last_lag']}
+                )
+                metrics.observe('update', t)
+                metrics.observe('loop', loop_start)
             
             time.sleep(update_interval)
             
@@ -215,6 +339,10 @@ def run_live_trading():
         print("\n停止交易...")
     finally:
         realtime_data.stop_fetching()
+        trade_interface.close()
+        trade_interface.process_events()
+        if exporter is not None:
+            exporter.stop()
         
         # 打印最终统计信息
         trade_stats = money_manager.get_trade_statistics()
@@ -228,12 +356,15 @@ if __name__ == "__main__":
     print("请选择运行模式：")
     print("1. 回测模式")
     print("2. 实盘交易模式")
+    print("3. 参数优化模式")
     
-    choice = input("请输入选择（1或2）：")
+    choice = input("请输入选择（1、2或3）：")
     
     if choice == "1":
         run_backtest()
     elif choice == "2":
         run_live_trading()
+    elif choice == "3":
+        run_optimization()
     else:
         print("无效的选择") 
\ No newline at end of file
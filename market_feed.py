@@ -0,0 +1,246 @@
+import os
+import re
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from realtime_data import QuoteBatch, QuoteBuffer, QUOTE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+class FeedSource(ABC):
+    """
+    行情源接口：batches() 是一个异步生成器，每次产出一个 QuoteBatch
+    """
+    name = 'base'
+
+    @abstractmethod
+    async def batches(self):
+        pass
+
+class AkshareSource(FeedSource):
+    name = 'akshare'
+
+    def __init__(self, stock_codes, update_interval=3):
+        """
+        轮询 ak.stock_zh_a_spot_em() 的实时行情源
+        :param stock_codes: 订阅的股票代码列表
+        :param update_interval: 轮询间隔（秒）
+        """
+        self.stock_codes = stock_codes
+        self.update_interval = update_interval
+
+    async def batches(self):
+        import akshare as ak
+        while True:
+            try:
+                # 阻塞的网络请求放到线程池里执行，不阻塞事件循环
+                snapshot = await asyncio.get_running_loop().run_in_executor(None, ak.stock_zh_a_spot_em)
+                yield QuoteBatch.from_snapshot(_ensure_quote_columns(snapshot), self.stock_codes)
+            except Exception as e:
+                logger.warning("获取实时数据时出错: %s", e)
+            await asyncio.sleep(self.update_interval)
+
+class ReplaySource(FeedSource):
+    name = 'replay'
+
+    def __init__(self, paths, stock_codes=None, speed=None, interval=0.0):
+        """
+        回放本地保存的行情快照（stock_market.save_to_csv 保存的CSV，或Parquet文件）
+        :param paths: 文件路径列表，或包含快照文件的目录
+        :param stock_codes: 订阅的股票代码列表，None表示快照中的全部股票
+        :param speed: 按快照之间的真实时间间隔回放的倍速，None表示不按真实间隔
+        :param interval: speed为None时每个快照之间的固定间隔（秒），0表示尽快回放
+        """
+        if isinstance(paths, str) and os.path.isdir(paths):
+            paths = [
+                os.path.join(paths, name) for name in os.listdir(paths)
+                if name.endswith(('.csv', '.parquet'))
+            ]
+        self.paths = sorted(paths, key=_snapshot_time)
+        self.stock_codes = stock_codes
+        self.speed = speed
+        self.interval = interval
+
+    async def batches(self):
+        previous_time = None
+        for path in self.paths:
+            snapshot_time = _snapshot_time(path)
+            if self.speed and previous_time is not None:
+                await asyncio.sleep(max(0.0, (snapshot_time - previous_time).total_seconds() / self.speed))
+            elif self.interval:
+                await asyncio.sleep(self.interval)
+            previous_time = snapshot_time
+
+            snapshot = await asyncio.get_running_loop().run_in_executor(None, _read_snapshot, path)
+            codes = self.stock_codes if self.stock_codes is not None else snapshot['代码'].tolist()
+            yield QuoteBatch.from_snapshot(_ensure_quote_columns(snapshot), codes, timestamp=snapshot_time)
+
+class SyntheticSource(FeedSource):
+    name = 'synthetic'
+
+    def __init__(self, stock_codes, rate=10.0, n_batches=None, volatility=0.001, seed=None):
+        """
+        随机游走生成的模拟行情，用于离线高频测试
+        :param stock_codes: 股票代码列表
+        :param rate: 每秒产生的批次数，None表示不等待
+        :param n_batches: 产生的批次总数，None表示无限
+        :param volatility: 每个批次价格变动的标准差（对数收益率）
+        :param seed: 随机种子
+        """
+        self.stock_codes = np.asarray(stock_codes, dtype=object)
+        self.rate = rate
+        self.n_batches = n_batches
+        self.volatility = volatility
+        self.rng = np.random.default_rng(seed)
+
+    async def batches(self):
+        n = len(self.stock_codes)
+        price = self.rng.uniform(5.0, 100.0, n)
+        prev_close = price.copy()
+        volume = np.zeros(n)
+        amount = np.zeros(n)
+        count = 0
+        while self.n_batches is None or count < self.n_batches:
+            price = np.round(price * np.exp(self.rng.normal(0.0, self.volatility, n)), 2)
+            price = np.clip(price, np.round(prev_close * 0.9, 2), np.round(prev_close * 1.1, 2))  # 涨跌停
+            traded = self.rng.integers(0, 100, n) * 100.0
+            volume += traded
+            amount += traded * price
+            yield QuoteBatch(
+                datetime.now(), self.stock_codes,
+                price=price, volume=volume.copy(), amount=amount.copy(),
+                bid_price=price - 0.01, ask_price=price + 0.01,
+                bid_volume=self.rng.integers(1, 500, n) * 100.0,
+                ask_volume=self.rng.integers(1, 500, n) * 100.0,
+                prev_close=prev_close
+            )
+            count += 1
+            await asyncio.sleep(1.0 / self.rate if self.rate else 0)
+
+class Subscription:
+    def __init__(self, max_batches=16):
+        """
+        单个消费者的订阅，内部为按股票合并的有界缓冲区
+        """
+        self.buffer = QuoteBuffer(max_batches)
+        # 在第一次 get() 时于运行中的事件循环内创建（Python 3.8/3.9 的Event创建时即绑定事件循环，
+        # 在 asyncio.run 之前订阅会绑定到另一个事件循环）
+        self._event = None
+        self.closed = False
+
+    def _publish(self, batch):
+        self.buffer.put(batch)
+        if self._event is not None:
+            self._event.set()
+
+    def _close(self):
+        self.closed = True
+        if self._event is not None:
+            self._event.set()
+
+    async def get(self):
+        """
+        等待并取出自上次读取以来每只股票的最新行情
+        :return: QuoteBatch，行情源结束后返回None
+        """
+        while True:
+            batch = self.buffer.get()
+            if batch is not None:
+                return batch
+            if self.closed:
+                return None
+            if self._event is None:
+                self._event = asyncio.Event()
+            self._event.clear()
+            await self._event.wait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        batch = await self.get()
+        if batch is None:
+            raise StopAsyncIteration
+        return batch
+
+class MarketFeed:
+    def __init__(self, source, detect_changes=True):
+        """
+        行情分发中心：一个行情源，多个订阅者
+        :param source: FeedSource 实例
+        :param detect_changes: 是否只分发与上次快照相比有变化的股票
+        """
+        self.source = source
+        self.detect_changes = detect_changes
+        self.subscriptions = []
+        self.batches_received = 0
+        self._last_batch = None
+
+    def subscribe(self, max_batches=16):
+        """
+        新增订阅者
+        :return: Subscription
+        """
+        subscription = Subscription(max_batches)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        取消订阅
+        """
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+            subscription._close()
+
+    async def run(self):
+        """
+        从行情源读取数据并分发给所有订阅者，行情源结束后关闭所有订阅
+        """
+        try:
+            async for batch in self.source.batches():
+                self.batches_received += 1
+                if self.detect_changes:
+                    changed = batch.changed_since(self._last_batch)
+                    self._last_batch = batch
+                    if not changed.any():
+                        continue
+                    if not changed.all():
+                        batch = batch.take(changed)
+                for subscription in self.subscriptions:
+                    subscription._publish(batch)
+        finally:
+            for subscription in self.subscriptions:
+                subscription._close()
+
+def _ensure_quote_columns(snapshot):
+    """
+    快照缺少盘口字段时补为空值
+    """
+    missing = [col for col in QUOTE_COLUMNS if col not in snapshot.columns]
+    if missing:
+        snapshot = snapshot.assign(**{col: np.nan for col in missing})
+    return snapshot
+
+def _read_snapshot(path):
+    """
+    读取一个快照文件
+    """
+    if path.endswith('.parquet'):
+        snapshot = pd.read_parquet(path)
+    else:
+        snapshot = pd.read_csv(path, encoding='utf-8-sig', dtype={'代码': str})
+    snapshot['代码'] = snapshot['代码'].astype(str).str.zfill(6)
+    return snapshot
+
+def _snapshot_time(path):
+    """
+    从文件名（如 stock_data_20250430_085641.csv）解析快照时间，解析失败时使用文件修改时间
+    """
+    match = re.search(r'(\d{8})_(\d{6})', os.path.basename(path))
+    if match:
+        return datetime.strptime(''.join(match.groups()), '%Y%m%d%H%M%S')
+    return datetime.fromtimestamp(os.path.getmtime(path))
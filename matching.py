@@ -0,0 +1,215 @@
+import threading
+import numpy as np
+
+LOT_SIZE = 100
+
+# 撮合结果代码
+MATCH_FILLED = 0
+MATCH_PARTIAL = 1
+MATCH_NO_FILL = 2
+MATCH_LIMIT_LOCKED = 3
+MATCH_REJECT_PRICE = 4
+MATCH_REJECT_LOT = 5
+
+MATCH_MESSAGES = {
+    MATCH_FILLED: "全部成交",
+    MATCH_PARTIAL: "部分成交",
+    MATCH_NO_FILL: "委托价未达到对手价，等待成交",
+    MATCH_LIMIT_LOCKED: "涨停无法买入或跌停无法卖出",
+    MATCH_REJECT_PRICE: "委托价超出涨跌停价格范围",
+    MATCH_REJECT_LOT: "买入数量必须是100股的整数倍"
+}
+
+def price_limit_pct(codes):
+    """
+    按股票代码确定涨跌幅限制：创业板（300/301）和科创板（688/689）为20%，北交所为30%，其余为10%
+    :param codes: 股票代码数组
+    :return: float64数组
+    """
+    codes = np.asarray(codes).astype(str)
+    starts = lambda prefix: np.char.startswith(codes, prefix)
+    pct = np.full(len(codes), 0.10)
+    pct[starts('300') | starts('301') | starts('688') | starts('689')] = 0.20
+    pct[starts('8') | starts('4') | starts('92')] = 0.30
+    return pct
+
+def limit_prices(prev_close, pct):
+    """
+    涨停价、跌停价（四舍五入到分）
+    :return: (up, down)，昨收无效时为NaN
+    """
+    prev_close = np.where(prev_close > 0, prev_close, np.nan)
+    return np.round(prev_close * (1 + pct) + 1e-9, 2), np.round(prev_close * (1 - pct) + 1e-9, 2)
+
+class MatchingSimulator:
+    def __init__(self, commission_rate=0.00025, min_commission=5.0, stamp_duty_rate=0.0005,
+                 transfer_fee_rate=0.00001, slippage=0.0, participation=1.0):
+        """
+        A股模拟撮合：按对手价和挂单量成交，支持部分成交、100股整数倍、涨跌停和交易费用
+        所有计算按订单数组向量化，可用于实盘模拟和全市场回放
+        :param commission_rate: 佣金费率（双向）
+        :param min_commission: 单笔最低佣金
+        :param stamp_duty_rate: 印花税率（仅卖出）
+        :param transfer_fee_rate: 过户费率（双向）
+        :param slippage: 在对手价基础上的滑点比例（不会超过委托价）
+        :param participation: 单次撮合最多吃掉对手挂单量的比例
+        """
+        self.commission_rate = commission_rate
+        self.min_commission = min_commission
+        self.stamp_duty_rate = stamp_duty_rate
+        self.transfer_fee_rate = transfer_fee_rate
+        self.slippage = slippage
+        self.participation = participation
+
+    def fees(self, sides, prices, volumes):
+        """
+        交易费用 = 佣金（不低于最低佣金）+ 过户费 + 印花税（卖出）
+        :param sides: 1买入，-1卖出
+        :param prices: 成交价格
+        :param volumes: 成交数量，为0的订单费用为0
+        :return: float64数组
+        """
+        sides = np.asarray(sides)
+        value = np.asarray(prices, dtype=np.float64) * np.asarray(volumes, dtype=np.float64)
+        commission = np.maximum(value * self.commission_rate, self.min_commission)
+        fee = commission + value * self.transfer_fee_rate + np.where(sides < 0, value * self.stamp_duty_rate, 0.0)
+        return np.where(value > 0, fee, 0.0)
+
+    def fee(self, direction, price, volume):
+        """
+        单笔交易费用（标量版本，供逐笔回测使用）
+        """
+        value = price * volume
+        if value <= 0:
+            return 0.0
+        fee = max(value * self.commission_rate, self.min_commission) + value * self.transfer_fee_rate
+        if direction == 'sell':
+            fee += value * self.stamp_duty_rate
+        return fee
+
+    def execution_price(self, direction, price):
+        """
+        加上滑点后的成交价（标量版本）
+        """
+        side = 1.0 if direction == 'buy' else -1.0
+        return round(price * (1 + side * self.slippage), 2)
+
+    def limit_locks(self, prices, codes):
+        """
+        全市场回放时一次算出每根K线是否涨停、跌停
+        :param prices: 收盘价矩阵（时间×股票）
+        :param codes: 股票代码（与列对应）
+        :return: (up_locked, down_locked) 布尔矩阵，涨停时不能买入，跌停时不能卖出
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        prev_close = np.vstack([np.full((1, prices.shape[1]), np.nan), prices[:-1]])
+        up, down = limit_prices(prev_close, price_limit_pct(codes)[None, :])
+        with np.errstate(invalid='ignore'):
+            return prices >= up - 1e-9, prices <= down + 1e-9
+
+    def match(self, codes, sides, limit_prices_, volumes, bid_price, ask_price,
+              bid_volume, ask_volume, last_price=None, prev_close=None):
+        """
+        撮合一批限价委托（每个订单对应一行行情）
+        买单按卖一价、卖一量成交，卖单按买一价、买一量成交；
+        盘口缺失时按最新价成交且不限数量；买入数量向下取整到100股，卖出剩余零股可一次卖出
+        :param codes: 股票代码
+        :param sides: 1买入，-1卖出
+        :param limit_prices_: 委托价格
+        :param volumes: 委托（剩余）数量
+        :param bid_price, ask_price, bid_volume, ask_volume: 买一/卖一价格和挂单量（股，QuoteBatch 已由手换算为股）
+        :param last_price: 最新价，None表示没有
+        :param prev_close: 昨收价，None表示不检查涨跌停
+        :return: (fill_price, fill_volume, fee, status) 四个数组，status见 MATCH_MESSAGES
+        """
+        sides = np.asarray(sides, dtype=np.float64)
+        limit_px = np.asarray(limit_prices_, dtype=np.float64)
+        volumes = np.asarray(volumes, dtype=np.float64)
+        n = len(sides)
+        last_price = np.full(n, np.nan) if last_price is None else np.asarray(last_price, dtype=np.float64)
+        prev_close = np.full(n, np.nan) if prev_close is None else np.asarray(prev_close, dtype=np.float64)
+        is_buy = sides > 0
+
+        # 对手方盘口，缺失时退回最新价
+        quote_px = np.where(is_buy, ask_price, bid_price).astype(np.float64)
+        quote_vol = np.where(is_buy, ask_volume, bid_volume).astype(np.float64)
+        no_book = ~(quote_px > 0)
+        quote_px = np.where(no_book, last_price, quote_px)
+        quote_vol = np.where(no_book | ~(quote_vol >= 0), np.inf, quote_vol)
+
+        up, down = limit_prices(prev_close, price_limit_pct(codes))
+        status = np.full(n, MATCH_NO_FILL, dtype=np.int8)
+        with np.errstate(invalid='ignore'):
+            status[is_buy & (volumes % LOT_SIZE != 0)] = MATCH_REJECT_LOT
+            status[(limit_px > up + 1e-9) | (limit_px < down - 1e-9)] = MATCH_REJECT_PRICE
+            # 涨停时卖一为空（最新价在涨停价），跌停时买一为空
+            locked = np.where(is_buy, last_price >= up - 1e-9, last_price <= down + 1e-9) & no_book
+            status[(status == MATCH_NO_FILL) & locked] = MATCH_LIMIT_LOCKED
+            marketable = (status == MATCH_NO_FILL) & (quote_px > 0) & (sides * (limit_px - quote_px) >= 0)
+
+        # 成交价：对手价加滑点，不劣于委托价，不超出涨跌停
+        fill_price = np.round(quote_px * (1 + sides * self.slippage), 2)
+        fill_price = np.where(is_buy, np.minimum(fill_price, limit_px), np.maximum(fill_price, limit_px))
+        fill_price = np.clip(fill_price, np.where(np.isnan(down), -np.inf, down), np.where(np.isnan(up), np.inf, up))
+
+        available = np.floor(quote_vol * self.participation)
+        fill_volume = np.minimum(volumes, available)
+        lots = np.floor(fill_volume / LOT_SIZE) * LOT_SIZE
+        fill_volume = np.where(~is_buy & (fill_volume >= volumes), volumes, lots)
+        fill_volume = np.where(marketable, fill_volume, 0.0)
+
+        filled = fill_volume > 0
+        status[filled] = np.where(fill_volume[filled] >= volumes[filled], MATCH_FILLED, MATCH_PARTIAL)
+        fill_price = np.where(filled, fill_price, np.nan)
+        return fill_price, fill_volume.astype(np.int64), self.fees(sides, np.nan_to_num(fill_price), fill_volume), status
+
+class QuoteBookMatcher:
+    def __init__(self, simulator=None):
+        """
+        实盘模拟用的撮合函数：保存每只股票最新的盘口，供 SimulatedBroker 撮合挂单
+        同一笔盘口被吃掉的数量会扣除，直到下一次行情更新
+        :param simulator: MatchingSimulator 实例
+        """
+        self.simulator = simulator or MatchingSimulator()
+        self.book = {}  # 股票代码 -> [买一价, 卖一价, 买一剩余量, 卖一剩余量, 最新价, 昨收]
+        self._lock = threading.Lock()
+
+    def update(self, batch):
+        """
+        用实时行情批次更新盘口
+        :param batch: QuoteBatch
+        """
+        rows = zip(batch.codes, batch.bid_price.tolist(), batch.ask_price.tolist(),
+                   batch.bid_volume.tolist(), batch.ask_volume.tolist(),
+                   batch.price.tolist(), batch.prev_close.tolist())
+        with self._lock:
+            for code, *quote in rows:
+                self.book[code] = quote
+
+    def __call__(self, order, remaining):
+        """
+        撮合一个挂单
+        :return: [(成交价, 成交量, 费用)]，委托无效时抛出ValueError
+        """
+        with self._lock:
+            quote = self.book.get(order['stock_code'])
+            if quote is None:
+                return []
+            bid, ask, bid_volume, ask_volume, last, prev_close = quote
+            side = 1 if order['direction'] == 'buy' else -1
+            price, volume, fee, status = self.simulator.match(
+                [order['stock_code']], [side], [order['price']], [remaining],
+                [bid], [ask], [bid_volume], [ask_volume], [last], [prev_close]
+            )
+            status = int(status[0])
+            if status in (MATCH_REJECT_PRICE, MATCH_REJECT_LOT):
+                raise ValueError(MATCH_MESSAGES[status])
+            volume = int(volume[0])
+            if volume <= 0:
+                return []
+            # 扣除已被吃掉的对手盘
+            if side > 0 and ask_volume == ask_volume:
+                quote[3] = max(0.0, ask_volume - volume)
+            elif side < 0 and bid_volume == bid_volume:
+                quote[2] = max(0.0, bid_volume - volume)
+            return [(float(price[0]), volume, float(fee[0]))]
@@ -0,0 +1,244 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# 对数-线性分桶：每个2的幂区间再分为64个子桶，相对误差约1.5%
+_SUB_BITS = 7
+_HALF = 1 << (_SUB_BITS - 1)
+_MAX_SHIFT = 40
+
+class LatencyHistogram:
+    def __init__(self):
+        """
+        HDR风格的延迟直方图（纳秒），记录O(1)，分位数按桶计算
+        可记录 0 到约2^47纳秒（约39小时）的值，超出的记入单独的溢出桶（最后一个元素），
+        落在溢出桶的分位数按记录到的最大值计
+        """
+        self.counts = [0] * ((_MAX_SHIFT + 2) * _HALF + 1)
+        self.overflow = 0
+        self.count = 0
+        self.total = 0
+        self.min = 1 << 62
+        self.max = 0
+
+    def record(self, value_ns):
+        """
+        记录一个值（纳秒）
+        """
+        value_ns = int(value_ns) if value_ns > 0 else 0
+        shift = value_ns.bit_length() - _SUB_BITS
+        if shift <= 0:
+            self.counts[value_ns] += 1
+        elif shift <= _MAX_SHIFT:
+            self.counts[shift * _HALF + (value_ns >> shift)] += 1
+        else:
+            self.counts[-1] += 1
+            self.overflow += 1
+        self.count += 1
+        self.total += value_ns
+        if value_ns < self.min:
+            self.min = value_ns
+        if value_ns > self.max:
+            self.max = value_ns
+
+    @staticmethod
+    def _bucket_value(index):
+        """
+        桶的代表值（区间中点）
+        """
+        if index < 2 * _HALF:
+            return float(index)
+        shift = index // _HALF - 1
+        mantissa = index - shift * _HALF
+        return float((mantissa << shift) + (1 << (shift - 1)))
+
+    def percentiles(self, qs=(0.5, 0.9, 0.99, 0.999)):
+        """
+        :param qs: 分位点
+        :return: list 各分位数（纳秒）
+        """
+        if self.count == 0:
+            return [0.0] * len(qs)
+        cumulative = np.cumsum(np.array(self.counts))
+        indices = np.searchsorted(cumulative, [max(1, int(np.ceil(q * self.count))) for q in qs])
+        overflow_index = len(self.counts) - 1
+        return [
+            float(self.max) if i == overflow_index else min(self._bucket_value(int(i)), float(self.max))
+            for i in indices
+        ]
+
+    def snapshot(self):
+        """
+        统计摘要（微秒）
+        """
+        p50, p90, p99, p999 = self.percentiles()
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count / 1e3 if self.count else 0.0,
+            'min_us': (self.min if self.count else 0) / 1e3,
+            'p50_us': p50 / 1e3,
+            'p90_us': p90 / 1e3,
+            'p99_us': p99 / 1e3,
+            'p999_us': p999 / 1e3,
+            'max_us': self.max / 1e3,
+            'overflow': self.overflow
+        }
+
+    def reset(self):
+        self.__init__()
+
+class Metrics:
+    enabled = True
+
+    def __init__(self):
+        """
+        交易循环的性能指标：各阶段延迟直方图、计数器、瞬时值
+        用法：t0 = metrics.now(); ...; metrics.observe('signal', t0)
+        """
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+
+    now = staticmethod(time.perf_counter_ns)
+
+    def observe(self, name, start_ns):
+        """
+        记录从 start_ns（metrics.now() 的返回值）到现在的耗时
+        :return: 当前时间（可作为下一阶段的起点）
+        """
+        end = time.perf_counter_ns()
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(end - start_ns)
+        return end
+
+    def record(self, name, value_ns):
+        """
+        直接记录一个延迟值（纳秒）
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(value_ns)
+
+    def inc(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def snapshot(self):
+        """
+        :return: dict 所有指标的当前值（在导出线程中调用，读取时不加锁，个别计数可能相差一次记录）
+        """
+        return {
+            'timestamp': time.time(),
+            'uptime': time.time() - self.started,
+            'latency': {name: h.snapshot() for name, h in list(self.histograms.items())},
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges)
+        }
+
+class NullMetrics:
+    """
+    关闭统计时使用：所有方法都是空操作
+    """
+    enabled = False
+
+    @staticmethod
+    def now():
+        return 0
+
+    def observe(self, name, start_ns):
+        return 0
+
+    def record(self, name, value_ns):
+        pass
+
+    def inc(self, name, n=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def snapshot(self):
+        return {}
+
+NULL_METRICS = NullMetrics()
+
+class MetricsExporter:
+    def __init__(self, metrics, path=None, port=None, interval=10.0, host='127.0.0.1'):
+        """
+        定期把指标快照写入本地JSON文件，和/或通过本地HTTP端点提供（GET /metrics）
+        :param metrics: Metrics 实例
+        :param path: 快照文件路径，None表示不写文件
+        :param port: HTTP端口，None表示不启动HTTP服务
+        :param interval: 写文件的间隔（秒）
+        :param host: HTTP监听地址，默认只监听本机
+        """
+        self.metrics = metrics
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.host = host
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        if self.path:
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+        if self.port is not None:
+            metrics = self.metrics
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.rstrip('/') not in ('', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+            self.port = self._server.server_address[1]
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def write(self):
+        """
+        写一次快照（先写临时文件再替换，读取方不会看到写了一半的文件）
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.metrics.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                pass
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self.write()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -1,19 +1,19 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from position_ledger import PositionLedger
 
 class MoneyManager:
-    def __init__(self, initial_capital=1000000.0):
+    def __init__(self, initial_capital=1000000.0, ledger=None):
         """
         初始化资金管理器
         :param initial_capital: 初始资金
+        :param ledger: 持仓台账（PositionLedger），与风险管理器、交易接口共用同一个实例
         """
         self.initial_capital = initial_capital
         self.current_capital = initial_capital
-        self.positions = {}  # 当前持仓
-        self.trade_history = []  # 交易历史
-        self.cash_history = []  # 现金历史
-        self.position_history = []  # 持仓历史
+        self.ledger = ledger if ledger is not None else PositionLedger()
+        self.journal = TradeJournal()  # 交易流水（列式存储，记录持仓增量和成交后现金）
     
     def calculate_position_size(self, stock_code, price, risk_per_trade=0.02):
         """
@@ -31,89 +31,109 @@ class MoneyManager:
         
         return max(0, shares)
     
-    def update_position(self, stock_code, direction, price, volume):
+    @property
+    def positions(self):
+        """
+        当前持仓 {stock_code: 数量}（来自持仓台账）
+        """
+        return self.ledger.positions_dict()
+    
+    def update_position(self, stock_code, direction, price, volume, fee=0.0, timestamp=None, record_fill=True):
         """
         更新持仓信息
         :param stock_code: 股票代码
         :param direction: 交易方向 ('buy' 或 'sell')
         :param price: 价格
         :param volume: 数量
+        :param fee: 交易费用
+        :param timestamp: 成交时间，None表示当前时间（回测时传入K线时间）
+        :param record_fill: 是否把成交记入持仓台账；交易接口已经记录过时传False，避免重复记账
         """
         trade_value = price * volume
+        timestamp = timestamp or datetime.now()
         
         if direction == 'buy':
-            self.current_capital -= trade_value
-            if stock_code not in self.positions:
-                self.positions[stock_code] = 0
-            self.positions[stock_code] += volume
+            self.current_capital -= trade_value + fee
         else:  # sell
-            self.current_capital += trade_value
-            if stock_code in self.positions:
-                self.positions[stock_code] -= volume
-                if self.positions[stock_code] == 0:
-                    del self.positions[stock_code]
+            self.current_capital += trade_value - fee
+        if record_fill:
+            self.ledger.apply_fill(stock_code, direction, price, volume, fee, timestamp)
         
         # 记录交易
-        trade = {
-            'timestamp': datetime.now(),
-            'stock_code': stock_code,
-            'direction': direction,
-            'price': price,
-            'volume': volume,
-            'value': trade_value
-        }
-        self.trade_history.append(trade)
-        
-        # 更新历史记录
-        self._update_history()
+        self.journal.append(timestamp, stock_code, direction, price, volume, fee, self.current_capital)
     
-    def _update_history(self):
+    @property
+    def trade_history(self):
         """
-        更新历史记录
+        交易历史：每笔成交一个dict（timestamp、stock_code、direction、price、volume、value、fee），按需由交易流水生成
         """
-        self.cash_history.append({
-            'timestamp': datetime.now(),
-            'cash': self.current_capital
-        })
-        
-        self.position_history.append({
-            'timestamp': datetime.now(),
-            'positions': self.positions.copy()
-        })
+        return self.trade_frame().to_dict('records')
+    
+    @property
+    def cash_history(self):
+        """
+        现金历史：每笔成交后一个dict（timestamp、cash）
+        """
+        return self.cash_frame().to_dict('records')
+    
+    @property
+    def position_history(self):
+        """
+        持仓历史：每笔成交后一个dict（timestamp、positions为成交后的持仓快照）
+        """
+        frame = self.position_frame()
+        history = []
+        positions = {}
+        for timestamp, stock_code, position in zip(frame['timestamp'], frame['stock_code'], frame['position'].tolist()):
+            if position:
+                positions[stock_code] = position
+            else:
+                positions.pop(stock_code, None)
+            history.append({'timestamp': timestamp, 'positions': positions.copy()})
+        return history
+    
+    def trade_frame(self):
+        """
+        交易历史（DataFrame）
+        """
+        return self.journal.to_frame()[['timestamp', 'stock_code', 'direction', 'price', 'volume', 'value', 'fee']]
+    
+    def cash_frame(self):
+        """
+        现金历史（DataFrame，每笔成交后的现金）
+        """
+        return self.journal.to_frame()[['timestamp', 'cash']]
     
-    def get_portfolio_value(self, current_prices):
+    def position_frame(self):
         """
-        计算当前投资组合价值
-        :param current_prices: 当前价格字典 {stock_code: price}
+        持仓变化（DataFrame，每笔成交的持仓增量delta及成交后该股票的持仓position）
+        """
+        return self.journal.position_frame()
+    
+    def get_portfolio_value(self, current_prices=None):
+        """
+        计算当前投资组合价值（持仓数量向量与最新价向量的点积）
+        :param current_prices: 当前价格字典 {stock_code: price}，None表示使用台账中已有的最新价
         :return: float 投资组合总价值
         """
-        position_value = sum(
-            self.positions.get(code, 0) * price
-            for code, price in current_prices.items()
-        )
-        return self.current_capital + position_value
+        if current_prices:
+            self.ledger.mark_many(list(current_prices.keys()), list(current_prices.values()))
+        return self.current_capital + self.ledger.market_value()
     
-    def get_performance_metrics(self, current_prices):
+    def get_performance_metrics(self, current_prices=None):
         """
         计算投资组合表现指标
-        :param current_prices: 当前价格字典
+        :param current_prices: 当前价格字典，None表示使用台账中已有的最新价
         :return: dict 表现指标
         """
         portfolio_value = self.get_portfolio_value(current_prices)
         total_return = (portfolio_value - self.initial_capital) / self.initial_capital
         
-        # 计算持仓分布
-        position_distribution = {}
-        for code, volume in self.positions.items():
-            if code in current_prices:
-                value = volume * current_prices[code]
-                position_distribution[code] = value / portfolio_value
-        
         return {
             'total_return': total_return,
             'current_capital': self.current_capital,
             'position_value': portfolio_value - self.current_capital,
-            'position_distribution': position_distribution
+            'position_distribution': self.ledger.weights(portfolio_value)  # 持仓分布
         }
     
     def get_trade_statistics(self):
@@ -121,18 +141,132 @@ class MoneyManager:
         获取交易统计信息
         :return: dict 交易统计
         """
-        if not self.trade_history:
-            return {}
+        return self.journal.get_statistics()
+
+class TradeJournal:
+    def __init__(self, capacity=1024):
+        """
+        列式交易流水：每列一个定长数组，容量不足时倍增
+        时间戳存为int64纳秒，股票代码驻留为整数编号，持仓只记录每笔成交的增量
+        同时维护成交笔数、成交量、成交额等累计值，统计查询O(1)
+        :param capacity: 初始容量
+        """
+        self.code_index = {}  # 股票代码 -> 编号
+        self.codes = []
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._code_ids = np.empty(capacity, dtype=np.int32)
+        self._deltas = np.empty(capacity, dtype=np.int64)    # 持仓变化（买入为正，卖出为负）
+        self._prices = np.empty(capacity, dtype=np.float64)
+        self._fees = np.empty(capacity, dtype=np.float64)
+        self._cash = np.empty(capacity, dtype=np.float64)    # 成交后的现金
+        self._size = 0
         
-        df = pd.DataFrame(self.trade_history)
+        # 累计值
+        self.buy_trades = 0
+        self.sell_trades = 0
+        self.total_volume = 0
+        self.total_value = 0.0
+        self.total_fee = 0.0
+    
+    def _grow(self):
+        """
+        所有列容量倍增
+        """
+        for name in ('_timestamps', '_code_ids', '_deltas', '_prices', '_fees', '_cash'):
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate([column, np.empty_like(column)]))
+    
+    def append(self, timestamp, stock_code, direction, price, volume, fee, cash):
+        """
+        记录一笔成交
+        :param timestamp: 成交时间（datetime）
+        :param stock_code: 股票代码
+        :param direction: 'buy' 或 'sell'
+        :param price: 成交价格
+        :param volume: 成交数量
+        :param fee: 交易费用
+        :param cash: 成交后的现金
+        """
+        if self._size == len(self._prices):
+            self._grow()
+        code_id = self.code_index.get(stock_code)
+        if code_id is None:
+            code_id = self.code_index[stock_code] = len(self.codes)
+            self.codes.append(stock_code)
         
-        stats = {
-            'total_trades': len(df),
-            'buy_trades': len(df[df['direction'] == 'buy']),
-            'sell_trades': len(df[df['direction'] == 'sell']),
-            'total_volume': df['volume'].sum(),
-            'total_value': df['value'].sum(),
-            'avg_trade_value': df['value'].mean()
-        }
+        i = self._size
+        self._timestamps[i] = np.datetime64(timestamp, 'ns').astype(np.int64)
+        self._code_ids[i] = code_id
+        self._deltas[i] = volume if direction == 'buy' else -volume
+        self._prices[i] = price
+        self._fees[i] = fee
+        self._cash[i] = cash
+        self._size += 1
         
-        return stats 
\ No newline at end of file
+        if direction == 'buy':
+            self.buy_trades += 1
+        else:
+            self.sell_trades += 1
+        self.total_volume += volume
+        self.total_value += price * volume
+        self.total_fee += fee
+    
+    def __len__(self):
+        return self._size
+    
+    def get_statistics(self):
+        """
+        交易统计（由累计值直接得出）
+        :return: dict 交易统计，没有交易时为空
+        """
+        if self._size == 0:
+            return {}
+        return {
+            'total_trades': self._size,
+            'buy_trades': self.buy_trades,
+            'sell_trades': self.sell_trades,
+            'total_volume': self.total_volume,
+            'total_value': self.total_value,
+            'avg_trade_value': self.total_value / self._size
+        }
+    
+    def to_frame(self):
+        """
+        转换为DataFrame
+        """
+        n = self._size
+        deltas = self._deltas[:n]
+        volumes = np.abs(deltas)
+        return pd.DataFrame({
+            'timestamp': self._timestamps[:n].view('datetime64[ns]'),
+            'stock_code': np.asarray(self.codes, dtype=object)[self._code_ids[:n]],
+            'direction': np.where(deltas > 0, 'buy', 'sell'),
+            'price': self._prices[:n],
+            'volume': volumes,
+            'value': self._prices[:n] * volumes,
+            'fee': self._fees[:n],
+            'cash': self._cash[:n]
+        })
+    
+    def position_frame(self):
+        """
+        持仓历史：每笔成交的持仓变化，以及累加得到的成交后该股票持仓
+        （只包含本流水记录的成交，从零开始累加）
+        """
+        n = self._size
+        code_ids = self._code_ids[:n]
+        deltas = self._deltas[:n]
+        # 按股票稳定排序后分组累加，再还原为成交顺序
+        order = np.argsort(code_ids, kind='stable')
+        cumulative = np.cumsum(deltas[order])
+        sorted_ids = code_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if n else np.empty(0, dtype=np.int64)
+        offsets = np.repeat(cumulative[starts] - deltas[order][starts], np.diff(np.r_[starts, n]))
+        position = np.empty(n, dtype=np.int64)
+        position[order] = cumulative - offsets
+        return pd.DataFrame({
+            'timestamp': self._timestamps[:n].view('datetime64[ns]'),
+            'stock_code': np.asarray(self.codes, dtype=object)[code_ids],
+            'delta': deltas,
+            'position': position
+        })
@@ -0,0 +1,260 @@
+import os
+import json
+import math
+import random
+import hashlib
+import sqlite3
+import itertools
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from vector_backtest import VectorBacktester
+
+# 工作进程内共享的价格矩阵
+_worker_state = {}
+
+class ParameterOptimizer:
+    def __init__(self, results_path='optimization_results.db', max_workers=None,
+                 initial_capital=100000.0, commission=0.0):
+        """
+        初始化参数优化器
+        :param results_path: 结果数据库文件（SQLite）
+        :param max_workers: 工作进程数，None表示使用全部CPU核心
+        :param initial_capital: 初始资金
+        :param commission: 单边交易成本比例
+        """
+        self.results_path = results_path
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.initial_capital = initial_capital
+        self.commission = commission
+        self._init_db()
+
+    def _init_db(self):
+        """
+        创建结果表
+        """
+        with sqlite3.connect(self.results_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    strategy TEXT,
+                    n_params INTEGER,
+                    n_symbols INTEGER,
+                    created_at TEXT
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    run_id TEXT,
+                    strategy TEXT,
+                    params TEXT,
+                    stock_code TEXT,
+                    annual_return REAL,
+                    max_drawdown REAL,
+                    sharpe_ratio REAL,
+                    total_return REAL,
+                    PRIMARY KEY (run_id, params, stock_code)
+                )
+            """)
+
+    def grid_search(self, prices, strategy_type, param_grid, run_id=None):
+        """
+        网格搜索
+        :param prices: 价格矩阵（DataFrame，日期×股票）
+        :param strategy_type: 'ma_cross' 或 'macd'
+        :param param_grid: 每个参数的取值列表，ma_cross为[shorts, longs]，macd为[fasts, slows, signals]
+        :param run_id: 运行ID，相同ID的任务中断后可以继续，None表示根据数据和参数自动生成
+        :return: DataFrame 按夏普比率排序的结果
+        """
+        params = list(itertools.product(*param_grid))
+        return self.run(prices, strategy_type, params, run_id)
+
+    def random_search(self, prices, strategy_type, param_ranges, n_iter=100, seed=None, run_id=None):
+        """
+        随机搜索
+        :param param_ranges: 每个参数的取值范围 [(low, high), ...]（闭区间整数）
+        :param n_iter: 采样次数（只计入第一个参数小于第二个参数的有效组合）
+        :param seed: 随机种子，固定种子才能在中断后继续
+        :return: DataFrame 按夏普比率排序的结果
+        """
+        rng = random.Random(seed)
+        params = set()
+        max_combinations = _count_valid_params(param_ranges)
+        while len(params) < min(n_iter, max_combinations):
+            p = tuple(rng.randint(low, high) for low, high in param_ranges)
+            if p[0] < p[1]:
+                params.add(p)
+        return self.run(prices, strategy_type, sorted(params), run_id)
+
+    def run(self, prices, strategy_type, params, run_id=None):
+        """
+        将参数组合分批分发到进程池计算，结果逐批写入数据库
+        价格矩阵通过共享内存传给工作进程，不会随每个任务重复序列化
+        :param prices: 价格矩阵（DataFrame，日期×股票）
+        :param strategy_type: 'ma_cross' 或 'macd'
+        :param params: 参数组合列表
+        :param run_id: 运行ID
+        :return: DataFrame 按夏普比率排序的结果
+        """
+        params = [tuple(int(v) for v in p) for p in params if p[0] < p[1]]
+        values = np.ascontiguousarray(prices.to_numpy(dtype=np.float64))
+        columns = [str(c) for c in prices.columns]
+        if run_id is None:
+            run_id = self._make_run_id(values, columns, strategy_type)
+
+        done = self._completed_params(run_id)
+        pending = [p for p in params if json.dumps(p) not in done]
+        print(f"参数组合共 {len(params)} 个，已完成 {len(params) - len(pending)} 个，待计算 {len(pending)} 个")
+
+        with sqlite3.connect(self.results_path) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO runs VALUES (?, ?, ?, ?, ?)",
+                (run_id, strategy_type, len(params), len(columns), datetime.now().isoformat())
+            )
+
+        if pending:
+            self._run_pool(values, columns, strategy_type, pending, run_id)
+
+        return self.get_results(run_id)
+
+    def _run_pool(self, values, columns, strategy_type, params, run_id):
+        """
+        在进程池中计算参数组合
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        try:
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+
+            # 每个进程分到若干批，既能均衡负载，又能让每批内部向量化计算
+            n_chunks = min(len(params), self.max_workers * 4)
+            chunks = [params[i::n_chunks] for i in range(n_chunks)]
+
+            with ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(shm.name, values.shape, columns, self.initial_capital, self.commission)
+            ) as executor:
+                futures = [executor.submit(_evaluate_chunk, strategy_type, chunk) for chunk in chunks]
+                finished = 0
+                for future in as_completed(futures):
+                    try:
+                        rows = future.result()
+                    except Exception as e:
+                        print(f"参数组合计算失败: {e}")
+                        continue
+                    self._save_rows(run_id, strategy_type, rows)
+                    finished += 1
+                    print(f"进度: {finished}/{len(chunks)}")
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _save_rows(self, run_id, strategy_type, rows):
+        """
+        写入一批结果
+        """
+        with sqlite3.connect(self.results_path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, strategy_type) + row for row in rows]
+            )
+
+    def _completed_params(self, run_id):
+        """
+        已完成的参数组合（用于断点续跑）
+        """
+        with sqlite3.connect(self.results_path) as conn:
+            cursor = conn.execute("SELECT DISTINCT params FROM results WHERE run_id = ?", (run_id,))
+            return {row[0] for row in cursor}
+
+    def _make_run_id(self, values, columns, strategy_type):
+        """
+        根据数据和回测设置生成运行ID
+        """
+        digest = hashlib.sha1(values.tobytes())
+        digest.update(json.dumps([columns, strategy_type, self.initial_capital, self.commission]).encode())
+        return digest.hexdigest()[:12]
+
+    def get_results(self, run_id, metric='sharpe_ratio', top_n=None):
+        """
+        查询结果，按参数组合汇总各股票的平均表现并排序
+        :param run_id: 运行ID
+        :param metric: 排序指标（sharpe_ratio、annual_return、max_drawdown、total_return）
+        :param top_n: 只返回前N个
+        :return: DataFrame
+        """
+        if metric not in ('sharpe_ratio', 'annual_return', 'max_drawdown', 'total_return'):
+            raise ValueError("不支持的排序指标")
+
+        query = f"""
+            SELECT params,
+                   AVG(annual_return) AS annual_return,
+                   AVG(max_drawdown) AS max_drawdown,
+                   AVG(sharpe_ratio) AS sharpe_ratio,
+                   AVG(total_return) AS total_return,
+                   COUNT(*) AS n_symbols
+            FROM results
+            WHERE run_id = ?
+            GROUP BY params
+            ORDER BY {metric} DESC
+        """
+        with sqlite3.connect(self.results_path) as conn:
+            df = pd.read_sql_query(query, conn, params=(run_id,))
+        df['params'] = df['params'].map(lambda p: tuple(json.loads(p)))
+        if top_n is not None:
+            df = df.head(top_n)
+        return df.reset_index(drop=True)
+
+def _count_valid_params(param_ranges):
+    """
+    有效参数组合的数量（第一个参数小于第二个参数，如短均线周期小于长均线周期）
+    :param param_ranges: 每个参数的取值范围 [(low, high), ...]
+    :return: int
+    """
+    (low0, high0), (low1, high1) = param_ranges[:2]
+    count = sum(max(0, high1 - max(low1, a + 1) + 1) for a in range(low0, high0 + 1))
+    for low, high in param_ranges[2:]:
+        count *= max(0, high - low + 1)
+    return count
+
+def _init_worker(shm_name, shape, columns, initial_capital, commission):
+    """
+    工作进程初始化：连接共享内存中的价格矩阵
+    """
+    # 工作进程与主进程共用resource_tracker，共享内存由主进程负责释放
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_state['shm'] = shm
+    _worker_state['prices'] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _worker_state['columns'] = columns
+    _worker_state['backtester'] = VectorBacktester(initial_capital, commission)
+
+def _evaluate_chunk(strategy_type, params):
+    """
+    在工作进程中计算一批参数组合
+    :return: list [(params_json, stock_code, annual_return, max_drawdown, sharpe_ratio, total_return), ...]
+    """
+    backtester = _worker_state['backtester']
+    result = backtester.run(_worker_state['prices'], strategy_type, params)
+    result['columns'] = _worker_state['columns']
+    summary = VectorBacktester.summarize(result)
+
+    rows = []
+    for record in summary.itertuples(index=False):
+        rows.append((
+            json.dumps(list(record.params)),
+            record.stock_code,
+            _to_db_float(record.annual_return),
+            _to_db_float(record.max_drawdown),
+            _to_db_float(record.sharpe_ratio),
+            _to_db_float(record.total_return)
+        ))
+    return rows
+
+def _to_db_float(value):
+    """
+    NaN写入数据库时存为NULL
+    """
+    value = float(value)
+    return None if math.isnan(value) else value
@@ -0,0 +1,374 @@
+import itertools
+import queue
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+# 订单状态
+ORDER_NEW = 'new'
+ORDER_PARTIAL = 'partially_filled'
+ORDER_FILLED = 'filled'
+ORDER_CANCELLED = 'cancelled'
+ORDER_REJECTED = 'rejected'
+
+OPEN_STATUSES = (ORDER_NEW, ORDER_PARTIAL)
+
+# 允许的状态转换
+TRANSITIONS = {
+    ORDER_NEW: (ORDER_PARTIAL, ORDER_FILLED, ORDER_CANCELLED, ORDER_REJECTED),
+    ORDER_PARTIAL: (ORDER_PARTIAL, ORDER_FILLED, ORDER_CANCELLED),
+    ORDER_FILLED: (),
+    ORDER_CANCELLED: (),
+    ORDER_REJECTED: ()
+}
+
+class BrokerAdapter(ABC):
+    """
+    券商接口适配器：submit/cancel/amend 只发送请求，不等待结果
+    执行结果通过 emit() 以事件的形式回报给订单管理器
+    事件格式：{'type': 'fill'|'cancelled'|'rejected'|'amended', 'order_id': ..., 其他字段}
+    """
+    name = 'base'
+
+    def __init__(self):
+        self._sink = None
+
+    def connect(self, sink):
+        """
+        :param sink: 接收事件的回调（OrderManager._on_broker_event）
+        """
+        self._sink = sink
+
+    def emit(self, event):
+        if self._sink is not None:
+            self._sink(event)
+
+    @abstractmethod
+    def submit(self, order):
+        pass
+
+    @abstractmethod
+    def cancel(self, order_id):
+        pass
+
+    @abstractmethod
+    def amend(self, order_id, price=None, volume=None):
+        pass
+
+    def close(self):
+        pass
+
+def fill_at_limit(order, remaining):
+    """
+    默认撮合规则：按委托价全部成交
+    :param order: 订单（含 price、direction 等字段）
+    :param remaining: 未成交数量
+    :return: [(成交价, 成交量, 费用)]
+    """
+    return [(order['price'], remaining, 0.0)]
+
+class SimulatedBroker(BrokerAdapter):
+    name = 'simulated'
+
+    def __init__(self, matcher=fill_at_limit):
+        """
+        本地模拟交易所：后台线程处理委托请求，未成交部分挂单等待
+        :param matcher: 撮合函数 matcher(order, remaining) -> [(价格, 数量, 费用)]
+        """
+        super().__init__()
+        self.matcher = matcher
+        self.resting = {}  # 挂单 order_id -> [订单副本, 未成交数量]
+        self._requests = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, order):
+        self._requests.put(('submit', dict(order)))
+
+    def cancel(self, order_id):
+        self._requests.put(('cancel', order_id))
+
+    def amend(self, order_id, price=None, volume=None):
+        self._requests.put(('amend', order_id, price, volume))
+
+    def rematch(self):
+        """
+        重新撮合所有挂单（行情变化后调用）
+        """
+        self._requests.put(('rematch',))
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            try:
+                getattr(self, '_handle_' + request[0])(*request[1:])
+            except Exception as e:
+                if len(request) > 1:
+                    order_id = request[1]['order_id'] if isinstance(request[1], dict) else request[1]
+                    self.emit({'type': 'rejected', 'order_id': order_id, 'reason': str(e)})
+
+    def _handle_submit(self, order):
+        self.resting[order['order_id']] = [order, order['volume']]
+        self._match(order['order_id'])
+
+    def _handle_cancel(self, order_id):
+        if self.resting.pop(order_id, None) is not None:
+            self.emit({'type': 'cancelled', 'order_id': order_id})
+
+    def _handle_amend(self, order_id, price, volume):
+        entry = self.resting.get(order_id)
+        if entry is None:
+            # 订单已成交或已撤销，仍然回报，调用方据此释放改单时追加的冻结
+            self.emit({'type': 'amend_rejected', 'order_id': order_id, 'reason': "订单不在挂单中"})
+            return
+        order, remaining = entry
+        filled = order['volume'] - remaining
+        if volume is not None:
+            if volume <= filled:
+                self.emit({'type': 'amend_rejected', 'order_id': order_id, 'reason': "改单数量不能小于已成交数量"})
+                return
+            order['volume'] = volume
+            entry[1] = volume - filled
+        if price is not None:
+            order['price'] = price
+        self.emit({'type': 'amended', 'order_id': order_id, 'price': order['price'], 'volume': order['volume']})
+        self._match(order_id)
+
+    def _handle_rematch(self):
+        # 每个挂单单独处理，一个委托无效不影响其他挂单的撮合
+        for order_id in list(self.resting):
+            try:
+                self._match(order_id)
+            except Exception as e:
+                self.emit({'type': 'rejected', 'order_id': order_id, 'reason': str(e)})
+
+    def _match(self, order_id):
+        """
+        撮合一个挂单，撮合函数抛出异常（委托无效）时把订单移出挂单后重新抛出
+        """
+        entry = self.resting[order_id]
+        order = entry[0]
+        try:
+            fills = self.matcher(order, entry[1])
+        except Exception:
+            del self.resting[order_id]
+            raise
+        for price, volume, fee in fills:
+            if volume <= 0:
+                continue
+            entry[1] -= volume
+            self.emit({'type': 'fill', 'order_id': order_id, 'price': price, 'volume': volume,
+                       'fee': fee, 'timestamp': datetime.now()})
+        if entry[1] <= 0:
+            del self.resting[order_id]
+
+class OrderManager:
+    def __init__(self, broker=None):
+        """
+        订单管理：生成订单号、维护订单状态、转发委托请求、分发成交回报
+        订单状态只在调用方线程中修改：券商回报先进入事件队列，由 process_events() 统一处理并触发回调
+        :param broker: BrokerAdapter 实例，None则使用 SimulatedBroker
+        """
+        self.broker = broker or SimulatedBroker()
+        self.broker.connect(self._on_broker_event)
+        self.orders = {}  # order_id -> 订单
+        self.by_status = {status: {} for status in TRANSITIONS}  # 状态 -> {order_id: 订单}
+        self.fill_listeners = []
+        self.status_listeners = []
+        self.amend_listeners = []
+        self._events = queue.SimpleQueue()
+        # 订单号：会话前缀 + 单调递增序号，同一秒内下单也不会重复
+        self._session = datetime.now().strftime('%Y%m%d%H%M%S')
+        self._sequence = itertools.count(1)
+
+    def add_fill_listener(self, callback):
+        """
+        注册成交回调 callback(order, fill)，fill 包含 price、volume、fee、timestamp
+        """
+        self.fill_listeners.append(callback)
+
+    def add_status_listener(self, callback):
+        """
+        注册状态变化回调 callback(order, old_status)
+        """
+        self.status_listeners.append(callback)
+
+    def add_amend_listener(self, callback):
+        """
+        注册改单回报回调 callback(order, accepted)，accepted 为券商是否接受改单
+        """
+        self.amend_listeners.append(callback)
+
+    def create_order(self, stock_code, direction, price, volume):
+        """
+        创建订单（状态为new，尚未发送）
+        :return: dict 订单
+        """
+        order_id = f"ORDER_{self._session}_{next(self._sequence):08d}"
+        now = datetime.now()
+        order = {
+            'order_id': order_id,
+            'stock_code': stock_code,
+            'direction': direction,
+            'price': price,
+            'volume': volume,
+            'filled_volume': 0,
+            'avg_fill_price': 0.0,
+            'fee': 0.0,
+            'status': ORDER_NEW,
+            'reason': None,
+            'timestamp': now,
+            'update_time': now
+        }
+        self.orders[order_id] = order
+        self.by_status[ORDER_NEW][order_id] = order
+        return order
+
+    def submit(self, stock_code, direction, price, volume):
+        """
+        提交订单，立即返回（不等待券商回报）
+        :return: str 订单ID
+        """
+        order = self.create_order(stock_code, direction, price, volume)
+        self.send(order)
+        return order['order_id']
+
+    def send(self, order):
+        """
+        把已创建的订单发送给券商
+        """
+        self.broker.submit(order)
+
+    def reject(self, order, reason):
+        """
+        在本地直接拒绝订单（如资金或可卖数量不足）
+        """
+        order['reason'] = reason
+        self._transition(order, ORDER_REJECTED)
+
+    def cancel(self, order_id):
+        """
+        撤单请求
+        :return: bool 是否已发送（订单不存在或已结束时为False）
+        """
+        order = self.orders.get(order_id)
+        if order is None or order['status'] not in OPEN_STATUSES:
+            return False
+        self.broker.cancel(order_id)
+        return True
+
+    def amend(self, order_id, price=None, volume=None):
+        """
+        改单请求（修改未成交订单的价格或数量）
+        :return: bool 是否已发送
+        """
+        order = self.orders.get(order_id)
+        if order is None or order['status'] not in OPEN_STATUSES:
+            return False
+        self.broker.amend(order_id, price, volume)
+        return True
+
+    def get_order(self, order_id):
+        return self.orders.get(order_id)
+
+    def get_orders(self, status=None):
+        """
+        :param status: 订单状态，None表示全部
+        :return: 订单列表（按下单顺序）
+        """
+        if status is None:
+            return list(self.orders.values())
+        return list(self.by_status.get(status, {}).values())
+
+    def get_open_orders(self):
+        return [order for status in OPEN_STATUSES for order in self.by_status[status].values()]
+
+    def _on_broker_event(self, event):
+        """
+        券商回报入队（可能在券商线程中调用）
+        """
+        self._events.put(event)
+
+    def process_events(self, max_events=None):
+        """
+        处理已到达的券商回报，更新订单状态并触发回调，不会阻塞
+        :param max_events: 最多处理的事件数，None表示全部
+        :return: int 处理的事件数
+        """
+        count = 0
+        while max_events is None or count < max_events:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            count += 1
+            order = self.orders.get(event['order_id'])
+            if order is None:
+                continue
+            handler = getattr(self, '_apply_' + event['type'], None)
+            if handler is not None:
+                handler(order, event)
+        return count
+
+    def _apply_fill(self, order, event):
+        volume = event['volume']
+        filled = order['filled_volume'] + volume
+        order['avg_fill_price'] = (order['avg_fill_price'] * order['filled_volume'] + event['price'] * volume) / filled
+        order['filled_volume'] = filled
+        order['fee'] += event.get('fee', 0.0)
+        fill = {
+            'price': event['price'],
+            'volume': volume,
+            'fee': event.get('fee', 0.0),
+            'timestamp': event.get('timestamp') or datetime.now()
+        }
+        self._transition(order, ORDER_FILLED if filled >= order['volume'] else ORDER_PARTIAL)
+        for callback in self.fill_listeners:
+            callback(order, fill)
+
+    def _apply_cancelled(self, order, event):
+        self._transition(order, ORDER_CANCELLED)
+
+    def _apply_rejected(self, order, event):
+        order['reason'] = event.get('reason')
+        # 部分成交后被拒绝的订单按撤单处理，已成交部分保留
+        self._transition(order, ORDER_REJECTED if order['status'] == ORDER_NEW else ORDER_CANCELLED)
+
+    def _apply_amended(self, order, event):
+        order['price'] = event['price']
+        order['volume'] = event['volume']
+        order['update_time'] = datetime.now()
+        for callback in self.amend_listeners:
+            callback(order, True)
+
+    def _apply_amend_rejected(self, order, event):
+        if order['status'] in OPEN_STATUSES:
+            order['reason'] = event.get('reason')
+        for callback in self.amend_listeners:
+            callback(order, False)
+
+    def _transition(self, order, status):
+        """
+        按状态机更新订单状态并维护状态索引
+        """
+        old_status = order['status']
+        if status not in TRANSITIONS[old_status]:
+            raise ValueError(f"订单 {order['order_id']} 不能从 {old_status} 变为 {status}")
+        del self.by_status[old_status][order['order_id']]
+        self.by_status[status][order['order_id']] = order
+        order['status'] = status
+        order['update_time'] = datetime.now()
+        for callback in self.status_listeners:
+            callback(order, old_status)
+
+    def close(self):
+        """
+        关闭券商连接
+        """
+        self.broker.close()
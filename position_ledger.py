@@ -0,0 +1,246 @@
+import numpy as np
+import pandas as pd
+from collections import deque
+from datetime import date, datetime
+
+class PositionLedger:
+    def __init__(self, capacity=256):
+        """
+        持仓台账（数组存储，按股票分配槽位）
+        记录持仓数量、FIFO批次、持仓成本、已实现/未实现盈亏和T+1可卖数量，每笔成交O(1)更新
+        :param capacity: 初始槽位数，不足时倍增
+        """
+        self.index = {}                 # 股票代码 -> 槽位
+        self.codes = []
+        self.quantity = np.zeros(capacity, dtype=np.int64)
+        self.sellable = np.zeros(capacity, dtype=np.int64)     # T+1：当日买入的部分不可卖
+        self.cost_basis = np.zeros(capacity, dtype=np.float64)  # 剩余批次的总成本（含费用）
+        self.realized_pnl = np.zeros(capacity, dtype=np.float64)
+        self.last_price = np.zeros(capacity, dtype=np.float64)  # 最新价（来自实时行情或最近成交）
+        self.lots = []                  # 每个槽位一个FIFO批次队列 [数量, 单位成本]
+        self.current_date = None
+        self._code_index = pd.Index([], dtype=object)
+        self._last_codes = None         # 最近一次批量更新价格的股票代码及对应槽位
+        self._last_slots = None
+
+    def slot(self, stock_code):
+        """
+        获取股票的槽位，不存在时分配
+        """
+        slot = self.index.get(stock_code)
+        if slot is None:
+            slot = len(self.codes)
+            if slot == len(self.quantity):
+                self._grow()
+            self.index[stock_code] = slot
+            self.codes.append(stock_code)
+            self.lots.append(deque())
+        return slot
+
+    def _grow(self):
+        """
+        槽位数组容量倍增
+        """
+        size = len(self.quantity)
+        self.quantity = np.concatenate([self.quantity, np.zeros(size, dtype=np.int64)])
+        self.sellable = np.concatenate([self.sellable, np.zeros(size, dtype=np.int64)])
+        self.cost_basis = np.concatenate([self.cost_basis, np.zeros(size)])
+        self.realized_pnl = np.concatenate([self.realized_pnl, np.zeros(size)])
+        self.last_price = np.concatenate([self.last_price, np.zeros(size)])
+
+    def roll_day(self, trade_date):
+        """
+        切换交易日：之前买入的持仓全部变为可卖
+        :param trade_date: 新的交易日（date）
+        """
+        if self.current_date is None or trade_date > self.current_date:
+            n = len(self.codes)
+            self.sellable[:n] = self.quantity[:n]
+            self.current_date = trade_date
+
+    def apply_fill(self, stock_code, direction, price, volume, fee=0.0, trade_time=None):
+        """
+        记录一笔成交
+        :param stock_code: 股票代码
+        :param direction: 'buy' 或 'sell'
+        :param price: 成交价格
+        :param volume: 成交数量
+        :param fee: 交易费用（计入买入成本，或从卖出收入中扣除）
+        :param trade_time: 成交时间（datetime或date），None表示当前时间
+        :return: float 本笔成交的已实现盈亏（买入为负的费用）
+        """
+        trade_date = _to_date(trade_time)
+        self.roll_day(trade_date)
+        slot = self.slot(stock_code)
+
+        if direction == 'buy':
+            self.lots[slot].append([volume, price + fee / volume])
+            self.quantity[slot] += volume
+            self.cost_basis[slot] += price * volume + fee
+            self.last_price[slot] = price
+            return -fee
+
+        if volume > self.quantity[slot]:
+            raise ValueError(f"股票 {stock_code} 卖出数量 {volume} 超过持仓 {self.quantity[slot]}")
+
+        # 按FIFO消耗批次，每个批次只会被完全消耗一次，均摊O(1)
+        lots = self.lots[slot]
+        remaining = volume
+        consumed_cost = 0.0
+        while remaining > 0:
+            lot = lots[0]
+            take = min(remaining, lot[0])
+            consumed_cost += take * lot[1]
+            lot[0] -= take
+            remaining -= take
+            if lot[0] == 0:
+                lots.popleft()
+
+        pnl = price * volume - fee - consumed_cost
+        self.quantity[slot] -= volume
+        self.sellable[slot] = max(0, self.sellable[slot] - volume)
+        self.cost_basis[slot] = self.cost_basis[slot] - consumed_cost if self.quantity[slot] > 0 else 0.0
+        self.realized_pnl[slot] += pnl
+        self.last_price[slot] = price
+        return pnl
+
+    def mark(self, stock_code, price):
+        """
+        更新单只股票的最新价
+        """
+        slot = self.index.get(stock_code)
+        if slot is not None:
+            self.last_price[slot] = price
+
+    def slots_of(self, stock_codes):
+        """
+        批量获取槽位（不存在时分配）
+        与上一次查询的股票列表相同时直接复用结果
+        :param stock_codes: 股票代码数组
+        :return: 槽位数组
+        """
+        stock_codes = np.asarray(stock_codes, dtype=object)
+        last = self._last_codes
+        if last is not None and len(last) == len(stock_codes) and (last is stock_codes or np.array_equal(last, stock_codes)):
+            return self._last_slots
+        
+        if len(self._code_index) != len(self.codes):
+            self._code_index = pd.Index(self.codes, dtype=object)
+        slots = self._code_index.get_indexer(stock_codes)
+        for i in np.flatnonzero(slots < 0):
+            slots[i] = self.slot(stock_codes[i])
+        self._last_codes = stock_codes
+        self._last_slots = slots
+        return slots
+
+    def mark_many(self, stock_codes, prices):
+        """
+        批量更新最新价（直接用实时行情的代码和价格数组），无效价格忽略
+        :param stock_codes: 股票代码数组
+        :param prices: 价格数组
+        """
+        slots = self.slots_of(stock_codes)
+        prices = np.asarray(prices, dtype=np.float64)
+        valid = prices > 0
+        self.last_price[slots[valid]] = prices[valid]
+
+    def get_price(self, stock_code):
+        """
+        最新价，没有行情时为0
+        """
+        slot = self.index.get(stock_code)
+        return float(self.last_price[slot]) if slot is not None else 0.0
+
+    def market_value(self):
+        """
+        持仓市值（数量向量与价格向量的点积）
+        """
+        n = len(self.codes)
+        return float(self.quantity[:n] @ self.last_price[:n])
+
+    def exposure(self):
+        """
+        :return: (gross, net) 总敞口（持仓市值绝对值之和）和净敞口
+        """
+        n = len(self.codes)
+        values = self.quantity[:n] * self.last_price[:n]
+        return float(np.abs(values).sum()), float(values.sum())
+
+    def weights(self, total_assets):
+        """
+        各持仓市值占总资产的比例
+        :param total_assets: 总资产
+        :return: dict {stock_code: 权重}（不含已清仓的股票）
+        """
+        n = len(self.codes)
+        held = np.flatnonzero(self.quantity[:n])
+        if total_assets == 0 or len(held) == 0:
+            return {}
+        weights = self.quantity[held] * self.last_price[held] / total_assets
+        return dict(zip([self.codes[i] for i in held], weights.tolist()))
+
+    def get_quantity(self, stock_code):
+        """
+        持仓数量
+        """
+        slot = self.index.get(stock_code)
+        return int(self.quantity[slot]) if slot is not None else 0
+
+    def get_sellable(self, stock_code, trade_time=None):
+        """
+        可卖数量（T+1）
+        """
+        slot = self.index.get(stock_code)
+        if slot is None:
+            return 0
+        if self.current_date is not None and _to_date(trade_time) > self.current_date:
+            return int(self.quantity[slot])
+        return int(self.sellable[slot])
+
+    def get_avg_cost(self, stock_code):
+        """
+        持仓平均成本（含买入费用），无持仓时为0
+        """
+        slot = self.index.get(stock_code)
+        if slot is None or self.quantity[slot] == 0:
+            return 0.0
+        return float(self.cost_basis[slot] / self.quantity[slot])
+
+    def get_realized_pnl(self, stock_code=None):
+        """
+        已实现盈亏，stock_code为None时返回合计
+        """
+        if stock_code is None:
+            return float(self.realized_pnl[:len(self.codes)].sum())
+        slot = self.index.get(stock_code)
+        return float(self.realized_pnl[slot]) if slot is not None else 0.0
+
+    def get_unrealized_pnl(self, stock_code=None):
+        """
+        按最新价计算的未实现盈亏，stock_code为None时返回合计
+        """
+        n = len(self.codes)
+        if stock_code is None:
+            return float(self.quantity[:n] @ self.last_price[:n] - self.cost_basis[:n].sum())
+        slot = self.index.get(stock_code)
+        if slot is None or self.quantity[slot] == 0:
+            return 0.0
+        return float(self.quantity[slot] * self.last_price[slot] - self.cost_basis[slot])
+
+    def positions_dict(self):
+        """
+        当前持仓 {stock_code: 数量}（不含已清仓的股票）
+        """
+        n = len(self.codes)
+        held = np.flatnonzero(self.quantity[:n])
+        return {self.codes[i]: int(self.quantity[i]) for i in held}
+
+def _to_date(trade_time):
+    """
+    统一为date类型
+    """
+    if trade_time is None:
+        return date.today()
+    if isinstance(trade_time, datetime):
+        return trade_time.date()
+    return trade_time
@@ -1,13 +1,252 @@
-import akshare as ak
 import pandas as pd
 import time
 from datetime import datetime
 import threading
-import queue
+import logging
+import numpy as np
+from collections import deque
+from matching import LOT_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 实时行情字段与原始列名的对应关系
+QUOTE_COLUMNS = {
+    '最新价': 'price',
+    '成交量': 'volume',
+    '成交额': 'amount',
+    '买一价': 'bid_price',
+    '卖一价': 'ask_price',
+    '买一量': 'bid_volume',
+    '卖一量': 'ask_volume',
+    '昨收': 'prev_close'
+}
+QUOTE_FIELDS = ['code'] + list(QUOTE_COLUMNS.values())
+# 东方财富盘口挂单量以手为单位，QuoteBatch 中换算为股
+LOT_COLUMNS = ('买一量', '卖一量')
+
+class QuoteBatch:
+    def __init__(self, timestamp, codes, **fields):
+        """
+        一次轮询得到的行情批次，按列存储为定长数组
+        :param timestamp: 行情时间
+        :param codes: 股票代码数组
+        :param fields: price、volume 等字段的float64数组，与codes等长；
+                       bid_volume、ask_volume 为买一、卖一挂单量（股），volume 为行情源的累计成交量
+        """
+        self.timestamp = timestamp
+        self.codes = codes
+        for name in QUOTE_COLUMNS.values():
+            setattr(self, name, fields[name])
+    
+    @classmethod
+    def from_snapshot(cls, snapshot, stock_codes, timestamp=None):
+        """
+        从全市场行情快照中一次性提取订阅的股票
+        :param snapshot: ak.stock_zh_a_spot_em() 返回的DataFrame
+        :param stock_codes: 订阅的股票代码列表
+        :param timestamp: 行情时间，None表示当前时间
+        :return: QuoteBatch（只包含有有效价格的股票）
+        """
+        timestamp = timestamp or datetime.now()
+        # 代码列建一次哈希索引，所有订阅股票一次查找完成
+        index = pd.Index(snapshot['代码'].astype(str))
+        if not index.is_unique:
+            # 同一代码出现多次时保留最后一条
+            keep = ~index.duplicated(keep='last')
+            snapshot, index = snapshot[keep], index[keep]
+        positions = index.get_indexer(stock_codes)
+        found = positions >= 0
+        positions = positions[found]
+        codes = np.asarray(stock_codes, dtype=object)[found]
+        
+        fields = {}
+        for column, name in QUOTE_COLUMNS.items():
+            values = snapshot[column].to_numpy()[positions]
+            fields[name] = pd.to_numeric(values, errors='coerce').astype(np.float64)
+            if column in LOT_COLUMNS:
+                fields[name] *= LOT_SIZE
+        
+        # 停牌等无效行情的最新价为空
+        valid = ~np.isnan(fields['price'])
+        if not valid.all():
+            codes = codes[valid]
+            fields = {name: values[valid] for name, values in fields.items()}
+        return cls(timestamp, codes, **fields)
+    
+    @classmethod
+    def from_quotes(cls, quotes):
+        """
+        由行情字典列表构造批次
+        """
+        quotes = list(quotes)
+        timestamp = quotes[-1]['timestamp'] if quotes else datetime.now()
+        codes = np.asarray([q['code'] for q in quotes], dtype=object)
+        fields = {
+            name: np.asarray([q[name] for q in quotes], dtype=np.float64)
+            for name in QUOTE_COLUMNS.values()
+        }
+        return cls(timestamp, codes, **fields)
+    
+    @classmethod
+    def merge_latest(cls, batches):
+        """
+        合并多个批次，每只股票只保留最新的一条行情
+        :param batches: 按时间先后排列的批次列表
+        :return: QuoteBatch
+        """
+        if len(batches) == 1:
+            return batches[0]
+        codes = np.concatenate([b.codes for b in batches])
+        # 反转后取第一次出现的位置，即每只股票最后一次出现的位置
+        _, first = np.unique(codes[::-1], return_index=True)
+        keep = np.sort(len(codes) - 1 - first)
+        fields = {
+            name: np.concatenate([getattr(b, name) for b in batches])[keep]
+            for name in QUOTE_COLUMNS.values()
+        }
+        return cls(batches[-1].timestamp, codes[keep], **fields)
+    
+    def take(self, mask):
+        """
+        按布尔掩码或下标选取部分股票
+        """
+        fields = {name: getattr(self, name)[mask] for name in QUOTE_COLUMNS.values()}
+        return QuoteBatch(self.timestamp, self.codes[mask], **fields)
+    
+    def changed_since(self, previous):
+        """
+        与上一次快照比较，找出行情有变化的股票
+        :param previous: 上一个QuoteBatch，None表示全部视为变化
+        :return: 布尔数组
+        """
+        if previous is None or len(previous) == 0:
+            return np.ones(len(self.codes), dtype=bool)
+        positions = pd.Index(previous.codes).get_indexer(self.codes)
+        changed = positions < 0
+        matched = ~changed
+        for name in QUOTE_COLUMNS.values():
+            current = getattr(self, name)[matched]
+            before = getattr(previous, name)[positions[matched]]
+            differs = (current != before) & ~(np.isnan(current) & np.isnan(before))
+            changed[matched] |= differs
+        return changed
+    
+    def __len__(self):
+        return len(self.codes)
+    
+    def quote(self, i):
+        """
+        第i只股票的行情字典
+        """
+        data = {'timestamp': self.timestamp, 'code': self.codes[i]}
+        for name in QUOTE_COLUMNS.values():
+            data[name] = float(getattr(self, name)[i])
+        return data
+    
+    def iter_quotes(self):
+        """
+        逐只股票生成行情字典
+        """
+        for i in range(len(self.codes)):
+            yield self.quote(i)
+    
+    def to_frame(self):
+        """
+        转换为DataFrame
+        """
+        df = pd.DataFrame({name: getattr(self, name) for name in QUOTE_COLUMNS.values()})
+        df.insert(0, 'code', self.codes)
+        df.insert(0, 'timestamp', self.timestamp)
+        return df
+
+class QuoteBuffer:
+    def __init__(self, max_batches=16):
+        """
+        有界、按股票合并的行情缓冲区
+        消费者每次取到的是自上次读取以来每只股票的最新行情，不会出现积压
+        :param max_batches: 最多缓存的批次数，超出时提前合并
+        """
+        self.max_batches = max_batches
+        self._batches = deque()
+        self._lock = threading.Lock()
+        self.dropped = 0        # 被更新行情覆盖、未被消费的行情条数
+        self.published = 0      # 写入的行情条数
+        self.delivered = 0      # 交给消费者的行情条数
+        self.last_lag = 0.0     # 最近一次读取时最早未读行情在缓冲区中等待的时间（秒）
+        self.max_lag = 0.0
+        self._oldest_arrival = None
+    
+    def put(self, batch):
+        """
+        写入一个批次
+        """
+        with self._lock:
+            if not self._batches:
+                self._oldest_arrival = time.monotonic()
+            self._batches.append(batch)
+            self.published += len(batch)
+            if len(self._batches) > self.max_batches:
+                self._conflate()
+    
+    def get(self):
+        """
+        取出自上次读取以来每只股票的最新行情
+        :return: QuoteBatch 或 None
+        """
+        with self._lock:
+            if not self._batches:
+                return None
+            oldest = self._oldest_arrival
+            self._conflate()
+            batch = self._batches.popleft()
+        
+        self.last_lag = time.monotonic() - oldest
+        self.max_lag = max(self.max_lag, self.last_lag)
+        self.delivered += len(batch)
+        return batch
+    
+    def _conflate(self):
+        """
+        将缓存的批次合并为一个（调用方需持有锁）
+        """
+        if len(self._batches) <= 1:
+            return
+        total = sum(len(b) for b in self._batches)
+        merged = QuoteBatch.merge_latest(list(self._batches))
+        self.dropped += total - len(merged)
+        self._batches.clear()
+        self._batches.append(merged)
+    
+    def qsize(self):
+        """
+        当前缓存的批次数
+        """
+        return len(self._batches)
+    
+    def empty(self):
+        return not self._batches
+    
+    def get_stats(self):
+        """
+        获取缓冲区统计信息
+        """
+        return {
+            'pending_batches': self.qsize(),
+            'published': self.published,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag
+        }
 
 class RealtimeDataFetcher:
-    def __init__(self):
-        self.data_queue = queue.Queue()
+    def __init__(self, max_batches=16):
+        """
+        :param max_batches: 行情缓冲区最多缓存的批次数
+        """
+        self.data_queue = QuoteBuffer(max_batches)
+        self._pending = deque()  # get_latest_data 拆分批次后尚未取走的行情
+        self._last_batch = None  # 上一次轮询的快照，用于变化检测
         self.running = False
         self.stock_list = []
         self.update_interval = 3  # 更新间隔（秒）
@@ -34,76 +273,77 @@ class RealtimeDataFetcher:
         """
         实时数据获取循环
         """
+        # 只有实际联网取数时才需要akshare，process_snapshot 等离线处理不依赖它
+        import akshare as ak
         while self.running:
             try:
                 # 获取实时行情
                 realtime_data = ak.stock_zh_a_spot_em()
                 
-                # 打印列名，用于调试
-                print("实时数据列名:", realtime_data.columns.tolist())
-                
                 # 检查必要的列是否存在
-                required_columns = ['代码', '最新价', '成交量', '成交额', '买一价', '卖一价', '买一量', '卖一量']
-                if not all(col in realtime_data.columns for col in required_columns):
-                    print("警告：实时数据缺少必要的列")
-                    print("可用的列:", realtime_data.columns.tolist())
+                missing_columns = [col for col in ['代码', *QUOTE_COLUMNS] if col not in realtime_data.columns]
+                if missing_columns:
+                    logger.warning("实时数据缺少必要的列: %s", missing_columns)
                     time.sleep(self.update_interval)
                     continue
                 
-                for stock_code in self.stock_list:
-                    try:
-                        stock_data = realtime_data[realtime_data['代码'] == stock_code]
-                        
-                        if not stock_data.empty:
-                            # 确保所有数值都是有效的
-                            data = {
-                                'timestamp': datetime.now(),
-                                'code': stock_code,
-                                'price': float(stock_data['最新价'].values[0]),
-                                'volume': float(stock_data['成交量'].values[0]),
-                                'amount': float(stock_data['成交额'].values[0]),
-                                'bid_price': float(stock_data['买一价'].values[0]),
-                                'ask_price': float(stock_data['卖一价'].values[0]),
-                                'bid_volume': float(stock_data['买一量'].values[0]),
-                                'ask_volume': float(stock_data['卖一量'].values[0])
-                            }
-                            
-                            # 验证数据有效性
-                            if all(isinstance(v, (int, float)) for v in data.values() if isinstance(v, (int, float))):
-                                self.data_queue.put(data)
-                            else:
-                                print(f"警告：股票 {stock_code} 的数据无效")
-                    except Exception as e:
-                        print(f"处理股票 {stock_code} 数据时出错: {e}")
-                        continue
-                
+                self.process_snapshot(realtime_data)
                 time.sleep(self.update_interval)
             except Exception as e:
-                print(f"获取实时数据时出错: {e}")
-                import traceback
-                print("错误详情:")
-                print(traceback.format_exc())
+                logger.exception("获取实时数据时出错: %s", e)
                 time.sleep(self.update_interval)
     
+    def process_snapshot(self, snapshot, timestamp=None):
+        """
+        处理一次全市场快照：提取订阅的股票，只把与上次快照相比有变化的股票写入缓冲区
+        :param snapshot: ak.stock_zh_a_spot_em() 返回的DataFrame
+        :param timestamp: 行情时间，None表示当前时间
+        :return: 写入缓冲区的QuoteBatch，没有变化时为None
+        """
+        batch = QuoteBatch.from_snapshot(snapshot, self.stock_list, timestamp)
+        changed = batch.changed_since(self._last_batch)
+        self._last_batch = batch
+        if not changed.any():
+            return None
+        batch = batch if changed.all() else batch.take(changed)
+        self.data_queue.put(batch)
+        return batch
+    
+    def get_latest_batch(self):
+        """
+        获取自上次读取以来每只股票的最新行情
+        :return: QuoteBatch 或 None
+        """
+        batch = self.data_queue.get()
+        if self._pending:
+            # 合并已被 get_latest_data 拆开的剩余部分
+            pending = QuoteBatch.from_quotes(self._pending)
+            self._pending.clear()
+            batch = pending if batch is None else QuoteBatch.merge_latest([pending, batch])
+        return batch
+    
     def get_latest_data(self):
         """
-        获取最新的实时数据
+        获取最新的实时数据（逐只股票返回）
         :return: 最新的数据字典
         """
-        try:
-            return self.data_queue.get_nowait()
-        except queue.Empty:
-            return None
+        if not self._pending:
+            batch = self.data_queue.get()
+            if batch is None:
+                return None
+            self._pending.extend(batch.iter_quotes())
+        return self._pending.popleft()
     
     def get_all_data(self):
         """
-        获取所有待处理的数据
+        获取所有待处理的数据（每只股票一条最新行情）
         :return: 数据列表
         """
-        data_list = []
-        while not self.data_queue.empty():
-            try:
-                data_list.append(self.data_queue.get_nowait())
-            except queue.Empty:
-                break
-        return data_list 
\ No newline at end of file
+        batch = self.get_latest_batch()
+        return list(batch.iter_quotes()) if batch is not None else []
+    
+    def get_stats(self):
+        """
+        获取行情缓冲区统计信息（积压、丢弃和延迟）
+        """
+        return self.data_queue.get_stats()
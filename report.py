@@ -0,0 +1,212 @@
+import os
+import re
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from matplotlib import dates as mdates
+from matplotlib import font_manager, rc_context
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import PercentFormatter
+
+from analytics import compute_metrics, drawdown_stats
+
+# 中文字体候选（只使用本机已安装的，避免找不到字体的警告）
+CJK_FONTS = ['SimHei', 'Microsoft YaHei', 'PingFang SC', 'Noto Sans CJK SC', 'Source Han Sans SC',
+             'WenQuanYi Micro Hei', 'WenQuanYi Zen Hei', 'Arial Unicode MS']
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets 降采样：保留曲线形状（峰谷）的前提下把点数降到 n_out
+    :param x: 横坐标（升序）
+    :param y: 纵坐标
+    :param n_out: 输出点数
+    :return: 选中点的下标数组（包含首尾两点）
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # 中间 n-2 个点分成 n_out-2 个桶，最后补一个只含末点的桶
+    edges = np.append((np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1, n)
+    edges[-2] = n - 1
+    # 每个桶的平均点（用累加和一次算出）
+    csum_x = np.concatenate([[0.0], np.cumsum(x)])
+    csum_y = np.concatenate([[0.0], np.cumsum(y)])
+    counts = edges[1:] - edges[:-1]
+    avg_x = (csum_x[edges[1:]] - csum_x[edges[:-1]]) / counts
+    avg_y = (csum_y[edges[1:]] - csum_y[edges[:-1]]) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # 与上一个选中点、下一个桶平均点构成的三角形面积最大的点
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+def downsample(x, y, max_points=2000):
+    """
+    按LTTB降采样一条曲线
+    :return: (x, y)
+    """
+    index = lttb(x, y, max_points)
+    return x[index], y[index]
+
+def _as_curves(equity):
+    """
+    统一为 (横坐标, {名称: 数值数组}, 是否为日期)
+    支持 Series、DataFrame（每列一条曲线，含 total 列时视为 Strategy.backtest 的结果）、数组
+    """
+    if isinstance(equity, pd.DataFrame) and 'total' in equity.columns:
+        equity = equity['total']
+    if isinstance(equity, pd.Series):
+        equity = equity.to_frame(equity.name if equity.name is not None else '投资组合价值')
+    if isinstance(equity, pd.DataFrame):
+        is_date = isinstance(equity.index, pd.DatetimeIndex)
+        x = mdates.date2num(equity.index) if is_date else np.arange(len(equity), dtype=np.float64)
+        return x, {str(name): equity[name].to_numpy(dtype=np.float64) for name in equity.columns}, is_date, equity
+    values = np.asarray(equity, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    frame = pd.DataFrame(values)
+    return np.arange(len(values), dtype=np.float64), {str(i): values[:, i] for i in range(values.shape[1])}, False, frame
+
+def prepare_report(equity, title='', benchmark=None, max_points=2000, path=None, show_metrics=True):
+    """
+    准备绘图数据：降采样曲线和回撤，计算指标摘要（在主进程中完成，只把少量点传给绘图进程）
+    :param equity: 净值曲线（Series、DataFrame或数组）
+    :param title: 图表标题
+    :param benchmark: 基准价格（如 get_index_data 返回的DataFrame），按起点净值归一化后画在同一张图上
+    :param max_points: 每条曲线最多绘制的点数
+    :param path: 输出文件路径
+    :param show_metrics: 是否在图中标注年化收益、最大回撤、夏普比率
+    :return: dict 绘图数据
+    """
+    x, curves, is_date, frame = _as_curves(equity)
+    payload = {'path': path, 'title': title, 'is_date': is_date, 'curves': [], 'drawdowns': [],
+               'benchmark': None, 'summary': None}
+    values = np.column_stack(list(curves.values()))
+    drawdown = drawdown_stats(values)[0]
+    for i, (name, y) in enumerate(curves.items()):
+        # 回撤由净值决定，沿用净值曲线选出的点，两幅图的时间点一致
+        index = lttb(x, y, max_points)
+        payload['curves'].append((name, x[index], y[index]))
+        payload['drawdowns'].append((name, x[index], drawdown[index, i]))
+
+    if benchmark is not None:
+        if isinstance(benchmark, pd.DataFrame):
+            benchmark = benchmark['close']
+        if isinstance(benchmark, pd.Series) and is_date:
+            benchmark = benchmark.sort_index().reindex(frame.index, method='ffill').bfill()
+        bench = np.asarray(benchmark, dtype=np.float64)
+        if len(bench) == len(x) and bench[0] > 0:
+            payload['benchmark'] = downsample(x, bench / bench[0] * values[0, 0], max_points)
+
+    if show_metrics and len(x) > 2:
+        metrics = compute_metrics(frame)
+        lines = []
+        for name, (_, row) in zip(curves, metrics.iterrows()):
+            lines.append(f"{name}  年化 {row['cagr']:.2%}  最大回撤 {row['max_drawdown']:.2%}  夏普 {row['sharpe_ratio']:.2f}")
+        payload['summary'] = '\n'.join(lines)
+    return payload
+
+@lru_cache(maxsize=1)
+def _font_families():
+    """
+    本机可用的中文字体 + 默认字体
+    """
+    installed = {font.name for font in font_manager.fontManager.ttflist}
+    return [name for name in CJK_FONTS if name in installed] + ['DejaVu Sans']
+
+def draw_report(payload, figsize=(12, 7), dpi=100):
+    """
+    用Agg后端把准备好的数据画成图片文件（不使用pyplot，不弹出窗口，可在子进程中并行调用）
+    :param payload: prepare_report 的返回值
+    :return: 输出文件路径
+    """
+    with rc_context({'font.sans-serif': _font_families(), 'axes.unicode_minus': False}), warnings.catch_warnings():
+        # 没有中文字体时中文显示为方框，不逐字输出警告
+        warnings.filterwarnings('ignore', message='Glyph .* missing from font')
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        ax_value, ax_drawdown = fig.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [3, 1]})
+
+        for name, x, y in payload['curves']:
+            ax_value.plot(x, y, linewidth=1.0, label=name)
+        if payload['benchmark'] is not None:
+            ax_value.plot(*payload['benchmark'], linewidth=1.0, color='gray', alpha=0.7, label='基准')
+        ax_value.set_title(payload['title'])
+        ax_value.set_ylabel('价值')
+        ax_value.legend(loc='upper left')
+        ax_value.grid(True, alpha=0.3)
+        if payload['summary']:
+            ax_value.text(0.99, 0.02, payload['summary'], transform=ax_value.transAxes, ha='right', va='bottom',
+                          fontsize=8, bbox={'boxstyle': 'round', 'facecolor': 'white', 'alpha': 0.8})
+
+        for name, x, y in payload['drawdowns']:
+            ax_drawdown.fill_between(x, y, 0, alpha=0.3, label=name)
+        ax_drawdown.set_ylabel('回撤')
+        ax_drawdown.yaxis.set_major_formatter(PercentFormatter(1.0))
+        ax_drawdown.set_xlabel('日期' if payload['is_date'] else '期数')
+        ax_drawdown.grid(True, alpha=0.3)
+        if payload['is_date']:
+            ax_drawdown.xaxis.set_major_locator(mdates.AutoDateLocator())
+            ax_drawdown.xaxis.set_major_formatter(mdates.ConciseDateFormatter(ax_drawdown.xaxis.get_major_locator()))
+
+        # 固定边距，不用 tight_layout（它需要额外完整绘制一遍来测量文字）
+        fig.subplots_adjust(left=0.08, right=0.98, top=0.94, bottom=0.08, hspace=0.08)
+        directory = os.path.dirname(payload['path'])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fig.savefig(payload['path'])
+    return payload['path']
+
+def render_report(path, equity, title='', benchmark=None, max_points=2000, show_metrics=True):
+    """
+    渲染单个报告图片（净值曲线 + 回撤）
+    :param path: 输出文件路径（扩展名决定格式，如 .png、.svg、.pdf）
+    :return: 输出文件路径
+    """
+    return draw_report(prepare_report(equity, title, benchmark, max_points, path, show_metrics))
+
+def render_reports(runs, output_dir='reports', benchmark=None, max_points=1000, workers=None,
+                   fmt='png', show_metrics=True):
+    """
+    批量渲染报告（如参数扫描的全部结果），降采样在主进程完成，绘图分给多个子进程并行
+    :param runs: {名称: 净值曲线} 或 [(名称, 净值曲线), ...]
+    :param output_dir: 输出目录
+    :param benchmark: 所有报告共用的基准价格
+    :param max_points: 每条曲线最多绘制的点数
+    :param workers: 子进程数，None表示CPU核数，1表示在当前进程中依次渲染
+    :param fmt: 图片格式
+    :return: list 输出文件路径（与runs顺序一致）
+    """
+    items = list(runs.items()) if isinstance(runs, dict) else list(runs)
+    payloads = [
+        prepare_report(equity, str(name), benchmark, max_points,
+                       os.path.join(output_dir, f"{_safe_filename(name)}.{fmt}"), show_metrics)
+        for name, equity in items
+    ]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(payloads) <= 1:
+        return [draw_report(payload) for payload in payloads]
+
+    workers = min(workers, len(payloads))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(draw_report, payloads, chunksize=max(1, len(payloads) // (workers * 4))))
+
+def _safe_filename(name):
+    """
+    去掉文件名中不允许的字符
+    """
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', str(name)).strip('_') or 'report'
@@ -1,21 +1,57 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from position_ledger import PositionLedger
+
+# 批量风险检查的原因代码
+REASON_OK = 0
+REASON_INVALID_ORDER = 1
+REASON_POSITION_LIMIT = 2
+REASON_DRAWDOWN_HALT = 3
+REASON_GROSS_EXPOSURE = 4
+REASON_NET_EXPOSURE = 5
+REASON_STOP_LOSS = 6
+
+REASON_MESSAGES = {
+    REASON_OK: "通过风险检查",
+    REASON_INVALID_ORDER: "订单价格、数量或账户资产无效",
+    REASON_POSITION_LIMIT: "超过单个股票最大仓位限制",
+    REASON_DRAWDOWN_HALT: "超过最大回撤限制，暂停开仓",
+    REASON_GROSS_EXPOSURE: "超过总敞口限制",
+    REASON_NET_EXPOSURE: "超过净敞口限制",
+    REASON_STOP_LOSS: "触发止损"
+}
 
 class RiskManager:
-    def __init__(self, max_position_size=0.1, max_drawdown=0.2, stop_loss_pct=0.05):
+    def __init__(self, max_position_size=0.1, max_drawdown=0.2, stop_loss_pct=0.05,
+                 max_gross_exposure=1.0, max_net_exposure=1.0, ledger=None, history_size=100_000):
         """
         初始化风险管理器
         :param max_position_size: 单个股票最大仓位比例
         :param max_drawdown: 最大回撤限制
         :param stop_loss_pct: 止损比例
+        :param max_gross_exposure: 总敞口（多空持仓市值绝对值之和）占总资产的上限
+        :param max_net_exposure: 净敞口（多头减空头）占总资产的上限
+        :param ledger: 持仓台账（PositionLedger），与资金管理器、交易接口共用同一个实例
+        :param history_size: 保留的最近投资组合价值个数（风险指标由增量统计得出，不依赖完整历史）
         """
         self.max_position_size = max_position_size
         self.max_drawdown = max_drawdown
         self.stop_loss_pct = stop_loss_pct
-        self.positions = {}
+        self.max_gross_exposure = max_gross_exposure
+        self.max_net_exposure = max_net_exposure
+        self.ledger = ledger if ledger is not None else PositionLedger()
         self.trade_history = []
-        self.portfolio_value_history = []
+        self.portfolio_value_history = ValueHistory(history_size)
+        self.risk_state = StreamingRiskState()
+        self.drawdown_breached = False
+    
+    @property
+    def positions(self):
+        """
+        当前持仓 {stock_code: 数量}（来自持仓台账）
+        """
+        return self.ledger.positions_dict()
     
     def check_order(self, order, account_info):
         """
@@ -24,13 +60,19 @@ class RiskManager:
         :param account_info: 账户信息
         :return: (bool, str) 是否允许下单，原因
         """
+        # 超过最大回撤后暂停开仓（与 check_orders 一致）
+        if order['direction'] == 'buy' and self.drawdown_breached:
+            return False, REASON_MESSAGES[REASON_DRAWDOWN_HALT]
+        
         # 检查单个股票仓位限制
         if order['direction'] == 'buy':
-            current_position = self.positions.get(order['stock_code'], 0)
+            current_position = self.ledger.get_quantity(order['stock_code'])
             new_position = current_position + order['volume']
             position_value = new_position * order['price']
             total_assets = account_info['total_assets']
             
+            if not total_assets > 0:
+                return False, "账户总资产无效"
             if position_value / total_assets > self.max_position_size:
                 return False, "超过单个股票最大仓位限制"
         
@@ -41,6 +83,86 @@ class RiskManager:
         
         return True, "通过风险检查"
     
+    def check_orders(self, stock_codes, directions, prices, volumes, account_info):
+        """
+        批量检查一篮子订单（向量化计算）
+        依次检查：订单有效性、最大回撤暂停开仓、单股仓位、总敞口、净敞口；
+        同一股票的多笔订单按顺序累计仓位；敞口按订单顺序累计，减少敞口的订单先计入，
+        增加敞口的订单超出限额时被拒绝，被拒绝的订单不计入后续订单的累计
+        :param stock_codes: 股票代码序列
+        :param directions: 交易方向序列（'buy'/'sell' 或 1/-1）
+        :param prices: 价格数组
+        :param volumes: 数量数组
+        :param account_info: 账户信息，需包含 total_assets，可选 position_value（当前持仓市值）
+        :return: (allowed, reasons) 布尔数组和原因代码数组，原因说明见 REASON_MESSAGES
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        volumes = np.asarray(volumes, dtype=np.float64)
+        directions = np.asarray(directions)
+        if directions.dtype.kind in 'OUS':
+            sides = np.where(directions == 'buy', 1.0, -1.0)
+        else:
+            sides = np.sign(directions.astype(np.float64))
+        n = len(prices)
+        
+        total_assets = float(account_info['total_assets'])
+        get_quantity = self.ledger.get_quantity
+        current = np.fromiter((get_quantity(code) for code in stock_codes), dtype=np.float64, count=n)
+        is_buy = sides > 0
+        
+        allowed = np.ones(n, dtype=bool)
+        reasons = np.full(n, REASON_OK, dtype=np.int8)
+        
+        def deny(mask, reason):
+            mask = mask & allowed
+            allowed[mask] = False
+            reasons[mask] = reason
+        
+        deny(~(prices > 0) | ~(volumes > 0) | ((total_assets <= 0) & is_buy), REASON_INVALID_ORDER)
+        if self.drawdown_breached:
+            deny(is_buy, REASON_DRAWDOWN_HALT)
+        
+        if total_assets > 0:
+            # 同一股票的订单按顺序累计仓位
+            group = np.unique(np.asarray(stock_codes, dtype=str), return_inverse=True)[1].ravel()
+            limit_value = self.max_position_size * total_assets
+            delta = np.where(allowed, sides * volumes, 0.0)
+            new_position = current + _group_cumsum(delta, group)
+            if (is_buy & allowed & (new_position * prices > limit_value)).any():
+                # 有订单超限时逐笔重新累计，被拒绝的订单不计入同一股票后续订单的仓位
+                over = np.zeros(n, dtype=bool)
+                held = {}
+                for i in np.flatnonzero(allowed):
+                    position = held.get(group[i], current[i]) + delta[i]
+                    if is_buy[i] and position * prices[i] > limit_value:
+                        over[i] = True
+                    else:
+                        held[group[i]] = position
+                deny(over, REASON_POSITION_LIMIT)
+                delta = np.where(allowed, delta, 0.0)
+                new_position = current + _group_cumsum(delta, group)
+            
+            # 每个订单带来的敞口变化
+            gross_change = (np.abs(new_position) - np.abs(new_position - delta)) * prices
+            net_change = delta * prices
+            position_value = float(account_info.get('position_value', total_assets - account_info.get('cash', 0.0)))
+            
+            for change, limit, reason in ((gross_change, self.max_gross_exposure, REASON_GROSS_EXPOSURE),
+                                          (net_change, self.max_net_exposure, REASON_NET_EXPOSURE)):
+                increase = np.where(allowed & (change > 0), change, 0.0)
+                base = position_value + np.where(allowed & (change < 0), change, 0.0).sum()
+                deny(_cap_cumulative(increase, limit * total_assets - base), reason)
+        
+        # 卖单标记止损（仍然允许）
+        sells = np.flatnonzero(~is_buy & allowed & (current > 0))
+        if len(sells):
+            costs = np.fromiter((self._get_position_cost(stock_codes[i]) for i in sells), dtype=np.float64, count=len(sells))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                stop = (costs > 0) & ((prices[sells] - costs) / costs < -self.stop_loss_pct)
+            reasons[sells[stop]] = REASON_STOP_LOSS
+        
+        return allowed, reasons
+    
     def _check_stop_loss(self, stock_code, current_price):
         """
         检查是否触发止损
@@ -48,91 +170,229 @@ class RiskManager:
         :param current_price: 当前价格
         :return: bool 是否触发止损
         """
-        if stock_code in self.positions:
-            position = self.positions[stock_code]
-            if position > 0:
-                # 获取持仓成本
-                cost = self._get_position_cost(stock_code)
-                if cost > 0:
-                    loss_pct = (current_price - cost) / cost
-                    return loss_pct < -self.stop_loss_pct
+        if self.ledger.get_quantity(stock_code) > 0:
+            # 获取持仓成本
+            cost = self._get_position_cost(stock_code)
+            if cost > 0:
+                loss_pct = (current_price - cost) / cost
+                return loss_pct < -self.stop_loss_pct
         return False
     
     def _get_position_cost(self, stock_code):
         """
         获取持仓成本
         :param stock_code: 股票代码
-        :return: float 持仓成本
+        :return: float 持仓平均成本（FIFO剩余批次，含买入费用），无持仓时为0
         """
-        # 这里应该实现实际的持仓成本计算
-        return 0.0
+        return self.ledger.get_avg_cost(stock_code)
     
     def update_portfolio_value(self, portfolio_value):
         """
-        更新投资组合价值历史
+        更新投资组合价值历史（增量更新风险指标，每次O(1)）
         :param portfolio_value: 当前投资组合价值
         """
-        self.portfolio_value_history.append({
-            'timestamp': datetime.now(),
-            'value': portfolio_value
-        })
+        self.portfolio_value_history.append(portfolio_value)
+        self.risk_state.update(portfolio_value)
         
         # 检查最大回撤
-        self._check_max_drawdown()
+        self.drawdown_breached = self._check_max_drawdown()
     
     def _check_max_drawdown(self):
         """
         检查最大回撤
         :return: bool 是否超过最大回撤限制
         """
-        if len(self.portfolio_value_history) < 2:
+        if self.risk_state.count < 2:
             return False
-        
-        values = [record['value'] for record in self.portfolio_value_history]
-        peak = np.maximum.accumulate(values)
-        drawdown = (peak - values) / peak
-        
-        return np.max(drawdown) > self.max_drawdown
+        return self.risk_state.max_drawdown > self.max_drawdown
     
-    def get_risk_metrics(self):
+    def get_risk_metrics(self, risk_free_rate=0.03):
         """
         获取风险指标
         :return: dict 风险指标
         """
-        if len(self.portfolio_value_history) < 2:
+        state = self.risk_state
+        if state.count < 2:
             return {}
         
-        values = [record['value'] for record in self.portfolio_value_history]
-        returns = np.diff(values) / values[:-1]
-        
+        std = state.return_std()
         metrics = {
-            'volatility': np.std(returns) * np.sqrt(252),  # 年化波动率
-            'max_drawdown': self._calculate_max_drawdown(values),
-            'sharpe_ratio': self._calculate_sharpe_ratio(returns),
-            'var_95': self._calculate_var(returns, 0.95)  # 95% VaR
+            'volatility': std * np.sqrt(252),  # 年化波动率
+            'max_drawdown': state.max_drawdown,
+            'sharpe_ratio': (state.return_mean - risk_free_rate / 252) / std * np.sqrt(252) if std > 0 else 0,
+            'var_95': state.return_quantile(0.05)  # 95% VaR
         }
         
         return metrics
+
+def _group_cumsum(values, group):
+    """
+    按组累计求和（组内保持原顺序）
+    :param values: 数值数组
+    :param group: 组编号数组
+    :return: 与values同形状，每个位置为同组中截至该位置（含）的累计值
+    """
+    order = np.argsort(group, kind='stable')
+    sorted_values = values[order]
+    csum = np.cumsum(sorted_values)
+    sorted_group = group[order]
+    starts = np.flatnonzero(np.r_[True, sorted_group[1:] != sorted_group[:-1]])
+    # 减去每组开始之前的累计值
+    offsets = np.repeat(csum[starts] - sorted_values[starts], np.diff(np.r_[starts, len(values)]))
+    result = np.empty(len(values))
+    result[order] = csum - offsets
+    return result
+
+def _cap_cumulative(increase, room):
+    """
+    按顺序累计 increase，累计后超过 room 的订单被拒绝，被拒绝的订单不计入后续累计
+    :param increase: 每个订单增加的数值（非负）
+    :param room: 可用额度
+    :return: bool数组 被拒绝的订单
+    """
+    total = np.cumsum(increase)
+    over = (increase > 0) & (total > room)
+    if not over.any():
+        return over
+    # 从第一笔超限的订单开始逐笔累计
+    first = int(np.argmax(over))
+    used = total[first] - increase[first]
+    for i in range(first, len(increase)):
+        if increase[i] <= 0:
+            continue
+        if used + increase[i] > room:
+            over[i] = True
+        else:
+            over[i] = False
+            used += increase[i]
+    return over
+
+class ValueHistory:
+    def __init__(self, capacity=100_000):
+        """
+        定长环形缓冲区存储的时间序列（时间戳int64纳秒 + 数值float64），写满后覆盖最早的数据
+        时间戳与 TradeJournal 一致，为本地时间（不带时区）
+        :param capacity: 最多保留的个数
+        """
+        self.capacity = capacity
+        self._timestamps = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty(capacity, dtype=np.float64)
+        self._next = 0   # 下一个写入位置
+        self._size = 0
+    
+    def append(self, value, timestamp=None):
+        """
+        追加一个值（O(1)，不会重新分配内存）
+        :param value: 数值
+        :param timestamp: datetime，None表示当前时间
+        """
+        i = self._next
+        self._timestamps[i] = np.datetime64(timestamp or datetime.now(), 'ns').astype(np.int64)
+        self._values[i] = value
+        self._next = (i + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+    
+    def _ordered(self, array):
+        """
+        按时间顺序排列的数据（未写满时为视图，写满后为拼接的副本）
+        """
+        if self._size < self.capacity:
+            return array[:self._size]
+        return np.concatenate([array[self._next:], array[:self._next]])
     
-    def _calculate_max_drawdown(self, values):
+    @property
+    def values(self):
         """
-        计算最大回撤
+        数值数组（只读，按时间顺序）
+        """
+        view = self._ordered(self._values)
+        view.flags.writeable = False
+        return view
+    
+    @property
+    def timestamps(self):
+        """
+        时间戳数组（datetime64[ns]，按时间顺序）
+        """
+        return self._ordered(self._timestamps).view('datetime64[ns]')
+    
+    def __len__(self):
+        return self._size
+    
+    def to_frame(self):
         """
-        peak = np.maximum.accumulate(values)
-        drawdown = (peak - values) / peak
-        return np.max(drawdown)
+        转换为DataFrame
+        """
+        return pd.DataFrame({'timestamp': self.timestamps, 'value': self._ordered(self._values)})
+
+class StreamingRiskState:
+    def __init__(self, reservoir_size=2048, seed=None):
+        """
+        增量风险指标状态
+        - 回撤：运行峰值和最大回撤
+        - 波动率、夏普比率：Welford算法在线计算收益率均值和方差
+        - VaR：固定大小的蓄水池抽样估计收益率分位数（样本数不超过蓄水池大小时为精确值）
+        :param reservoir_size: 蓄水池大小
+        :param seed: 抽样随机种子
+        """
+        self.count = 0              # 价值点个数
+        self.last_value = None
+        self.peak = None
+        self.max_drawdown = 0.0
+        self.current_drawdown = 0.0
+        self.n_returns = 0
+        self.return_mean = 0.0
+        self._m2 = 0.0
+        self._reservoir = np.empty(reservoir_size, dtype=np.float64)
+        self._rng = np.random.default_rng(seed)
+    
+    def update(self, value):
+        """
+        加入一个新的投资组合价值
+        """
+        self.count += 1
+        if self.peak is None or value > self.peak:
+            self.peak = value
+        if self.peak > 0:
+            self.current_drawdown = (self.peak - value) / self.peak
+            self.max_drawdown = max(self.max_drawdown, self.current_drawdown)
+        
+        if self.last_value:
+            self._add_return((value - self.last_value) / self.last_value)
+        self.last_value = value
+    
+    def _add_return(self, r):
+        """
+        Welford更新 + 蓄水池抽样
+        """
+        self.n_returns += 1
+        delta = r - self.return_mean
+        self.return_mean += delta / self.n_returns
+        self._m2 += delta * (r - self.return_mean)
+        
+        size = len(self._reservoir)
+        if self.n_returns <= size:
+            self._reservoir[self.n_returns - 1] = r
+        else:
+            j = self._rng.integers(0, self.n_returns)
+            if j < size:
+                self._reservoir[j] = r
     
-    def _calculate_sharpe_ratio(self, returns, risk_free_rate=0.03):
+    def return_std(self):
         """
-        计算夏普比率
+        收益率标准差（总体标准差，与np.std一致）
         """
-        excess_returns = returns - risk_free_rate/252
-        if len(excess_returns) == 0:
-            return 0
-        return np.mean(excess_returns) / np.std(excess_returns) * np.sqrt(252)
+        if self.n_returns == 0:
+            return 0.0
+        return float(np.sqrt(self._m2 / self.n_returns))
     
-    def _calculate_var(self, returns, confidence_level):
+    def return_quantile(self, q):
         """
-        计算VaR
+        收益率分位数
+        :param q: 分位点（0~1）
         """
-        return np.percentile(returns, (1 - confidence_level) * 100) 
\ No newline at end of file
+        n = min(self.n_returns, len(self._reservoir))
+        if n == 0:
+            return 0.0
+        return float(np.percentile(self._reservoir[:n], q * 100))
@@ -1,9 +1,22 @@
 import akshare as ak
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import (create_engine, MetaData, Table, Column, String, Float,
+                        Integer, DateTime, PrimaryKeyConstraint)
+from sqlalchemy.dialects import mysql, sqlite, postgresql
 import datetime
 import time
 
+# 行情表的列定义（只声明一次，建表和写入共用）
+TEXT_COLUMNS = {'代码': 10, '名称': 32}
+INTEGER_COLUMNS = ['序号']
+NUMERIC_COLUMNS = ['最新价', '涨跌幅', '涨跌额', '成交量', '成交额', '振幅',
+                   '最高', '最低', '今开', '昨收', '量比', '换手率',
+                   '市盈率-动态', '市净率', '总市值', '流通市值',
+                   '涨速', '5分钟涨跌', '60日涨跌幅', '年初至今涨跌幅']
+KEY_COLUMNS = ['代码', 'fetch_time']
+
+_tables = {}
+
 def get_stock_data():
     """
     获取A股市场所有股票的行情数据
@@ -12,47 +25,105 @@ def get_stock_data():
         # 获取A股所有股票的实时行情数据
         stock_df = ak.stock_zh_a_spot_em()
 
-        stock_data = ak.stock_zh_a_spot_em()
-        # 添加获取时间列
-        stock_df['fetch_time'] = datetime.datetime.now()
+        # 添加获取时间列（同一批数据使用同一个时间，作为去重键的一部分）
+        stock_df['fetch_time'] = datetime.datetime.now().replace(microsecond=0)
         return stock_df
     except Exception as e:
         print(f"获取股票数据时出错: {str(e)}")
         return None
 
-def create_mysql_engine(user, password, host, port, database):
+def create_mysql_engine(user, password, host, port, database, pool_size=5, max_overflow=10):
     """
-    创建MySQL数据库连接
+    创建MySQL数据库连接（带连接池）
     """
     try:
         engine = create_engine(
-            f'mysql+pymysql://{user}:{password}@{host}:{port}/{database}?charset=utf8mb4'
+            f'mysql+pymysql://{user}:{password}@{host}:{port}/{database}?charset=utf8mb4',
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            pool_recycle=3600
         )
         return engine
     except Exception as e:
         print(f"创建数据库连接时出错: {str(e)}")
         return None
 
-def save_to_mysql(df, engine, table_name):
+def create_sqlite_engine(path='stock_market.db'):
+    """
+    创建SQLite数据库连接，用作本地测试时MySQL的替代
+    :param path: 数据库文件路径，':memory:' 表示内存数据库
+    """
+    try:
+        return create_engine(f'sqlite:///{path}')
+    except Exception as e:
+        print(f"创建数据库连接时出错: {str(e)}")
+        return None
+
+def get_table(engine, table_name):
+    """
+    获取行情表定义，表不存在时创建（以 代码 + fetch_time 为主键）
+    """
+    key = (str(engine.url), table_name)
+    if key not in _tables:
+        metadata = MetaData()
+        columns = [Column(name, String(length)) for name, length in TEXT_COLUMNS.items()]
+        columns += [Column(name, Integer) for name in INTEGER_COLUMNS]
+        columns += [Column(name, Float) for name in NUMERIC_COLUMNS]
+        columns.append(Column('fetch_time', DateTime))
+        table = Table(table_name, metadata, *columns, PrimaryKeyConstraint(*KEY_COLUMNS))
+        metadata.create_all(engine, checkfirst=True)
+        _tables[key] = table
+    return _tables[key]
+
+def _upsert_statement(engine, table):
+    """
+    根据数据库类型生成 插入或更新 语句
+    """
+    dialect = engine.dialect.name
+    update_columns = [c.name for c in table.columns if c.name not in KEY_COLUMNS]
+
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in update_columns})
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite.insert(table) if dialect == 'sqlite' else postgresql.insert(table))
+        return stmt.on_conflict_do_update(
+            index_elements=KEY_COLUMNS,
+            set_={name: stmt.excluded[name] for name in update_columns}
+        )
+    raise ValueError(f"不支持的数据库类型: {dialect}")
+
+def _to_records(df, table):
+    """
+    按表结构整理数据并转换为记录列表（空值转为None）
+    """
+    df = df[[c.name for c in table.columns if c.name in df.columns]].copy()
+    for col in NUMERIC_COLUMNS + INTEGER_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['代码'] = df['代码'].astype(str)
+    # 先转为object，否则浮点列中的NaN不会被替换为None
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict('records')
+
+def save_to_mysql(df, engine, table_name, chunksize=2000):
     """
-    将数据保存到MySQL数据库
+    将数据批量写入数据库
+    同一股票同一获取时间的数据重复写入时更新而不是新增
+    :param chunksize: 每批写入的行数（多行插入）
     """
     try:
-        # 处理可能的空值
-        df = df.where(pd.notnull(df), None)
-        # 确保数值类型列的类型正确
-        numeric_columns = ['最新价', '涨跌幅', '涨跌额', '成交量', '成交额', '振幅', 
-                         '最高', '最低', '今开', '昨收', '量比', '换手率', 
-                         '市盈率-动态', '市净率', '总市值', '流通市值', 
-                         '涨速', '5分钟涨跌', '60日涨跌幅', '年初至今涨跌幅']
-        
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+        table = get_table(engine, table_name)
+        records = _to_records(df, table)
+        stmt = _upsert_statement(engine, table)
 
-        # 保存到数据库
-        df.to_sql(table_name, engine, if_exists='append', index=False)
-        print(f"成功保存 {len(df)} 条记录到数据库")
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            for i in range(0, len(records), chunksize):
+                conn.execute(stmt, records[i:i + chunksize])
+        elapsed = time.perf_counter() - start
+        print(f"成功保存 {len(records)} 条记录到数据库，耗时 {elapsed * 1000:.0f} 毫秒")
     except Exception as e:
         print(f"保存数据到MySQL时出错: {str(e)}")
 
@@ -1,6 +1,7 @@
 import akshare as ak
 import pandas as pd
 from datetime import datetime
+from tick_archive import TickArchive
 
 def get_real_time_quotes(stock_codes):
     """
@@ -35,6 +36,17 @@ def save_to_csv(data, filename=None):
     data.to_csv(filename, encoding='utf-8-sig', index=False)
     print(f"数据已保存到: {filename}")
 
+def save_to_archive(data, archive_dir='tick_archive', fetch_time=None):
+    """
+    将行情快照追加到按日期和代码分区的列式归档中
+    :param data: DataFrame 数据
+    :param archive_dir: 归档目录
+    :param fetch_time: 快照时间，None则使用当前时间
+    """
+    archive = TickArchive(archive_dir)
+    rows = archive.append(data, fetch_time=fetch_time)
+    print(f"已归档 {rows} 条行情到: {archive_dir}")
+
 def main():
     # 示例股票代码列表（可以根据需要修改）
     stock_codes = ['600519', '000858', '601318']  # 贵州茅台、五粮液、中国平安
@@ -46,8 +58,8 @@ def main():
         print("\n获取到的数据示例：")
         print(stock_data.head())
         
-        # 保存数据到CSV文件
-        save_to_csv(stock_data)
+        # 追加到列式归档
+        save_to_archive(stock_data)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,180 @@
+import os
+import uuid
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+import pyarrow.compute as pc
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# 归档的行情字段（与 ak.stock_zh_a_spot_em() 列名一致）
+ARCHIVE_NUMERIC_COLUMNS = ['最新价', '涨跌幅', '涨跌额', '成交量', '成交额', '振幅',
+                           '最高', '最低', '今开', '昨收', '量比', '换手率',
+                           '市盈率-动态', '市净率', '总市值', '流通市值',
+                           '涨速', '5分钟涨跌', '60日涨跌幅', '年初至今涨跌幅']
+
+ARCHIVE_SCHEMA = pa.schema(
+    [('代码', pa.dictionary(pa.int32(), pa.string())),
+     ('名称', pa.dictionary(pa.int32(), pa.string())),
+     ('fetch_time', pa.timestamp('s'))]
+    + [(col, pa.float64()) for col in ARCHIVE_NUMERIC_COLUMNS]
+)
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('date', pa.string()), ('bucket', pa.string())]), flavor='hive'
+)
+
+class TickArchive:
+    def __init__(self, root_dir='tick_archive', compression='zstd'):
+        """
+        按日期和股票代码分区的列式行情归档
+        目录结构：root_dir/date=YYYYMMDD/bucket=代码前三位/*.parquet
+        :param root_dir: 归档目录
+        :param compression: parquet压缩算法
+        """
+        self.root_dir = root_dir
+        self.compression = compression
+        os.makedirs(root_dir, exist_ok=True)
+
+    def append(self, snapshot, fetch_time=None):
+        """
+        追加一次全市场行情快照
+        :param snapshot: ak.stock_zh_a_spot_em() 返回的DataFrame
+        :param fetch_time: 快照时间，None时使用快照中的fetch_time列或当前时间
+        :return: int 写入的行数
+        """
+        df = pd.DataFrame({
+            '代码': snapshot['代码'].astype(str).str.zfill(6),
+            '名称': snapshot['名称'].astype(str) if '名称' in snapshot.columns else None
+        })
+        if fetch_time is not None:
+            df['fetch_time'] = pd.Timestamp(fetch_time)
+        elif 'fetch_time' in snapshot.columns:
+            df['fetch_time'] = pd.to_datetime(snapshot['fetch_time']).to_numpy()
+        else:
+            df['fetch_time'] = pd.Timestamp(datetime.now())
+        df['fetch_time'] = df['fetch_time'].dt.floor('s')
+        for col in ARCHIVE_NUMERIC_COLUMNS:
+            if col in snapshot.columns:
+                df[col] = pd.to_numeric(snapshot[col], errors='coerce').to_numpy()
+            else:
+                df[col] = float('nan')
+
+        # 整个快照只转换一次为Arrow表，再按 (日期, 代码前缀) 切片写入各分区
+        fetch_times = df['fetch_time'].dt
+        dates = (fetch_times.year * 10000 + fetch_times.month * 100 + fetch_times.day).to_numpy()
+        buckets = df['代码'].str[:3].to_numpy()
+        order = np.lexsort((df['代码'].to_numpy(), buckets, dates))
+        df = df.iloc[order]
+        dates, buckets = dates[order], buckets[order]
+        table = pa.Table.from_pandas(df, schema=ARCHIVE_SCHEMA, preserve_index=False)
+
+        boundaries = np.flatnonzero((dates[1:] != dates[:-1]) | (buckets[1:] != buckets[:-1])) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(df)]])
+        for start, end in zip(starts, ends):
+            part_dir = os.path.join(self.root_dir, f"date={dates[start]}", f"bucket={buckets[start]}")
+            os.makedirs(part_dir, exist_ok=True)
+            stamp = df['fetch_time'].iloc[start].strftime('%H%M%S')
+            # 同一秒内多次追加（或回放时使用相同的fetch_time）也不会覆盖已有文件
+            path = os.path.join(part_dir, f"part-{stamp}-{os.getpid()}-{uuid.uuid4().hex[:12]}.parquet")
+            pq.write_table(table.slice(start, end - start), path,
+                           compression=self.compression, use_dictionary=['代码', '名称'])
+        return len(df)
+
+    def compact(self, date):
+        """
+        将某一天每个分区内的小文件合并为一个文件
+        :param date: 日期（如：20250430）
+        """
+        date_dir = os.path.join(self.root_dir, f"date={date}")
+        if not os.path.isdir(date_dir):
+            return
+        for bucket_name in os.listdir(date_dir):
+            bucket_dir = os.path.join(date_dir, bucket_name)
+            files = sorted(f for f in os.listdir(bucket_dir) if _is_data_file(f))
+            if len(files) <= 1:
+                continue
+            table = pa.concat_tables(
+                pq.read_table(os.path.join(bucket_dir, f), schema=ARCHIVE_SCHEMA) for f in files
+            ).unify_dictionaries()
+            # 按代码、时间排序，使同一股票的数据集中在相邻的行组里
+            order = pc.sort_indices(
+                pa.table({'code': table['代码'].cast(pa.string()), 'time': table['fetch_time']}),
+                sort_keys=[('code', 'ascending'), ('time', 'ascending')]
+            )
+            table = table.take(order)
+            # 临时文件以'.'开头，读取时会被忽略；合并文件就位之后才删除原文件，
+            # 中途出错最多留下重复数据，不会丢失数据
+            name = f"compacted-{uuid.uuid4().hex[:12]}.parquet"
+            tmp_path = os.path.join(bucket_dir, f".{name}.tmp")
+            pq.write_table(table, tmp_path, compression=self.compression, use_dictionary=['代码', '名称'])
+            os.replace(tmp_path, os.path.join(bucket_dir, name))
+            for f in files:
+                os.remove(os.path.join(bucket_dir, f))
+
+    def read(self, codes=None, start_time=None, end_time=None, columns=None, as_pandas=True, memory_map=True):
+        """
+        读取归档数据，过滤条件下推到分区和parquet行组，只读取需要的文件和列
+        :param codes: 股票代码列表，None表示全部
+        :param start_time: 开始时间（含），str或datetime
+        :param end_time: 结束时间（含），str或datetime
+        :param columns: 需要的列，None表示全部（代码和fetch_time总会返回）
+        :param as_pandas: 为False时返回pyarrow.Table
+        :param memory_map: 是否使用内存映射读取文件
+        :return: DataFrame 或 pyarrow.Table
+        """
+        if not any(name.startswith('date=') for name in os.listdir(self.root_dir)):
+            return pd.DataFrame(columns=ARCHIVE_SCHEMA.names) if as_pandas else ARCHIVE_SCHEMA.empty_table()
+
+        filters = []
+        if codes is not None:
+            codes = [str(c).zfill(6) for c in codes]
+            filters.append(ds.field('bucket').isin(sorted(set(c[:3] for c in codes))))
+            filters.append(ds.field('代码').isin(codes))
+        if start_time is not None:
+            start_time = pd.Timestamp(start_time)
+            filters.append(ds.field('date') >= start_time.strftime('%Y%m%d'))
+            filters.append(ds.field('fetch_time') >= pa.scalar(start_time.to_pydatetime(), pa.timestamp('s')))
+        if end_time is not None:
+            end_time = pd.Timestamp(end_time)
+            if end_time == end_time.normalize():
+                # 只给出日期时包含当天全部数据
+                end_time = end_time + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+            filters.append(ds.field('date') <= end_time.strftime('%Y%m%d'))
+            filters.append(ds.field('fetch_time') <= pa.scalar(end_time.to_pydatetime(), pa.timestamp('s')))
+
+        expression = None
+        for f in filters:
+            expression = f if expression is None else expression & f
+
+        if columns is not None:
+            columns = ['代码', 'fetch_time'] + [c for c in columns if c not in ('代码', 'fetch_time')]
+
+        dataset = _open_dataset(self.root_dir, memory_map)
+        table = dataset.to_table(columns=columns or ARCHIVE_SCHEMA.names, filter=expression)
+        if not as_pandas:
+            return table
+        return table.to_pandas().sort_values(['fetch_time', '代码']).reset_index(drop=True)
+
+def _is_data_file(name):
+    """
+    是否为归档数据文件（排除合并时的临时文件）
+    """
+    return name.endswith('.parquet') and not name.startswith(('.', '_'))
+
+def _open_dataset(root_dir, memory_map):
+    """
+    打开归档数据集（按hive目录结构识别分区，只包含数据文件）
+    """
+    schema = ARCHIVE_SCHEMA.append(pa.field('date', pa.string())).append(pa.field('bucket', pa.string()))
+    filesystem = pafs.LocalFileSystem(use_mmap=memory_map)
+    paths = [
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root_dir)
+        for name in names if _is_data_file(name)
+    ]
+    return ds.dataset(paths, schema=schema, format='parquet', partitioning=PARTITIONING,
+                      partition_base_dir=root_dir, filesystem=filesystem)
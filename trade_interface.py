@@ -1,30 +1,60 @@
 import pandas as pd
-from datetime import datetime
 import logging
+from position_ledger import PositionLedger
+from log_config import setup_logging
+from order_manager import OrderManager, OPEN_STATUSES, ORDER_FILLED, ORDER_REJECTED
+from matching import MatchingSimulator
 
 class TradeInterface:
-    def __init__(self, account_id, api_key=None, api_secret=None):
+    def __init__(self, account_id, api_key=None, api_secret=None, ledger=None, cash=0.0, broker=None,
+                 fee_model=None):
         """
         初始化交易接口
         :param account_id: 账户ID
         :param api_key: API密钥（如果需要）
         :param api_secret: API密钥（如果需要）
+        :param ledger: 持仓台账（PositionLedger），与资金管理器、风险管理器共用同一个实例
+        :param cash: 初始可用资金
+        :param broker: 券商接口适配器（BrokerAdapter），None则使用本地模拟交易所
+        :param fee_model: 费用模型（提供 fee(direction, price, volume)，如 MatchingSimulator），
+                          买单按委托金额加预估费用冻结资金，None则使用默认A股费率
         """
         self.account_id = account_id
         self.api_key = api_key
         self.api_secret = api_secret
-        self.positions = {}  # 当前持仓
-        self.orders = []     # 订单历史
-        self.cash = 0.0      # 可用资金
+        self.ledger = ledger if ledger is not None else PositionLedger()  # 当前持仓
+        self.fee_model = fee_model if fee_model is not None else MatchingSimulator()
+        self.cash = cash     # 资金（含冻结部分）
+        self.frozen_cash = 0.0   # 未成交买单冻结的资金
+        self.frozen_volume = {}  # 未成交卖单冻结的股数 {stock_code: 数量}
+        self._frozen = {}        # order_id -> 该订单剩余冻结的资金（买单）或股数（卖单）
+        self._pending_amends = {}  # order_id -> 等待券商回报的改单追加冻结额度（按发送顺序）
         
-        # 设置日志
-        logging.basicConfig(
-            filename='trading.log',
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        # 订单管理，成交回报通过回调更新资金和持仓
+        self.oms = OrderManager(broker)
+        self.oms.add_fill_listener(self._on_fill)
+        self.oms.add_status_listener(self._on_status)
+        self.oms.add_amend_listener(self._on_amend)
+        
+        # 设置日志（未配置时写入 trading.log；异步写入，不阻塞下单）
+        if not logging.getLogger().handlers:
+            setup_logging('trading.log', console=False)
         self.logger = logging.getLogger(__name__)
     
+    @property
+    def orders(self):
+        """
+        订单历史（按下单顺序）
+        """
+        return self.oms.get_orders()
+    
+    @property
+    def positions(self):
+        """
+        当前持仓 {stock_code: 数量}（来自持仓台账）
+        """
+        return self.ledger.positions_dict()
+    
     def place_order(self, stock_code, direction, price, volume):
         """
         下单函数
@@ -35,53 +65,177 @@ class TradeInterface:
         :return: 订单ID
         """
         try:
-            # 这里应该实现实际的交易接口调用
-            # 目前只是模拟交易
-            order_id = f"ORDER_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            
-            order = {
-                'order_id': order_id,
-                'stock_code': stock_code,
-                'direction': direction,
-                'price': price,
-                'volume': volume,
-                'status': 'submitted',
-                'timestamp': datetime.now()
-            }
+            order = self.oms.create_order(stock_code, direction, price, volume)
             
-            self.orders.append(order)
-            self.logger.info(f"下单成功: {order}")
+            # 检查可用资金和可卖数量（T+1：当日买入的股票不能卖出）
+            if direction == 'buy':
+                if self._buy_amount(price, volume) > self.cash - self.frozen_cash:
+                    self.oms.reject(order, "可用资金不足")
+            elif self.ledger.get_sellable(stock_code) - self.frozen_volume.get(stock_code, 0) < volume:
+                self.oms.reject(order, "可卖数量不足")
             
-            # 模拟订单执行
-            self._execute_order(order)
+            if order['status'] == ORDER_REJECTED:
+                self.logger.info("订单被拒绝: %s %s", order['order_id'], order['reason'],
+                                 extra={'event': 'order_rejected', 'order_id': order['order_id']})
+                return order['order_id']
             
-            return order_id
+            # 冻结资金或股数后发送，不等待成交
+            self._freeze(order, self._buy_amount(price, volume) if direction == 'buy' else volume)
+            self.oms.send(order)
+            self.logger.info("下单成功: %s %s %s %s@%s", order['order_id'], stock_code, direction, volume, price,
+                             extra={'event': 'order_submitted', 'order_id': order['order_id'],
+                                    'stock_code': stock_code, 'direction': direction,
+                                    'price': price, 'volume': volume})
+            return order['order_id']
             
         except Exception as e:
-            self.logger.error(f"下单失败: {e}")
+            self.logger.error("下单失败: %s", e, extra={'event': 'order_error', 'stock_code': stock_code})
             return None
     
-    def _execute_order(self, order):
+    def cancel_order(self, order_id):
+        """
+        撤单（异步，撤单结果在 process_events 中更新）
+        :return: bool 撤单请求是否已发送
+        """
+        return self.oms.cancel(order_id)
+    
+    def amend_order(self, order_id, price=None, volume=None):
+        """
+        改单（异步）
+        :return: bool 改单请求是否已发送
+        """
+        order = self.oms.get_order(order_id)
+        if order is None or order['status'] not in OPEN_STATUSES:
+            return False
+        
+        # 按新的价格和数量重新计算冻结额度
+        remaining = (volume if volume is not None else order['volume']) - order['filled_volume']
+        if order['direction'] == 'buy':
+            required = self._buy_amount(price if price is not None else order['price'], remaining)
+            extra = required - self._frozen.get(order_id, 0.0)
+            if extra > self.cash - self.frozen_cash:
+                return False
+        else:
+            extra = remaining - self._frozen.get(order_id, 0)
+            code = order['stock_code']
+            if extra > self.ledger.get_sellable(code) - self.frozen_volume.get(code, 0):
+                return False
+        # 调高时先冻结追加部分，改单被拒绝后退回；调低的部分在改单成功后解冻
+        extra = max(extra, 0)
+        if extra > 0:
+            self._freeze(order, extra)
+        self._pending_amends.setdefault(order_id, []).append(extra)
+        if not self.oms.amend(order_id, price, volume):
+            self._pending_amends[order_id].pop()
+            self._unfreeze(order, extra)
+            return False
+        return True
+    
+    def process_events(self):
+        """
+        处理券商回报（成交、撤单、拒单），在交易主循环中调用，不会阻塞
+        :return: int 处理的回报数
+        """
+        return self.oms.process_events()
+    
+    def add_fill_listener(self, callback):
+        """
+        注册成交回调 callback(order, fill)
+        """
+        self.oms.add_fill_listener(callback)
+    
+    def _buy_amount(self, price, volume):
+        """
+        买入需要冻结的资金：委托金额 + 预估交易费用
+        """
+        if volume <= 0:
+            return 0.0
+        return price * volume + self.fee_model.fee('buy', price, volume)
+    
+    def _freeze(self, order, amount):
+        order_id = order['order_id']
+        self._frozen[order_id] = self._frozen.get(order_id, 0) + amount
+        if order['direction'] == 'buy':
+            self.frozen_cash += amount
+        else:
+            code = order['stock_code']
+            self.frozen_volume[code] = self.frozen_volume.get(code, 0) + amount
+    
+    def _unfreeze(self, order, amount=None):
+        """
+        解冻订单的资金或股数，amount为None时全部解冻
+        """
+        order_id = order['order_id']
+        if amount is None:
+            self._pending_amends.pop(order_id, None)
+        frozen = self._frozen.get(order_id, 0)
+        amount = frozen if amount is None else min(amount, frozen)
+        if amount <= 0:
+            return
+        if amount >= frozen:
+            del self._frozen[order_id]
+        else:
+            self._frozen[order_id] = frozen - amount
+        if order['direction'] == 'buy':
+            self.frozen_cash -= amount
+        else:
+            code = order['stock_code']
+            self.frozen_volume[code] -= amount
+            if self.frozen_volume[code] <= 0:
+                del self.frozen_volume[code]
+    
+    def _on_fill(self, order, fill):
         """
-        执行订单（模拟）
+        成交回报：更新资金和持仓台账
         """
+        value = fill['price'] * fill['volume']
         if order['direction'] == 'buy':
-            cost = order['price'] * order['volume']
-            if cost <= self.cash:
-                self.cash -= cost
-                if order['stock_code'] not in self.positions:
-                    self.positions[order['stock_code']] = 0
-                self.positions[order['stock_code']] += order['volume']
-                order['status'] = 'filled'
-            else:
-                order['status'] = 'rejected'
-        else:  # sell
-            if order['stock_code'] in self.positions and self.positions[order['stock_code']] >= order['volume']:
-                self.positions[order['stock_code']] -= order['volume']
-                self.cash += order['price'] * order['volume']
-                order['status'] = 'filled'
-            else:
-                order['status'] = 'rejected'
+            # 按委托价和实际费用解冻，全部成交后剩余的冻结资金（预估费用的差额）一并解冻
+            self._unfreeze(order, order['price'] * fill['volume'] + fill['fee'])
+            self.cash -= value + fill['fee']
+        else:
+            self._unfreeze(order, fill['volume'])
+            self.cash += value - fill['fee']
+        if order['status'] == ORDER_FILLED:
+            self._unfreeze(order)
+        self.ledger.apply_fill(order['stock_code'], order['direction'], fill['price'], fill['volume'],
+                               fill['fee'], fill['timestamp'])
+        self.logger.info("成交: %s %s %s %s@%s", order['order_id'], order['stock_code'], order['direction'],
+                         fill['volume'], fill['price'],
+                         extra={'event': 'fill', 'order_id': order['order_id'], 'price': fill['price'],
+                                'volume': fill['volume'], 'fee': fill['fee']})
+    
+    def _on_amend(self, order, accepted):
+        """
+        改单回报：成功时按新的价格和数量解冻多余部分，被拒绝时退回追加冻结的部分
+        """
+        pending = self._pending_amends.get(order['order_id'])
+        extra = pending.pop(0) if pending else 0
+        if not pending:
+            self._pending_amends.pop(order['order_id'], None)
+        if not accepted:
+            self._unfreeze(order, extra)
+            return
+        remaining = order['volume'] - order['filled_volume']
+        required = self._buy_amount(order['price'], remaining) if order['direction'] == 'buy' else remaining
+        surplus = self._frozen.get(order['order_id'], 0) - required
+        if surplus > 0:
+            self._unfreeze(order, surplus)
+    
+    def _on_status(self, order, old_status):
+        """
+        订单撤单或被拒绝时解冻剩余资金或股数（全部成交在成交回报中处理）
+        """
+        if order['status'] not in OPEN_STATUSES and order['status'] != ORDER_FILLED:
+            self._unfreeze(order)
+            self.logger.info("订单%s: %s %s", order['status'], order['order_id'], order['reason'] or '',
+                             extra={'event': 'order_' + order['status'], 'order_id': order['order_id']})
+    
+    def close(self):
+        """
+        关闭券商连接
+        """
+        self.oms.close()
     
     def get_position(self, stock_code=None):
         """
@@ -90,7 +244,7 @@ class TradeInterface:
         :return: 持仓信息
         """
         if stock_code:
-            return self.positions.get(stock_code, 0)
+            return self.ledger.get_quantity(stock_code)
         return self.positions
     
     def get_orders(self, status=None):
@@ -99,28 +253,39 @@ class TradeInterface:
         :param status: 订单状态过滤
         :return: 订单列表
         """
-        if status:
-            return [order for order in self.orders if order['status'] == status]
-        return self.orders
+        return self.oms.get_orders(status)
+    
+    def get_order(self, order_id):
+        """
+        按订单ID查询订单
+        """
+        return self.oms.get_order(order_id)
     
     def get_account_info(self):
         """
         获取账户信息
         :return: 账户信息字典
         """
+        position_value = self.ledger.market_value()
         return {
             'account_id': self.account_id,
             'cash': self.cash,
+            'available_cash': self.cash - self.frozen_cash,
             'positions': self.positions,
-            'total_assets': self.cash + sum(
-                pos * self._get_current_price(code)
-                for code, pos in self.positions.items()
-            )
+            'position_value': position_value,
+            'total_assets': self.cash + position_value
         }
     
+    def update_prices(self, stock_codes, prices):
+        """
+        用实时行情更新持仓台账中的最新价
+        :param stock_codes: 股票代码数组（如 QuoteBatch.codes）
+        :param prices: 价格数组（如 QuoteBatch.price）
+        """
+        self.ledger.mark_many(stock_codes, prices)
+    
     def _get_current_price(self, stock_code):
         """
-        获取当前价格（模拟）
+        获取当前价格（持仓台账中的最新行情价，没有行情时为0）
         """
-        # 这里应该实现实际的行情接口调用
-        return 0.0 
\ No newline at end of file
+        return self.ledger.get_price(stock_code)
\ No newline at end of file
@@ -0,0 +1,264 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+class VectorBacktester:
+    def __init__(self, initial_capital=100000.0, commission=0.0):
+        """
+        向量化多标的、多参数回测引擎
+        所有参数组合在同一组NumPy数组运算中完成，结果数组形状为 (参数组合, 日期, 股票)
+        :param initial_capital: 每个(参数组合, 股票)的初始资金
+        :param commission: 单边交易成本比例（按成交金额计）
+        """
+        self.initial_capital = initial_capital
+        self.commission = commission
+
+    @staticmethod
+    def build_price_matrix(data, field='close'):
+        """
+        将多只股票的数据整理为 日期×股票 的价格矩阵
+        :param data: {stock_code: DataFrame} 或以(date, code)为索引的长表
+        :param field: 使用的价格列
+        :return: DataFrame 行为日期，列为股票代码
+        """
+        if isinstance(data, dict):
+            return pd.DataFrame({code: df[field] for code, df in data.items()}).sort_index()
+        return data[field].unstack('code').sort_index()
+
+    def signals(self, prices, strategy_type, params):
+        """
+        只计算目标仓位信号，不计算资金曲线
+        :return: ndarray (参数组合, 日期, 股票)，取值0或1
+        """
+        make, params = self._signal_maker(strategy_type, params)
+        values, _, _ = self._unpack_prices(prices)
+        return make(values, _ffill(values), params)(params)
+
+    def run(self, prices, strategy_type, params, chunk_size=None):
+        """
+        对给定的参数组合列表进行回测
+        :param prices: 价格矩阵（DataFrame或ndarray，日期×股票）
+        :param strategy_type: 'ma_cross' 或 'macd'
+        :param params: 参数组合列表，ma_cross为[(short, long), ...]，macd为[(fast, slow, signal), ...]
+        :param chunk_size: 每批计算的参数组合数，用于限制内存占用，None表示一次算完
+        :return: dict 回测结果
+        """
+        make, params = self._signal_maker(strategy_type, params)
+        values, index, columns = self._unpack_prices(prices)
+        filled = _ffill(values)
+        return self._run_chunks(params, make(values, filled, params), filled, index, columns, chunk_size)
+
+    def _signal_maker(self, strategy_type, params):
+        """
+        选择信号计算方法并过滤无效参数组合
+        """
+        if strategy_type == 'ma_cross':
+            make = self._ma_cross_signals
+        elif strategy_type == 'macd':
+            make = self._macd_signals
+        else:
+            raise ValueError("不支持的策略类型")
+
+        params = [tuple(int(v) for v in p) for p in params if p[0] < p[1]]
+        if not params:
+            raise ValueError("没有有效的参数组合（短周期必须小于长周期）")
+        return make, params
+
+    def ma_cross_grid(self, prices, short_windows, long_windows, chunk_size=None):
+        """
+        均线交叉策略参数扫描
+        :param prices: 价格矩阵（DataFrame或ndarray，日期×股票）
+        :param short_windows: 短期均线窗口列表
+        :param long_windows: 长期均线窗口列表
+        :param chunk_size: 每批计算的参数组合数
+        :return: dict 回测结果
+        """
+        params = list(itertools.product(short_windows, long_windows))
+        return self.run(prices, 'ma_cross', params, chunk_size)
+
+    def macd_grid(self, prices, fast_periods, slow_periods, signal_periods, chunk_size=None):
+        """
+        MACD策略参数扫描
+        :param prices: 价格矩阵（DataFrame或ndarray，日期×股票）
+        :param fast_periods: 快线周期列表
+        :param slow_periods: 慢线周期列表
+        :param signal_periods: 信号线周期列表
+        :param chunk_size: 每批计算的参数组合数
+        :return: dict 回测结果
+        """
+        params = list(itertools.product(fast_periods, slow_periods, signal_periods))
+        return self.run(prices, 'macd', params, chunk_size)
+
+    def _ma_cross_signals(self, values, filled, params):
+        """
+        预先计算所有窗口的均线，返回按参数批次生成信号的函数
+        """
+        windows = sorted(set(w for p in params for w in p))
+        window_pos = {w: i for i, w in enumerate(windows)}
+        ma = self._rolling_means(values, windows)  # (W, T, S)
+
+        def make_signal(chunk):
+            short_idx = [window_pos[s] for s, _ in chunk]
+            long_idx = [window_pos[l] for _, l in chunk]
+            # NaN比较结果为False，与 Strategy.ma_cross_strategy 一致
+            return (ma[short_idx] > ma[long_idx]).astype(np.float64)
+
+        return make_signal
+
+    def _macd_signals(self, values, filled, params):
+        """
+        预先计算所有周期的EMA，返回按参数批次生成信号的函数
+        """
+        spans = sorted(set(p for f, s, _ in params for p in (f, s)))
+        span_pos = {span: i for i, span in enumerate(spans)}
+        ema = _ewm(filled, np.asarray(spans, dtype=np.float64))  # (K, T, S)
+
+        def make_signal(chunk):
+            fast_idx = [span_pos[f] for f, _, _ in chunk]
+            slow_idx = [span_pos[s] for _, s, _ in chunk]
+            macd = ema[fast_idx] - ema[slow_idx]  # (P, T, S)
+            signal_line = _ewm_stack(macd, np.asarray([g for _, _, g in chunk], dtype=np.float64))
+            return (macd > signal_line).astype(np.float64)
+
+        return make_signal
+
+    def _run_chunks(self, params, make_signal, filled, index, columns, chunk_size):
+        """
+        分批计算信号并汇总持仓、现金和总资产
+        """
+        chunk_size = chunk_size or len(params)
+        parts = []
+        for start in range(0, len(params), chunk_size):
+            chunk = params[start:start + chunk_size]
+            parts.append(self._simulate(make_signal(chunk), filled))
+
+        result = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+        result['params'] = params
+        result['index'] = index
+        result['columns'] = columns
+        return result
+
+    def _simulate(self, signal, prices):
+        """
+        根据信号数组计算持仓、现金和总资产
+        信号在当日收盘时生效：满仓买入或全部卖出，次日起享受价格变动
+        :param signal: (P, T, S) 目标仓位（0或1）
+        :param prices: (T, S) 前向填充后的价格
+        :return: dict
+        """
+        returns = np.zeros_like(prices)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns[1:] = prices[1:] / prices[:-1] - 1
+        returns = np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+        held = np.zeros_like(signal)
+        held[:, 1:] = signal[:, :-1]
+
+        trades = np.abs(np.diff(signal, axis=1, prepend=0.0))
+        growth = (1 + held * returns) * (1 - self.commission * trades)
+        equity = self.initial_capital * np.cumprod(growth, axis=1)
+
+        safe_prices = np.nan_to_num(prices, nan=0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            positions = np.where(safe_prices > 0, signal * equity / safe_prices, 0.0)
+        cash = equity - positions * safe_prices
+
+        return {
+            'signal': signal,
+            'positions': positions,
+            'cash': cash,
+            'total': equity
+        }
+
+    def _rolling_means(self, values, windows):
+        """
+        用累加和一次计算多个窗口的移动平均（窗口内有缺失值时为NaN，与pandas rolling一致）
+        :return: (W, T, S)
+        """
+        valid = ~np.isnan(values)
+        csum = np.concatenate([np.zeros((1, values.shape[1])), np.cumsum(np.where(valid, values, 0.0), axis=0)])
+        ccount = np.concatenate([np.zeros((1, values.shape[1])), np.cumsum(valid, axis=0)])
+
+        out = np.full((len(windows),) + values.shape, np.nan)
+        for i, w in enumerate(windows):
+            if w > values.shape[0]:
+                continue
+            window_sum = csum[w:] - csum[:-w]
+            window_count = ccount[w:] - ccount[:-w]
+            out[i, w - 1:] = np.where(window_count == w, window_sum / w, np.nan)
+        return out
+
+    def _unpack_prices(self, prices):
+        """
+        统一价格矩阵输入格式
+        """
+        if isinstance(prices, pd.DataFrame):
+            return prices.to_numpy(dtype=np.float64), prices.index, list(prices.columns)
+        values = np.asarray(prices, dtype=np.float64)
+        if values.ndim == 1:
+            values = values[:, None]
+        return values, None, list(range(values.shape[1]))
+
+    @staticmethod
+    def summarize(result, periods_per_year=252):
+        """
+        计算每个(参数组合, 股票)的年化收益率、最大回撤和夏普比率
+        :param result: ma_cross_grid 或 macd_grid 的返回值
+        :return: DataFrame 每行对应一个(参数组合, 股票)
+        """
+        total = result['total']
+        returns = total[:, 1:] / total[:, :-1] - 1
+        mean = returns.mean(axis=1)
+        std = returns.std(axis=1, ddof=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.where(std > 0, mean / std * np.sqrt(periods_per_year), np.nan)
+        drawdown = (total / np.maximum.accumulate(total, axis=1) - 1).min(axis=1)
+
+        n_params, n_symbols = mean.shape
+        return pd.DataFrame({
+            'params': [result['params'][i] for i in range(n_params) for _ in range(n_symbols)],
+            'stock_code': list(result['columns']) * n_params,
+            'annual_return': (mean * periods_per_year).ravel(),
+            'max_drawdown': drawdown.ravel(),
+            'sharpe_ratio': sharpe.ravel(),
+            'total_return': (total[:, -1] / total[:, 0] - 1).ravel()
+        })
+
+def _ffill(values):
+    """
+    沿时间轴前向填充缺失值（开头的缺失值保持NaN）
+    """
+    mask = np.isnan(values)
+    idx = np.where(~mask, np.arange(values.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = values[idx, np.arange(values.shape[1])]
+    filled[np.cumsum(~mask, axis=0) == 0] = np.nan
+    return filled
+
+def _ewm(values, spans):
+    """
+    多个周期的指数移动平均（等价于 pandas ewm(span, adjust=False)）
+    :param values: (T, S)
+    :param spans: (K,)
+    :return: (K, T, S)
+    """
+    stacked = np.broadcast_to(values, (len(spans),) + values.shape)
+    return _ewm_stack(stacked, spans)
+
+def _ewm_stack(values, spans):
+    """
+    对每个组合使用各自的周期计算指数移动平均
+    :param values: (P, T, S)
+    :param spans: (P,)
+    :return: (P, T, S)
+    """
+    alpha = (2.0 / (spans + 1.0))[:, None]
+    out = np.empty(values.shape, dtype=np.float64)
+    prev = values[:, 0].astype(np.float64)
+    out[:, 0] = prev
+    for t in range(1, values.shape[1]):
+        x = values[:, t]
+        # 从第一个有效值开始递推
+        prev = np.where(np.isnan(prev), x, alpha * x + (1 - alpha) * prev)
+        out[:, t] = prev
+    return out